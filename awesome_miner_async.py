@@ -0,0 +1,145 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from awesome_miner_structs import DeviceType
+from awesome_miner_client import get_default_client, DEFAULT_POOL_SIZE
+
+"""
+asyncio counterpart of awesome_miner_utils
+
+Coroutines of AsyncAwesomeMinerClient run blocking AwesomeMinerClient calls on a dedicated
+thread pool, so that any number of them can be awaited concurrently on a single event loop
+while sharing the client's connection pool and snapshot cache.
+Module-level functions provide a synchronous facade for the CLI scripts.
+"""
+
+logger = logging.getLogger(__name__)
+
+class AsyncAwesomeMinerClient(object):
+
+	""" asyncio wrapper around AwesomeMinerClient """
+
+	def __init__(self, client, max_workers=DEFAULT_POOL_SIZE):
+		self.client = client
+		self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+	def close(self):
+		self._executor.shutdown(wait=False)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc, traceback):
+		self.close()
+
+	async def _call(self, func, *args):
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+	async def get_fleet_snapshot(self):
+		return await self._call(self.client.get_fleet_snapshot)
+
+	async def collect_devices_of_type(self, device_type=DeviceType.ALL):
+		return await self._call(self.client.collect_devices_of_type, device_type)
+
+	async def collect_devices_from_groups(self, groups):
+		return await self._call(self.client.collect_devices_from_groups, groups)
+
+	async def partition_devices(self):
+		return await self._call(self.client.partition_devices)
+
+	async def get_device_by_ip(self, ip_addr):
+		return await self._call(self.client.get_device_by_ip, ip_addr)
+
+	async def get_device_by_name(self, device_name):
+		return await self._call(self.client.get_device_by_name, device_name)
+
+	async def collect_notifications_data(self):
+		return await self._call(self.client.collect_notifications_data)
+
+	async def collect_new_notifications(self, cursor):
+		return await self._call(self.client.collect_new_notifications, cursor)
+
+	async def switch_pool(self, miner_id, pool_id):
+		return await self._call(self.client.switch_pool, miner_id, pool_id)
+
+	async def switch_pools(self, miner_ids, pool_id):
+		""" Switches all given miners to the pool concurrently
+
+		Returns:
+			a dictionary mapping miner identifiers to True if the switch succeeded, otherwise, False
+
+		"""
+		results = await asyncio.gather(*[self.switch_pool(miner_id, pool_id) for miner_id in miner_ids])
+		return dict(zip(miner_ids, results))
+
+
+def get_async_client(pc_name, awesome_miner_port):
+	""" Returns AsyncAwesomeMinerClient wrapping the shared client of the given AwesomeMiner instance """
+	return AsyncAwesomeMinerClient(get_default_client(pc_name, awesome_miner_port))
+
+def collect_groups_and_notifications(pc_name, awesome_miner_port, groups, cursor=None):
+	""" Collects miners of the given groups and pending notifications concurrently
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		groups: list of AwesomeMiner groups from which devices are to be collected
+		cursor: optional NotificationCursor, if given, only notifications it hasn't seen yet are collected
+
+	Returns:
+		a tuple of a list of Miner subclasses (see collect_devices_from_groups)
+		and a NotificationList object (or None, see collect_notifications_data)
+
+	"""
+	async def collect():
+		async with get_async_client(pc_name, awesome_miner_port) as client:
+			if cursor is None:
+				notifications = client.collect_notifications_data()
+			else:
+				notifications = client.collect_new_notifications(cursor)
+			return await asyncio.gather(client.collect_devices_from_groups(groups), notifications)
+	miners, notification_list = asyncio.run(collect())
+	return miners, notification_list
+
+def collect_snapshot_and_notifications(pc_name, awesome_miner_port, cursor=None):
+	""" Collects fleet snapshot and pending notifications concurrently
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		cursor: optional NotificationCursor, if given, only notifications it hasn't seen yet are collected
+
+	Returns:
+		a tuple of a FleetSnapshot object (or None, see get_fleet_snapshot)
+		and a NotificationList object (or None, see collect_notifications_data)
+
+	"""
+	async def collect():
+		async with get_async_client(pc_name, awesome_miner_port) as client:
+			if cursor is None:
+				notifications = client.collect_notifications_data()
+			else:
+				notifications = client.collect_new_notifications(cursor)
+			return await asyncio.gather(client.get_fleet_snapshot(), notifications)
+	snapshot, notification_list = asyncio.run(collect())
+	return snapshot, notification_list
+
+def switch_pools(pc_name, awesome_miner_port, miner_ids, pool_id):
+	""" Switches all given miners to the pool concurrently
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		miner_ids: AwesomeMiner identifiers of the miners to be switched
+		pool_id: AwesomeMiner identifier of the pool
+
+	Returns:
+		a dictionary mapping miner identifiers to True if the switch succeeded, otherwise, False
+
+	"""
+	async def switch():
+		async with get_async_client(pc_name, awesome_miner_port) as client:
+			return await client.switch_pools(miner_ids, pool_id)
+	return asyncio.run(switch())
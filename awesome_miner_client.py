@@ -0,0 +1,301 @@
+import json
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from awesome_miner_structs import NotificationList, DeviceType, get_device_type, DEFAULT_MINER_REGISTRY
+from awesome_miner_snapshot import SnapshotCache, DEFAULT_SNAPSHOT_TTL
+from awesome_miner_stream import iter_miner_json, JSONStreamError
+from instrumentation import instrumented, instrumented_generator, record, is_enabled
+
+"""
+HTTP client for AwesomeMiner Web API that owns a pooled keep-alive session
+"""
+
+logger = logging.getLogger(__name__)
+
+"""
+in seconds
+"""
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30.0
+"""
+Number of times a failed GET request is retried, waiting backoff_factor * 2^(attempt - 1) seconds in between
+"""
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+"""
+Maximum number of keep-alive connections kept open to AwesomeMiner
+"""
+DEFAULT_POOL_SIZE = 10
+"""
+Size of chunks, in bytes, in which streamed /api/miners responses are read
+"""
+STREAM_CHUNK_SIZE = 64 * 1024
+"""
+AwesomeMiner Web API action switching miner to another pool, actions are sent as POST requests
+"""
+SWITCH_POOL_PATH = "/api/miners/{miner_id}?action=switchpool&poolid={pool_id}"
+
+class AwesomeMinerClient(object):
+
+	""" Client of a single AwesomeMiner instance
+
+	Reuses connections through a pooled requests.Session, applies connect and read timeouts
+	to every request and retries failed GET requests with exponential backoff. Actions, such as
+	switching pools, are not idempotent and go through a separate session that never retries them,
+	callers verify their effect and retry on their own. Each client keeps its own fleet snapshot cache.
+	"""
+
+	def __init__(self, pc_name, awesome_miner_port, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+			retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR, pool_size=DEFAULT_POOL_SIZE, snapshot_ttl=DEFAULT_SNAPSHOT_TTL):
+		self.pc_name = pc_name
+		self.port = awesome_miner_port
+		self.base_url = "http://" + str(pc_name) + ":" + str(awesome_miner_port)
+		self.miners_url = self.base_url + "/api/miners"
+		self.notifications_url = self.base_url + "/api/notifications"
+		self.timeout = (connect_timeout, read_timeout)
+		self.snapshot_cache = SnapshotCache(snapshot_ttl)
+		# latency of the most recent request, in seconds
+		self.last_latency = None
+		retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(["GET"]),
+			raise_on_status=False)
+		self.session = requests.Session()
+		self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+		self.action_session = requests.Session()
+		self.action_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=Retry(total=0, raise_on_status=False)))
+
+	def close(self):
+		self.session.close()
+		self.action_session.close()
+
+	def get(self, url, **kwargs):
+		""" Issues GET request through the pooled session
+
+		Returns:
+			a requests.Response object if server responded, otherwise, None
+
+		"""
+		return self._request("GET", url, **kwargs)
+
+	def post(self, url, **kwargs):
+		""" Issues POST request, which is never retried, through the action session
+
+		Returns:
+			a requests.Response object if server responded, otherwise, None
+
+		"""
+		return self._request("POST", url, session=self.action_session, **kwargs)
+
+	def _request(self, method, url, session=None, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		start = time.perf_counter()
+		try:
+			response = (session if session is not None else self.session).request(method, url, **kwargs)
+		except requests.exceptions.RequestException as e:
+			logger.error("%s %s failed after %.3f s: %s", method, url, time.perf_counter() - start, e)
+			return None
+		self.last_latency = time.perf_counter() - start
+		logger.info("%s %s -> %d in %.3f s", method, url, response.status_code, self.last_latency)
+		if is_enabled():
+			# elapsed is measured until response headers are parsed
+			ttfb = response.elapsed.total_seconds()
+			record("ttfb_seconds", ttfb)
+			if not kwargs.get('stream'):
+				record("download_seconds", max(0.0, self.last_latency - ttfb))
+				record("response_bytes", len(response.content))
+		return response
+
+	@instrumented("get_fleet_snapshot")
+	def get_fleet_snapshot(self):
+		""" Returns snapshot of all miners, re-fetched only when the cached one is older than snapshot_cache.ttl """
+		snapshot = self.snapshot_cache.get(self.miners_url, self.get)
+		if snapshot is None:
+			logger.error("Failed to connect to Awesome Miner at %s!", self.miners_url)
+		return snapshot
+
+	def invalidate_snapshot(self):
+		self.snapshot_cache.invalidate()
+
+	@instrumented("collect_devices_of_type")
+	def collect_devices_of_type(self, device_type=DeviceType.ALL):
+		miners = list()
+		snapshot = self.get_fleet_snapshot()
+		if snapshot is not None:
+			miner_class = DEFAULT_MINER_REGISTRY.get_type_class(device_type)
+			if miner_class:
+				miner_jsons = snapshot.index.get_type(device_type)
+				start = time.perf_counter()
+				for miner_json in miner_jsons:
+					miners.append(miner_class(miner_json))
+				record("construction_seconds", time.perf_counter() - start)
+				record("items", len(miners))
+		return miners
+
+	@instrumented("collect_devices_from_groups")
+	def collect_devices_from_groups(self, groups):
+		miners = list()
+		snapshot = self.get_fleet_snapshot()
+		if snapshot is not None:
+			miner_groups = snapshot.index.by_group
+			start = time.perf_counter()
+			for group, group_miners in miner_groups.items():
+				if group in groups:
+					for miner_json in group_miners:
+						miners.append(DEFAULT_MINER_REGISTRY.create_miner(group, miner_json))
+			record("construction_seconds", time.perf_counter() - start)
+			record("items", len(miners))
+		return miners
+
+	@instrumented("partition_devices")
+	def partition_devices(self):
+		""" Returns MinerPartition of all miners, see FleetSnapshot.get_partition, or None if AwesomeMiner is not reachable """
+		snapshot = self.get_fleet_snapshot()
+		if snapshot is None:
+			return None
+		return snapshot.get_partition()
+
+	@instrumented_generator("iter_devices_of_type")
+	def iter_devices_of_type(self, device_type=DeviceType.ALL):
+		miner_class = DEFAULT_MINER_REGISTRY.get_type_class(device_type)
+		if miner_class is None:
+			return
+		for group, miner_json in self._stream_miner_json():
+			if device_type == DeviceType.ALL or get_device_type(miner_json) == device_type:
+				yield miner_class(miner_json)
+
+	@instrumented_generator("iter_devices_from_groups")
+	def iter_devices_from_groups(self, groups):
+		for group, miner_json in self._stream_miner_json(groups):
+			yield DEFAULT_MINER_REGISTRY.create_miner(group, miner_json)
+
+	@instrumented_generator("stream_miner_json")
+	def _stream_miner_json(self, groups=None):
+		response = self.get(self.miners_url, stream=True)
+		if response is None or response.status_code != 200:
+			logger.error("Failed to connect to Awesome Miner at %s!", self.miners_url)
+			if response is not None:
+				# unread streamed body would keep the pooled connection checked out
+				response.close()
+			return
+		try:
+			chunks = response.iter_content(STREAM_CHUNK_SIZE)
+			if is_enabled():
+				chunks = _iter_measured_chunks(chunks)
+			for group, miner_json in iter_miner_json(chunks, groups):
+				yield group, miner_json
+		except JSONStreamError as e:
+			logger.error("Failed to parse response of Awesome Miner at %s: %s", self.miners_url, e)
+		except requests.exceptions.RequestException as e:
+			logger.error("Failed to read response of Awesome Miner at %s: %s", self.miners_url, e)
+		finally:
+			response.close()
+
+	@instrumented("get_device_by_ip")
+	def get_device_by_ip(self, ip_addr):
+		snapshot = self.get_fleet_snapshot()
+		if snapshot is None:
+			return None
+		miner = snapshot.index.get_by_host(ip_addr)
+		if miner is None:
+			logger.warning("Failed to find miner with IP address %s", ip_addr)
+		return miner
+
+	@instrumented("get_device_by_name")
+	def get_device_by_name(self, device_name):
+		snapshot = self.get_fleet_snapshot()
+		if snapshot is None:
+			return None
+		miner = snapshot.index.get_by_name(device_name)
+		if miner is None:
+			logger.warning("Failed to find miner with name %s", device_name)
+		return miner
+
+	@instrumented("collect_notifications_data")
+	def collect_notifications_data(self):
+		notification_list_json = self._get_notification_list_json()
+		if notification_list_json is None:
+			return None
+		return _create_notification_list(notification_list_json)
+
+	@instrumented("collect_new_notifications")
+	def collect_new_notifications(self, cursor):
+		""" Collects only notifications that the given NotificationCursor hasn't seen yet and saves the cursor """
+		notification_list_json = self._get_notification_list_json()
+		if notification_list_json is None:
+			return None
+		new_notifications = cursor.filter_new(notification_list_json)
+		cursor.save()
+		return _create_notification_list(new_notifications)
+
+	def _get_notification_list_json(self):
+		response = self.get(self.notifications_url)
+		if response is not None and response.status_code == 200:
+			start = time.perf_counter()
+			notification_list_json = json.loads(response.content)['notificationList']
+			record("json_loads_seconds", time.perf_counter() - start)
+			return notification_list_json
+		logger.error("Failed to retrieve information about notifications from AwesomeMiner")
+		return None
+
+	@instrumented("switch_pool")
+	def switch_pool(self, miner_id, pool_id):
+		""" Switches miner to the given pool
+
+		Args:
+			miner_id: AwesomeMiner identifier of the miner, see Miner.id
+			pool_id: AwesomeMiner identifier of the pool
+
+		Returns:
+			True if AwesomeMiner accepted the command, otherwise, False; the command is sent once,
+			so False after a timeout doesn't mean the miner didn't switch
+
+		"""
+		request_url = self.base_url + SWITCH_POOL_PATH.format(miner_id=miner_id, pool_id=pool_id)
+		response = self.post(request_url)
+		if response is not None and response.status_code == 200:
+			return True
+		logger.error("Failed to switch miner %s to pool %s", str(miner_id), str(pool_id))
+		return False
+
+
+_default_clients = dict()
+_default_clients_lock = threading.Lock()
+
+def get_default_client(pc_name, awesome_miner_port):
+	""" Returns AwesomeMinerClient shared by all callers targeting the given AwesomeMiner instance """
+	key = (str(pc_name), str(awesome_miner_port))
+	with _default_clients_lock:
+		client = _default_clients.get(key)
+		if client is None:
+			client = AwesomeMinerClient(pc_name, awesome_miner_port)
+			_default_clients[key] = client
+		return client
+
+def _create_notification_list(notification_list_json):
+	start = time.perf_counter()
+	notification_list = NotificationList(notification_list_json)
+	record("construction_seconds", time.perf_counter() - start)
+	record("items", len(notification_list.notifications))
+	return notification_list
+
+def _iter_measured_chunks(chunks):
+	""" Yields chunks of streamed response body, recording time spent reading them and their size """
+	download_time = 0.0
+	size = 0
+	try:
+		while True:
+			start = time.perf_counter()
+			try:
+				chunk = next(chunks)
+			except StopIteration:
+				return
+			finally:
+				download_time += time.perf_counter() - start
+			size += len(chunk)
+			yield chunk
+	finally:
+		record("download_seconds", download_time)
+		record("response_bytes", size)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from awesome_miner_structs import FleetIndex, DeviceType, DEFAULT_MINER_REGISTRY
+from instrumentation import record
+
+"""
+Caching layer for AwesomeMiner /api/miners responses.
+
+The /api/miners payload describes the whole fleet and can be several megabytes large,
+so it is fetched and parsed at most once per TTL window and shared by all lookups.
+"""
+
+logger = logging.getLogger(__name__)
+
+"""
+Default time, in seconds, during which a fetched snapshot is served without contacting AwesomeMiner
+"""
+DEFAULT_SNAPSHOT_TTL = 5.0
+
+class FleetSnapshot(object):
+
+	""" Parsed /api/miners response together with the validators needed to re-fetch it conditionally """
+
+	def __init__(self, miner_groups, etag=None, last_modified=None, body_hash=None):
+		self.miner_groups = miner_groups
+		self.etag = etag
+		self.last_modified = last_modified
+		self.body_hash = body_hash
+		self.fetched_at = time.monotonic()
+		self._index = None
+		self._metrics = dict()
+		self._partitions = dict()
+
+	@property
+	def index(self):
+		""" FleetIndex over this snapshot, built on first access """
+		if self._index is None:
+			start = time.perf_counter()
+			self._index = FleetIndex(self.miner_groups)
+			record("construction_seconds", time.perf_counter() - start)
+		return self._index
+
+	def get_metrics(self, groups=None):
+		""" Returns FleetMetrics of miners of the given groups, or of all groups if none are given, built once per snapshot """
+		key = tuple(groups) if groups is not None else None
+		metrics = self._metrics.get(key)
+		if metrics is None:
+			# NumPy is only loaded by tools that need columnar metrics
+			from fleet_metrics import FleetMetrics
+			metrics = FleetMetrics((group, miner_json) for group, group_miners in self.index.by_group.items()
+				if groups is None or group in groups for miner_json in group_miners)
+			self._metrics[key] = metrics
+		return metrics
+
+	def get_partition(self, registry=DEFAULT_MINER_REGISTRY):
+		""" Returns MinerPartition of all miners modelled by the registry, built once per snapshot and registry """
+		partition = self._partitions.get(registry)
+		if partition is None:
+			start = time.perf_counter()
+			partition = registry.partition(self.miner_groups)
+			record("construction_seconds", time.perf_counter() - start)
+			record("items", len(partition.by_type[DeviceType.ALL]))
+			self._partitions[registry] = partition
+		return partition
+
+	def is_fresh(self, ttl):
+		return (time.monotonic() - self.fetched_at) < ttl
+
+	def touch(self):
+		self.fetched_at = time.monotonic()
+
+	def iter_miner_json(self):
+		for miner_group in self.miner_groups:
+			for miner_json in miner_group['minerList']:
+				yield miner_json
+
+
+class SnapshotCache(object):
+
+	""" TTL-bounded cache of FleetSnapshot objects keyed by request URL
+
+	Once a snapshot expires, it is re-validated rather than blindly re-downloaded:
+	ETag/Last-Modified are sent back to the server when it offered them and, if the server
+	still returns a full body, its hash is compared with the cached one so that an unchanged
+	fleet is never parsed twice.
+	"""
+
+	def __init__(self, ttl=DEFAULT_SNAPSHOT_TTL):
+		self.ttl = ttl
+		self._snapshots = dict()
+		# held across the HTTP request so that concurrent lookups share a single fetch
+		self._lock = threading.Lock()
+
+	def get(self, request_url, http_get):
+		""" Returns snapshot of the fleet, fetching it only if cached one is missing or expired
+
+		Args:
+			request_url: URL of AwesomeMiner /api/miners endpoint
+			http_get: callable with requests.get signature used to issue the request,
+				may return None if the request failed
+
+		Returns:
+			a FleetSnapshot instance if executed successfully, otherwise, None
+
+		"""
+		with self._lock:
+			snapshot = self._snapshots.get(request_url)
+			if snapshot is not None and snapshot.is_fresh(self.ttl):
+				return snapshot
+			headers = dict()
+			if snapshot is not None:
+				if snapshot.etag:
+					headers['If-None-Match'] = snapshot.etag
+				if snapshot.last_modified:
+					headers['If-Modified-Since'] = snapshot.last_modified
+			response = http_get(request_url, headers=headers)
+			if response is None:
+				return None
+			if response.status_code == 304 and snapshot is not None:
+				logger.debug("Snapshot at %s is not modified", request_url)
+				snapshot.touch()
+				return snapshot
+			if response.status_code != 200:
+				return None
+			body = response.content
+			body_hash = hashlib.sha1(body).hexdigest()
+			etag = response.headers.get('ETag')
+			last_modified = response.headers.get('Last-Modified')
+			if snapshot is not None and snapshot.body_hash == body_hash:
+				logger.debug("Snapshot at %s has unchanged body, skipping parsing", request_url)
+				snapshot.etag = etag
+				snapshot.last_modified = last_modified
+				snapshot.touch()
+				return snapshot
+			start = time.perf_counter()
+			miner_groups = json.loads(body)['groupList']
+			record("json_loads_seconds", time.perf_counter() - start)
+			snapshot = FleetSnapshot(miner_groups, etag, last_modified, body_hash)
+			self._snapshots[request_url] = snapshot
+			return snapshot
+
+	def invalidate(self, request_url=None):
+		""" Drops cached snapshot for the given URL or, if no URL is given, all cached snapshots """
+		with self._lock:
+			if request_url is None:
+				self._snapshots.clear()
+			else:
+				self._snapshots.pop(request_url, None)
@@ -0,0 +1,224 @@
+import codecs
+import json
+import re
+
+"""
+Incremental parser for AwesomeMiner /api/miners responses.
+
+Reads the response body chunk by chunk and decodes one miner object at a time,
+so that memory usage doesn't depend on the fleet size and the first miners are available
+before the whole body is downloaded. Values that are not needed, such as miner lists of
+groups that were not asked for, are skipped by a lightweight scanner without being decoded.
+"""
+
+STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+STRUCTURAL_RE = re.compile(r'["{}\[\]]')
+SCALAR_END_RE = re.compile(r'[\s,}\]]')
+WHITESPACE_RE = re.compile(r'\s*')
+
+"""
+Consumed part of the buffer is dropped once it grows beyond this number of characters
+"""
+COMPACT_THRESHOLD = 64 * 1024
+
+class JSONStreamError(ValueError):
+
+	""" Raised when the streamed document is truncated or malformed """
+
+	pass
+
+
+class JSONStreamReader(object):
+
+	""" Pull-based reader over a stream of UTF-8 encoded JSON chunks """
+
+	def __init__(self, chunks):
+		self._chunks = iter(chunks)
+		self._decoder = codecs.getincrementaldecoder('utf-8')()
+		self._eof = False
+		self.buf = ''
+		self.pos = 0
+
+	def _fill(self):
+		""" Appends next chunk to the buffer. Returns False if stream is exhausted """
+		while not self._eof:
+			try:
+				chunk = next(self._chunks)
+			except StopIteration:
+				self._eof = True
+				text = self._decoder.decode(b'', final=True)
+			else:
+				text = self._decoder.decode(chunk)
+			if text:
+				self.buf += text
+				return True
+		return False
+
+	def _compact(self):
+		if self.pos > COMPACT_THRESHOLD:
+			self.buf = self.buf[self.pos:]
+			self.pos = 0
+
+	def peek(self):
+		""" Skips whitespace and returns next character without consuming it, or None at the end of stream """
+		while True:
+			self.pos = WHITESPACE_RE.match(self.buf, self.pos).end()
+			if self.pos < len(self.buf):
+				return self.buf[self.pos]
+			if not self._fill():
+				return None
+
+	def expect(self, char):
+		if self.peek() != char:
+			raise JSONStreamError("Expected '%s' at offset %d" % (char, self.pos))
+		self.pos += 1
+
+	def iter_object(self):
+		""" Iterates over keys of the next JSON object
+
+		The caller must consume the value of each key (with read_value, skip_value or
+		nested iteration) before advancing to the next key.
+		"""
+		self.expect('{')
+		if self.peek() == '}':
+			self.pos += 1
+			return
+		while True:
+			key = json.loads(self._scan_string(True))
+			self.expect(':')
+			yield key
+			char = self.peek()
+			self.pos += 1
+			if char == '}':
+				return
+			if char != ',':
+				raise JSONStreamError("Expected ',' or '}' at offset %d" % (self.pos - 1))
+			self._compact()
+
+	def iter_array(self):
+		""" Iterates over elements of the next JSON array, the caller must consume each element """
+		self.expect('[')
+		if self.peek() == ']':
+			self.pos += 1
+			return
+		while True:
+			yield
+			char = self.peek()
+			self.pos += 1
+			if char == ']':
+				return
+			if char != ',':
+				raise JSONStreamError("Expected ',' or ']' at offset %d" % (self.pos - 1))
+			self._compact()
+
+	def read_value(self):
+		""" Consumes next JSON value and returns its raw text """
+		return self._scan_value(True)
+
+	def skip_value(self):
+		""" Consumes next JSON value without keeping or decoding it """
+		self._scan_value(False)
+
+	def _scan_value(self, keep):
+		char = self.peek()
+		if char is None:
+			raise JSONStreamError("Unexpected end of stream")
+		if char == '"':
+			return self._scan_string(keep)
+		if char not in '{[':
+			return self._scan_scalar()
+		start = self.pos
+		index = self.pos
+		depth = 0
+		while True:
+			match = STRUCTURAL_RE.search(self.buf, index)
+			if match is None:
+				index = len(self.buf)
+			else:
+				index = match.start()
+				char = match.group()
+				if char == '"':
+					string_match = STRING_RE.match(self.buf, index)
+					if string_match is not None:
+						index = string_match.end()
+						continue
+				else:
+					depth += 1 if char in '{[' else -1
+					index += 1
+					if depth == 0:
+						break
+					continue
+			# need more data: value is either unterminated or contains an incomplete string
+			if not keep:
+				self.buf = self.buf[index:]
+				index = start = 0
+			if not self._fill():
+				raise JSONStreamError("Unexpected end of stream")
+		self.pos = index
+		return self.buf[start:index] if keep else None
+
+	def _scan_string(self, keep):
+		if self.peek() != '"':
+			raise JSONStreamError("Expected string at offset %d" % self.pos)
+		while True:
+			match = STRING_RE.match(self.buf, self.pos)
+			if match is not None:
+				self.pos = match.end()
+				return match.group() if keep else None
+			if not self._fill():
+				raise JSONStreamError("Unterminated string at offset %d" % self.pos)
+
+	def _scan_scalar(self):
+		start = self.pos
+		while True:
+			match = SCALAR_END_RE.search(self.buf, start)
+			if match is not None:
+				self.pos = match.start()
+				return self.buf[start:self.pos]
+			if not self._fill():
+				self.pos = len(self.buf)
+				return self.buf[start:]
+
+
+def iter_miner_json(chunks, groups=None):
+	""" Incrementally parses AwesomeMiner web API 'groupList' object out of /api/miners response body
+
+	Args:
+		chunks: iterable of bytes objects making up the response body
+		groups: optional collection of group names to decode miners from; miner lists of other
+			groups are skipped without being decoded. If None, miners of all groups are decoded
+
+	Yields:
+		(group name, miner JSON object) tuples in the order they appear in the response
+
+	Raises:
+		JSONStreamError if the response is truncated or malformed
+
+	"""
+	reader = JSONStreamReader(chunks)
+	for key in reader.iter_object():
+		if key != 'groupList':
+			reader.skip_value()
+			continue
+		for _ in reader.iter_array():
+			group_name = None
+			# miners seen before the group name, they can only be emitted once the name is known
+			pending = list()
+			for group_key in reader.iter_object():
+				if group_key == 'name':
+					group_name = json.loads(reader.read_value())
+				elif group_key == 'minerList':
+					if group_name is not None and groups is not None and group_name not in groups:
+						reader.skip_value()
+						continue
+					for _ in reader.iter_array():
+						raw_miner = reader.read_value()
+						if group_name is None:
+							pending.append(raw_miner)
+						else:
+							yield group_name, json.loads(raw_miner)
+				else:
+					reader.skip_value()
+			if groups is None or group_name in groups:
+				for raw_miner in pending:
+					yield group_name, json.loads(raw_miner)
@@ -1,28 +1,94 @@
-import utils
 from abc import ABC,abstractmethod
+from bisect import bisect_left
+from enum import Enum
 
 """
 Classes that encapsulate AwesomeMiner data types 
 """
 
+class DeviceType(Enum):
+	GPU = 0
+	ASIC = 1
+	PGA = 2
+	ALL = 3
+
+def get_device_type(miner_json):
+	""" Classifies miner by hardware flags of its AwesomeMiner web API object
+
+	Returns:
+		DeviceType.GPU, DeviceType.ASIC or DeviceType.PGA if miner has a single kind of hardware,
+		otherwise, None
+
+	"""
+	has_gpu = miner_json['hasGpu']
+	has_asic = miner_json['hasAsic']
+	has_pga = miner_json['hasPga']
+	if has_gpu and not has_asic and not has_pga:
+		return DeviceType.GPU
+	if has_asic and not has_gpu and not has_pga:
+		return DeviceType.ASIC
+	if has_pga and not has_gpu and not has_asic:
+		return DeviceType.PGA
+	return None
+
 class Miner(object):
 
 	"""
 	Top-level class that represent a mining device of any type.
 	Can be ASIC, GPU farm or any other AwesomeMiner supported miner type.
+
+	Keeps a reference to the raw JSON object and materializes nested objects
+	on first attribute access, so that reading .name or .host costs no allocations.
 	"""
 
+	__slots__ = ('_json', '_status_info', '_speed_info', '_coin_info')
+
 	def __init__(self, json):
-		self.name = json['name']
-		self.host = json['hostname']
-		self.pool = json['pool']
-		self.temperature = json['temperature']
-		self.status_info = StatusInfo(json['statusInfo'])
-		self.speed_info = SpeedInfo(json['speedInfo'])
-		self.coin_info = CoinInfo(json['coinInfo'])
+		self._json = json
+		self._status_info = None
+		self._speed_info = None
+		self._coin_info = None
+
+	@property
+	def id(self):
+		return self._json['id']
+
+	@property
+	def name(self):
+		return self._json['name']
+
+	@property
+	def host(self):
+		return self._json['hostname']
+
+	@property
+	def pool(self):
+		return self._json['pool']
+
+	@property
+	def temperature(self):
+		return self._json['temperature']
+
+	@property
+	def status_info(self):
+		if self._status_info is None:
+			self._status_info = StatusInfo(self._json['statusInfo'])
+		return self._status_info
+
+	@property
+	def speed_info(self):
+		if self._speed_info is None:
+			self._speed_info = SpeedInfo(self._json['speedInfo'])
+		return self._speed_info
+
+	@property
+	def coin_info(self):
+		if self._coin_info is None:
+			self._coin_info = CoinInfo(self._json['coinInfo'])
+		return self._coin_info
 
 	def is_running(self):
-		return self.status_info.status_display == "Mining"
+		return self._json['statusInfo']['statusDisplay'] == "Mining"
 
 	@abstractmethod
 	def get_faulty_devices(self):
@@ -37,9 +103,17 @@ class GPUMiner(Miner):
 
 	""" Subclass of Miner representing GPU-based miner """
 
+	__slots__ = ('_device_list',)
+
 	def __init__(self, json):
 		super(GPUMiner, self).__init__(json)
-		self.device_list = DeviceList(json['gpuList'])
+		self._device_list = None
+
+	@property
+	def device_list(self):
+		if self._device_list is None:
+			self._device_list = DeviceList(self._json['gpuList'])
+		return self._device_list
 
 	def get_reset_gpus(self, default_mem_clock):
 		faulty_gpus = list()
@@ -55,6 +129,8 @@ class Pangolin(GPUMiner):
 
 	""" Specific GPUMiner subclass representing Pangolin GPU miners """
 
+	__slots__ = ()
+
 	NUM_GPUS = 8
 	#in MHz
 	DEFAULT_MEMORY_CLOCK = 4007
@@ -73,6 +149,8 @@ class Ferm(GPUMiner):
 
 	""" Specific GPUMiner subclass representing Ferm GPU miners (custom-built, 6 GPU rigs) """
 
+	__slots__ = ()
+
 	NUM_GPUS = 6
 	#in MHz
 	DEFAULT_MEMORY_CLOCK = 3802
@@ -92,15 +170,41 @@ class ASICMiner(Miner):
 	
 	""" Subclass of Miner representing ASIC-based miner """
 
+	__slots__ = ('_device_list',)
+
 	def __init__(self, json):
 		super(ASICMiner, self).__init__(json)
-		self.device_list = DeviceList(json['asicList'])
+		self._device_list = None
+
+	@property
+	def device_list(self):
+		if self._device_list is None:
+			self._device_list = DeviceList(self._json['asicList'])
+		return self._device_list
+
+class PGAMiner(Miner):
+
+	""" Subclass of Miner representing PGA-based (FPGA) miner """
+
+	__slots__ = ('_device_list',)
+
+	def __init__(self, json):
+		super(PGAMiner, self).__init__(json)
+		self._device_list = None
+
+	@property
+	def device_list(self):
+		if self._device_list is None:
+			self._device_list = DeviceList(self._json['pgaList'])
+		return self._device_list
 
 
 class StatusInfo(object):
 
 	""" Represents AwesomeMiner web API 'statusInfo' object """
 
+	__slots__ = ('status_display', 'extra_info')
+
 	def __init__(self, json):
 		self.status_display = json['statusDisplay']
 		self.extra_info = json['statusLine3']
@@ -109,6 +213,8 @@ class SpeedInfo(object):
 
 	""" Represents AwesomeMiner web API 'speedInfo' object """
 
+	__slots__ = ('hashrate', 'hashrate_val', 'avg_hashrate')
+
 	def __init__(self, json):
 		self.hashrate = json['hashrate']
 		self.hashrate_val = json['hashrateValue']
@@ -118,6 +224,8 @@ class DeviceInfo(object):
 
 	""" Represents AwesomeMiner web API 'deviceInfo' object """
 
+	__slots__ = ('device_type', 'clock', 'memory_clock', 'fan_percent', 'temperature')
+
 	def __init__(self, json):
 		self.device_type = json['deviceType']
 		self.clock = json['gpuClock']
@@ -129,6 +237,8 @@ class CoinInfo(object):
 
 	""" Represents AwesomeMiner web API 'coinInfo' object """
 
+	__slots__ = ('name', 'daily_revenue', 'daily_revenue_val')
+
 	def __init__(self, json):
 		self.name = json['displayName']
 		self.daily_revenue = json['revenuePerDay']
@@ -138,30 +248,61 @@ class DeviceList(object):
 
 	""" Represents AwesomeMiner web API 'deviceList' object """
 
+	__slots__ = ('_json', '_devices')
+
 	def __init__(self, json):
-		device_list = list()
-		for device_json in json:
-			device = Device(device_json)
-			device_list.append(device)
-		self.devices = device_list
+		self._json = json
+		self._devices = None
+
+	@property
+	def devices(self):
+		if self._devices is None:
+			self._devices = [Device(device_json) for device_json in self._json]
+		return self._devices
 
 	def get_num_devices(self):
-		return len(self.devices)
+		return len(self._json)
 
 class Device(object):
 
 	""" Top-level object representing all types of hardware devices available within AwesomeMiner web API """
 
+	__slots__ = ('_json', '_status_info', '_device_info', '_speed_info')
+
 	def __init__(self, json):
-		self.name = json['name']
-		self.status_info = StatusInfo(json['statusInfo'])
-		self.device_info = DeviceInfo(json['deviceInfo'])
-		self.speed_info = SpeedInfo(json['speedInfo'])
+		self._json = json
+		self._status_info = None
+		self._device_info = None
+		self._speed_info = None
+
+	@property
+	def name(self):
+		return self._json['name']
+
+	@property
+	def status_info(self):
+		if self._status_info is None:
+			self._status_info = StatusInfo(self._json['statusInfo'])
+		return self._status_info
+
+	@property
+	def device_info(self):
+		if self._device_info is None:
+			self._device_info = DeviceInfo(self._json['deviceInfo'])
+		return self._device_info
+
+	@property
+	def speed_info(self):
+		if self._speed_info is None:
+			self._speed_info = SpeedInfo(self._json['speedInfo'])
+		return self._speed_info
 
 class GPU(Device):
 
 	""" Subclass of Device representing GPU device type """
 
+	__slots__ = ()
+
 	def __init__(self, json):
 		super(GPU, self).__init__(json)
 
@@ -169,9 +310,153 @@ class ASIC(Device):
 
 	""" Subclass of Device representing ASIC device type """
 
+	__slots__ = ()
+
 	def __init__(self, json):
 		super(ASIC, self).__init__(json)
 
+class PGA(Device):
+
+	""" Subclass of Device representing PGA device type """
+
+	__slots__ = ()
+
+	def __init__(self, json):
+		super(PGA, self).__init__(json)
+
+class MinerRegistry(object):
+
+	""" Maps AwesomeMiner groups and hardware flags of miners to Miner subclasses
+
+	A miner is modelled by the class registered for its group if there is one, otherwise, by the class
+	registered for its device type (see get_device_type), otherwise, it's unclassified and modelled by Miner.
+	Adding a model is a matter of registering its class.
+	"""
+
+	def __init__(self):
+		self.group_classes = dict()
+		self.type_classes = {DeviceType.ALL: Miner}
+
+	def register_group(self, group, miner_class):
+		self.group_classes[group] = miner_class
+
+	def register_type(self, device_type, miner_class):
+		self.type_classes[device_type] = miner_class
+
+	def get_type_class(self, device_type):
+		""" Returns Miner subclass registered for the device type, or None """
+		return self.type_classes.get(device_type)
+
+	def get_class(self, group, miner_json):
+		""" Returns Miner subclass modelling the miner of the given group, Miner if no registry entry matches """
+		miner_class = self.group_classes.get(group)
+		if miner_class is None:
+			miner_class = self.type_classes.get(get_device_type(miner_json), Miner)
+		return miner_class
+
+	def create_miner(self, group, miner_json):
+		return self.get_class(group, miner_json)(miner_json)
+
+	def partition(self, miner_groups):
+		""" Models all miners of AwesomeMiner web API 'groupList' object in a single pass, see MinerPartition """
+		partition = MinerPartition()
+		for miner_group in miner_groups:
+			group = miner_group['name']
+			group_class = self.group_classes.get(group)
+			group_miners = partition.by_group.setdefault(group, list())
+			for miner_json in miner_group['minerList']:
+				device_type = get_device_type(miner_json)
+				miner_class = group_class if group_class is not None else self.type_classes.get(device_type, Miner)
+				miner = miner_class(miner_json)
+				group_miners.append(miner)
+				partition.by_type[DeviceType.ALL].append(miner)
+				if device_type is not None:
+					partition.by_type[device_type].append(miner)
+				if miner_class is Miner:
+					partition.unclassified.append(miner)
+		return partition
+
+class MinerPartition(object):
+
+	""" Miners of a fleet partitioned by device type and by group, each miner modelled once
+
+	Attributes:
+		by_type: dictionary mapping every DeviceType to a list of miners of that type, DeviceType.ALL to all miners
+		by_group: dictionary mapping group names to lists of miners of the group
+		unclassified: miners that no registry entry matched, modelled by Miner
+
+	"""
+
+	def __init__(self):
+		self.by_type = {device_type: list() for device_type in DeviceType}
+		self.by_group = dict()
+		self.unclassified = list()
+
+	def get_type(self, device_type):
+		return self.by_type[device_type]
+
+	def get_group(self, group_name):
+		return self.by_group.get(group_name, list())
+
+"""
+Registry of the miner models in use, register new models here
+"""
+DEFAULT_MINER_REGISTRY = MinerRegistry()
+DEFAULT_MINER_REGISTRY.register_type(DeviceType.GPU, GPUMiner)
+DEFAULT_MINER_REGISTRY.register_type(DeviceType.ASIC, ASICMiner)
+DEFAULT_MINER_REGISTRY.register_type(DeviceType.PGA, PGAMiner)
+DEFAULT_MINER_REGISTRY.register_group(Pangolin.GROUP, Pangolin)
+DEFAULT_MINER_REGISTRY.register_group(Ferm.GROUP, Ferm)
+
+class FleetIndex(object):
+
+	""" Hash indexes over AwesomeMiner web API 'groupList' object
+
+	Built once per fleet snapshot, so that resolving a miner by host, name, group or device type
+	is a dictionary hit. Indexes hold raw miner JSON objects; Miner objects are only constructed
+	for the miners that are actually looked up.
+	"""
+
+	def __init__(self, miner_groups):
+		self.by_host = dict()
+		self.by_name = dict()
+		self.by_group = dict()
+		self.by_type = {device_type: list() for device_type in DeviceType}
+		self._miners = dict()
+		for miner_group in miner_groups:
+			group_miners = self.by_group.setdefault(miner_group['name'], list())
+			for miner_json in miner_group['minerList']:
+				# the first registered miner wins, same as a linear scan would
+				self.by_host.setdefault(miner_json['hostname'], miner_json)
+				self.by_name.setdefault(miner_json['name'], miner_json)
+				group_miners.append(miner_json)
+				self.by_type[DeviceType.ALL].append(miner_json)
+				device_type = get_device_type(miner_json)
+				if device_type is not None:
+					self.by_type[device_type].append(miner_json)
+
+	def _get_miner(self, miner_json):
+		miner = self._miners.get(id(miner_json))
+		if miner is None:
+			miner = Miner(miner_json)
+			self._miners[id(miner_json)] = miner
+		return miner
+
+	def get_by_host(self, host):
+		miner_json = self.by_host.get(host)
+		return self._get_miner(miner_json) if miner_json is not None else None
+
+	def get_by_name(self, name):
+		miner_json = self.by_name.get(name)
+		return self._get_miner(miner_json) if miner_json is not None else None
+
+	def get_group(self, group_name):
+		return self.by_group.get(group_name, list())
+
+	def get_type(self, device_type):
+		return self.by_type[device_type]
+
+
 class NotificationList(object):
 
 	""" Represents AwesomeMiner web API 'notificationList' object """
@@ -182,25 +467,46 @@ class NotificationList(object):
 			notification = Notification(notification_json)
 			notifications.append(notification)
 		self.notifications = self.filter_duplicate_notifications(notifications)
+		# miner names sorted alphabetically and positions of respective notifications, built on first prefix query
+		self._sorted_miner_names = None
+		self._sorted_positions = None
 
 	"""
 	Notification is considered as a duplicate if there is another notification with same 'miner_name', 'source' and 'message' 
 	"""
 	def filter_duplicate_notifications(self, notifications):
 		filtered_notifications = list()
+		seen_keys = set()
 		for notification in notifications:
-			if not utils.contains(filtered_notifications, lambda x: x.miner_name == notification.miner_name and x.source == notification.source and x.message == notification.message):
+			key = (notification.miner_name, notification.source, notification.message)
+			if key not in seen_keys:
+				seen_keys.add(key)
 				filtered_notifications.append(notification)
 		return filtered_notifications
 
 	def get_notifications_with_prefix(self, prefix):
-		return list(filter(lambda x: x.miner_name.startswith(prefix), self.notifications))
+		if self._sorted_miner_names is None:
+			self._build_prefix_index()
+		start = bisect_left(self._sorted_miner_names, prefix)
+		end = start
+		while end < len(self._sorted_miner_names) and self._sorted_miner_names[end].startswith(prefix):
+			end += 1
+		# keep notifications in the order AwesomeMiner reported them
+		positions = sorted(self._sorted_positions[start:end])
+		return [self.notifications[position] for position in positions]
+
+	def _build_prefix_index(self):
+		order = sorted(range(len(self.notifications)), key=lambda position: self.notifications[position].miner_name)
+		self._sorted_miner_names = [self.notifications[position].miner_name for position in order]
+		self._sorted_positions = order
 
 
 class Notification(object):
 
 	""" Represents AwesomeMiner web API element of 'notificationList' """
 
+	__slots__ = ('miner_name', 'source', 'message')
+
 	def __init__(self, json):
 		self.miner_name = json['minerName']
 		self.source = json["source"]
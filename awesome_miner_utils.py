@@ -1,27 +1,50 @@
-from awesome_miner_structs import Miner, Pangolin, Ferm, GPUMiner, ASICMiner, NotificationList
-from enum import Enum
+from awesome_miner_structs import DeviceType
+import shared_snapshot
 import logging
-import requests
-import json
 import os.path
 import configparser
-from multiprocessing import Queue
 
 """
 Helper file that contains utility functions to intetact with AwesomeMiner Web API
+
+All functions delegate to an AwesomeMinerClient shared per AwesomeMiner instance,
+see awesome_miner_client.get_default_client
 """
 
 logger = logging.getLogger(__name__)
 
-
 """
-
+Configuration group of a single AwesomeMiner instance; when multiple instances are managed,
+each one is configured in "AWESOMEMINER:<instance name>" group
 """
-class DeviceType(Enum):
-	GPU = 0
-	ASIC = 1
-	PGA = 2
-	ALL = 3
+AWESOME_MINER_SECTION = "AWESOMEMINER"
+INSTANCE_SECTION_PREFIX = AWESOME_MINER_SECTION + ":"
+
+def _get_client(pc_name, awesome_miner_port):
+	# awesome_miner_client imports requests, which takes longer than the whole run of a command
+	# that resolves its miner through a fresh shared snapshot, so it's imported on first use
+	from awesome_miner_client import get_default_client
+	return get_default_client(pc_name, awesome_miner_port)
+
+def get_fleet_snapshot(pc_name, awesome_miner_port):
+	""" Returns cached snapshot of all miners registered with AwesomeMiner instance
+
+	Snapshot is re-fetched only when the cached one is older than the snapshot TTL of the client,
+	so that multiple lookups within a polling cycle cost a single request and a single parse.
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+
+	Returns:
+		a FleetSnapshot object if executed successfully, otherwise, None
+
+	"""
+	return _get_client(pc_name, awesome_miner_port).get_fleet_snapshot()
+
+def invalidate_fleet_snapshot(pc_name, awesome_miner_port):
+	""" Drops cached snapshot of the given AwesomeMiner instance """
+	_get_client(pc_name, awesome_miner_port).invalidate_snapshot()
 
 def collect_devices_of_type(pc_name, awesome_miner_port, device_type=DeviceType.ALL):
 	""" Collects all miners registered with AwesomeMiner instance
@@ -35,30 +58,7 @@ def collect_devices_of_type(pc_name, awesome_miner_port, device_type=DeviceType.
 		with the AwesomeMiner instance if executed successfully, otherwise, an empty list
 
 	"""
-	request_url = "http://" + str(pc_name) + ":" + str(awesome_miner_port) + "/api/miners"
-	response = requests.get(request_url)
-	miners = list()
-	if response.status_code == 200:
-		miner_groups = json.loads(response.text)['groupList']
-		for miner_group in miner_groups:
-			miner_list = miner_group['minerList']
-			for miner_json in miner_list:
-				miner = None
-				if device_type == DeviceType.ALL:
-					miner = Miner(miner_json)
-				elif device_type == DeviceType.GPU:t_all_t
-					if miner_json['hasGpu'] and not miner_json['hasAsic'] and not miner_json['hasPga']: 
-						miner = GPUMiner(miner_json)
-				elif device_type == DeviceType.ASIC:
-					if miner_json['hasAsic'] and not miner_json['hasGpu'] and not miner_json['hasPga']:
-						miner = ASICMiner(miner_json)
-				#TODO: add PGA device type
-				if miner:
-					miners.append(miner)
-		return miners
-	else:
-		logger.error("Failed to connect to Awesome Miner at %s!", request_url)
-		return miners
+	return _get_client(pc_name, awesome_miner_port).collect_devices_of_type(device_type)
 
 def collect_devices_from_groups(pc_name, awesome_miner_port, groups):
 	""" Collects all miners registered within the given AwesomeMiner group
@@ -77,27 +77,58 @@ def collect_devices_from_groups(pc_name, awesome_miner_port, groups):
 		if executed successfully, otherwise, an empty list
 
 	"""
-	request_url = "http://" + str(pc_name) + ":" + str(awesome_miner_port) + "/api/miners"
-	response = requests.get(request_url)
-	miners = list()
-	if response.status_code == 200:
-		miner_groups = json.loads(response.text)['groupList']
-		for miner_group in miner_groups:
-			for key, value in miner_group.items():
-				if key == "name" and value in groups:
-					miner_list = miner_group['minerList']
-					for miner_json in miner_list:
-						# TODO: add other device types
-						if value == Pangolin.GROUP:
-							miner = Pangolin(miner_json)
-						elif value == Ferm.GROUP:
-							miner = Ferm(miner_json)
-						else:
-							miner = ASIC(miner_json)
-						miners.append(miner)
-	else:
-		logger.error("Failed to connect to Awesome Miner at %s!", request_url)
-	return miners
+	return _get_client(pc_name, awesome_miner_port).collect_devices_from_groups(groups)
+
+def partition_devices(pc_name, awesome_miner_port):
+	""" Collects all miners registered with AwesomeMiner instance partitioned by device type and by group
+
+	All partitions come from a single /api/miners response modelled in a single pass, so tools that need
+	e.g. both GPU and ASIC miners don't download and parse the fleet twice. Miner classes are picked by
+	awesome_miner_structs.DEFAULT_MINER_REGISTRY.
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+
+	Returns:
+		a MinerPartition object if executed successfully, otherwise, None
+
+	"""
+	return _get_client(pc_name, awesome_miner_port).partition_devices()
+
+def iter_devices_of_type(pc_name, awesome_miner_port, device_type=DeviceType.ALL):
+	""" Streaming counterpart of collect_devices_of_type
+
+	Reads /api/miners response in chunks and yields miners as soon as they are parsed,
+	so that memory usage stays flat regardless of the fleet size. Bypasses the snapshot cache.
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		device_type: type of miners to be yielded
+
+	Yields:
+		Miner instances, each representing single miner registered with the AwesomeMiner instance
+
+	"""
+	return _get_client(pc_name, awesome_miner_port).iter_devices_of_type(device_type)
+
+def iter_devices_from_groups(pc_name, awesome_miner_port, groups):
+	""" Streaming counterpart of collect_devices_from_groups
+
+	Miner lists of groups that are not requested are skipped without being decoded.
+	Bypasses the snapshot cache.
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		groups: list of AwesomeMiner groups from which devices are to be collected
+
+	Yields:
+		specific Miner subclasses (based on the group)
+
+	"""
+	return _get_client(pc_name, awesome_miner_port).iter_devices_from_groups(groups)
 
 def get_device_by_ip(ip_addr, pc_name, awesome_miner_port):
 	""" Looks up information about miner using it's IP address 
@@ -111,21 +142,7 @@ def get_device_by_ip(ip_addr, pc_name, awesome_miner_port):
 		a Miner object if executed successfully, otherwise, None 
 
 	"""
-	request_url = "http://" + str(pc_name) + ":" + str(awesome_miner_port) + "/api/miners"
-	response = requests.get(request_url)
-	if response.status_code == 200:
-		miner_groups = json.loads(response.text)['groupList']
-		for miner_group in miner_groups:
-			miner_list = miner_group['minerList']
-			for miner_json in miner_list:
-				miner = Miner(miner_json)
-				if miner.host == ip_addr:
-					return miner
-		logger.warning("Failed to find miner with IP address %s", ip_addr)
-		return None
-	else:
-		logger.error("Failed to connect to Awesome Miner at %s!", request_url)
-		return None
+	return _get_client(pc_name, awesome_miner_port).get_device_by_ip(ip_addr)
 
 def get_device_by_name(device_name, pc_name, awesome_miner_port):
 	""" Looks up information about miner using it's device name
@@ -139,21 +156,29 @@ def get_device_by_name(device_name, pc_name, awesome_miner_port):
 		a Miner object if executed successfully, otherwise, None 
 
 	"""
-	request_url = "http://" + str(pc_name) + ":" + str(awesome_miner_port) + "/api/miners"
-	response = requests.get(request_url)
-	if response.status_code == 200:
-		miner_groups = json.loads(response.text)['groupList']
-		for miner_group in miner_groups:
-			miner_list = miner_group['minerList']
-			for miner_json in miner_list:
-				miner = Miner(miner_json)
-				if miner.name == device_name:
-					return miner
-		logger.warning("Failed to find miner with name %s", device_name)
-		return None
-	else:
-		logger.error("Failed to connect to Awesome Miner at %s!", request_url)
-		return None
+	return _get_client(pc_name, awesome_miner_port).get_device_by_name(device_name)
+
+def get_shared_device_by_ip(ip_addr, pc_name, awesome_miner_port):
+	""" Looks up information about miner using it's IP address in fleet snapshot shared by concurrently running processes
+
+	Meant for short-lived processes started in bulk, see shared_snapshot.py
+
+	Returns:
+		a Miner object if executed successfully, otherwise, None 
+
+	"""
+	return shared_snapshot.get_device_by_ip(ip_addr, pc_name, awesome_miner_port)
+
+def get_shared_device_by_name(device_name, pc_name, awesome_miner_port):
+	""" Looks up information about miner using it's device name in fleet snapshot shared by concurrently running processes
+
+	Meant for short-lived processes started in bulk, see shared_snapshot.py
+
+	Returns:
+		a Miner object if executed successfully, otherwise, None 
+
+	"""
+	return shared_snapshot.get_device_by_name(device_name, pc_name, awesome_miner_port)
 
 def collect_notifications_data(pc_name, awesome_miner_port):
 	""" Collects all pending notifications from AwesomeMiner
@@ -166,15 +191,22 @@ def collect_notifications_data(pc_name, awesome_miner_port):
 		a NotificationList object if executed successfully, otherwise, None
 
 	"""
-	request_url = "http://" + str(pc_name) + ":" + str(awesome_miner_port) + "/api/notifications"
-	response = requests.get(request_url)
-	if response.status_code == 200:
-		notification_list_json = json.loads(response.text)['notificationList']
-		notification_list = NotificationList(notification_list_json)
-		return notification_list
-	else:
-		logger.error("Failed to retrieve information about notifications from AwesomeMiner")
-		return None
+	return _get_client(pc_name, awesome_miner_port).collect_notifications_data()
+
+def collect_new_notifications(pc_name, awesome_miner_port, cursor):
+	""" Collects notifications from AwesomeMiner that appeared since the previous poll
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		cursor: a NotificationCursor object remembering notifications seen by previous polls,
+			it is updated and saved by this function
+
+	Returns:
+		a NotificationList object with new notifications only if executed successfully, otherwise, None
+
+	"""
+	return _get_client(pc_name, awesome_miner_port).collect_new_notifications(cursor)
 
 def load_config_file(path):
 	""" Loads configuration .ini file as a dictionary of dictionaries
@@ -199,4 +231,88 @@ def load_config_file(path):
 		for key in parser[group_key]:
 			group_dict[key] = parser[group_key][key]
 		config[group_key] = group_dict
-	return config
\ No newline at end of file
+	return config
+
+def load_awesome_miner_address(path):
+	""" Loads address of AwesomeMiner instance from "AWESOMEMINER" group of configuration file
+
+	Args:
+		path: a path to configuration file
+
+	Returns:
+		a tuple of PC name where AwesomeMiner is running on and port (as int) to which AwesomeMiner API listens
+		if executed successfully, otherwise, None
+
+	"""
+	config_values = load_config_file(path)
+	if config_values is None:
+		logger.error("Configuration file at %s doesn't exist or has invalid structure! Exiting...", path)
+		return None
+	if config_values.get("AWESOMEMINER") is None:
+		logger.error("Configuration file at %s has no \"AWESOMEMINER\" parameter group! Exiting...", path)
+		return None
+	port = config_values["AWESOMEMINER"].get("port")
+	pc_name = config_values["AWESOMEMINER"].get("pc_name")
+	if port is None:
+		logger.error("Configuration file at %s doesn't contain AwesomeMiner port number! Exiting...", path)
+		return None
+	if pc_name is None:
+		logger.error("Configuration file at %s doesn't contain PC name! Exiting...", path)
+		return None
+	return pc_name, int(port)
+
+
+def load_awesome_miner_instances(path):
+	""" Loads addresses of all AwesomeMiner instances from configuration file
+
+	Each instance is configured in "AWESOMEMINER:<instance name>" group with the same parameters as
+	"AWESOMEMINER" group, which, if present, is loaded as an instance named after its PC name.
+
+	Args:
+		path: a path to configuration file
+
+	Returns:
+		a list of tuples of instance name, PC name and port (as int), in the order of configuration groups,
+		if executed successfully, otherwise, None
+
+	"""
+	config_values = load_config_file(path)
+	if config_values is None:
+		logger.error("Configuration file at %s doesn't exist or has invalid structure! Exiting...", path)
+		return None
+	instances = list()
+	for section, values in config_values.items():
+		if section == AWESOME_MINER_SECTION:
+			name = values.get("pc_name")
+		elif section.startswith(INSTANCE_SECTION_PREFIX):
+			name = section[len(INSTANCE_SECTION_PREFIX):].strip()
+		else:
+			continue
+		port = values.get("port")
+		pc_name = values.get("pc_name")
+		if port is None or pc_name is None:
+			logger.error("Configuration group %s at %s doesn't contain AwesomeMiner port number or PC name! Exiting...", section, path)
+			return None
+		if name in [instance[0] for instance in instances]:
+			logger.error("AwesomeMiner instance %s is configured more than once at %s! Exiting...", name, path)
+			return None
+		instances.append((name, pc_name, int(port)))
+	if len(instances) == 0:
+		logger.error("Configuration file at %s has no \"AWESOMEMINER\" parameter group! Exiting...", path)
+		return None
+	return instances
+
+def select_awesome_miner_instance(instances, name):
+	""" Narrows instances loaded by load_awesome_miner_instances down to the one with the given name
+
+	Returns:
+		a list with the named instance, all instances if name is None, or None if there is no such instance
+
+	"""
+	if name is None:
+		return instances
+	selected = [instance for instance in instances if instance[0] == name]
+	if len(selected) == 0:
+		logger.error("AwesomeMiner instance %s is not configured! Exiting...", name)
+		return None
+	return selected
@@ -0,0 +1,212 @@
+import argparse
+import json
+import logging
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from awesome_miner_client import get_default_client
+from awesome_miner_structs import DeviceType, NotificationList, Pangolin, Ferm, DEFAULT_MINER_REGISTRY
+
+"""
+Stand-alone benchmark of AwesomeMiner tools against fake_awesome_miner.py serving synthetic fleets
+
+For every fleet size, the fake server is started in a separate process, so that its memory doesn't
+count towards peak memory of the measured calls. Every call starts from a cold fleet snapshot,
+as a freshly started tool would, unless the operation is explicitly a warm one.
+
+Reports throughput, latency percentiles and peak traced Python memory of each operation, together with
+memory blocks allocated by the operation and still held by its result, e.g. by the Miner objects it built.
+
+Lazy Miner objects are checked against an eager baseline materializing every nested struct of the same
+fleet, as Miner constructors did before: exits with status 1 if constructing the fleet and reading
+names and hosts doesn't hold at least ALLOCATION_RATIO_TARGET times fewer blocks than the baseline.
+"""
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+DEFAULT_REPEAT = 20
+"""
+Calls of an operation are capped at MINER_CALLS_BUDGET / fleet size, but there are at least MIN_REPEAT of them
+"""
+MINER_CALLS_BUDGET = 100000
+MIN_REPEAT = 3
+"""
+Minimum ratio of memory blocks held by eagerly built Miner objects to blocks held by lazy ones
+"""
+ALLOCATION_RATIO_TARGET = 10.0
+LAZY_CONSTRUCTION = "construct_miners"
+EAGER_CONSTRUCTION = "construct_miners(eager)"
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_awesome_miner.py")
+
+def start_fake_server(num_miners, latency, num_notifications):
+	""" Starts fake_awesome_miner.py in a child process, returns the process and the port it listens to """
+	process = subprocess.Popen([sys.executable, FAKE_SERVER, "-miners", str(num_miners), "-latency", str(latency),
+		"-notifications", str(num_notifications)], stdout=subprocess.PIPE)
+	port = int(process.stdout.readline())
+	return process, port
+
+def percentile(sorted_values, fraction):
+	""" Nearest-rank percentile of an ascending list """
+	position = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+	return sorted_values[position]
+
+def measure(name, num_miners, func, repeat):
+	""" Calls func repeat times measuring latency, then once more under tracemalloc measuring peak memory and memory held by its result """
+	func()
+	latencies = list()
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		latencies.append(time.perf_counter() - start)
+	tracemalloc.start()
+	result = func()
+	retained_memory, peak_memory = tracemalloc.get_traced_memory()
+	# every traced block was allocated by the call, the ones still alive are held by its result
+	retained_blocks = sum([statistic.count for statistic in tracemalloc.take_snapshot().statistics('filename')])
+	del result
+	tracemalloc.stop()
+	latencies.sort()
+	total = sum(latencies)
+	return {
+		"operation": name,
+		"miners": num_miners,
+		"calls": repeat,
+		"calls_per_s": repeat / total if total > 0 else float('inf'),
+		"miners_per_s": repeat * num_miners / total if total > 0 else float('inf'),
+		"p50_ms": percentile(latencies, 0.5) * 1000,
+		"p95_ms": percentile(latencies, 0.95) * 1000,
+		"p99_ms": percentile(latencies, 0.99) * 1000,
+		"peak_mb": peak_memory / 1e6,
+		"retained_blocks": retained_blocks,
+		"retained_mb": retained_memory / 1e6,
+	}
+
+def get_operations(client, work_dir):
+	""" Returns list of (name, callable) operations benchmarked against the client's AwesomeMiner instance """
+	snapshot = client.get_fleet_snapshot()
+	miners = list(snapshot.iter_miner_json())
+	# the last miner is the worst case of a linear scan
+	ip_addr = miners[-1]['hostname'] if len(miners) > 0 else "0.0.0.0"
+	notification_list_json = client._get_notification_list_json()
+	csv_path = os.path.join(work_dir, "offline.csv")
+	miners_by_group = snapshot.index.by_group
+
+	def cold(func):
+		def call():
+			client.invalidate_snapshot()
+			return func()
+		return call
+
+	def construct_miners(eager):
+		# Miner objects of the whole fleet built from already parsed JSON, as tools keep them while reading name and host
+		def call():
+			constructed = [DEFAULT_MINER_REGISTRY.create_miner(group, miner_json) for group, group_miners in miners_by_group.items()
+				for miner_json in group_miners]
+			addresses = [(miner.name, miner.host) for miner in constructed]
+			if eager:
+				for miner in constructed:
+					materialize(miner)
+			return constructed, addresses
+		return call
+
+	def log_offline():
+		# imported here, as log_offline configures logging on import
+		from log_offline import log_offline_by_ip
+		client.invalidate_snapshot()
+		log_offline_by_ip(ip_addr, client.pc_name, client.port, csv_path, 0)
+
+	return [
+		("collect_devices_of_type(GPU)", cold(lambda: client.collect_devices_of_type(DeviceType.GPU))),
+		("collect_devices_from_groups", cold(lambda: client.collect_devices_from_groups([Pangolin.GROUP, Ferm.GROUP]))),
+		("partition_devices", cold(lambda: client.partition_devices())),
+		("get_device_by_ip", cold(lambda: client.get_device_by_ip(ip_addr))),
+		("get_device_by_ip(warm)", lambda: client.get_device_by_ip(ip_addr)),
+		(LAZY_CONSTRUCTION, construct_miners(False)),
+		(EAGER_CONSTRUCTION, construct_miners(True)),
+		("NotificationList", lambda: NotificationList(notification_list_json)),
+		("log_offline", log_offline),
+	]
+
+def materialize(miner):
+	""" Builds every nested struct of the Miner object, as constructors of eagerly parsed structs did """
+	miner.status_info, miner.speed_info, miner.coin_info
+	device_list = getattr(miner, 'device_list', None)
+	if device_list is not None:
+		for device in device_list.devices:
+			device.status_info, device.device_info, device.speed_info
+
+def check_allocations(results):
+	""" Compares blocks held by lazy and eager construction of each fleet size, returns a list of messages describing violations """
+	violations = list()
+	by_size = dict()
+	for result in results:
+		if result["operation"] in (LAZY_CONSTRUCTION, EAGER_CONSTRUCTION):
+			by_size.setdefault(result["miners"], dict())[result["operation"]] = result["retained_blocks"]
+	for num_miners, blocks in sorted(by_size.items()):
+		if len(blocks) < 2 or blocks[LAZY_CONSTRUCTION] == 0:
+			continue
+		ratio = blocks[EAGER_CONSTRUCTION] / float(blocks[LAZY_CONSTRUCTION])
+		print("{} miners: eager construction holds {} blocks, lazy {}, ratio {:.1f}, target {:.1f}".format(num_miners, blocks[EAGER_CONSTRUCTION],
+			blocks[LAZY_CONSTRUCTION], ratio, ALLOCATION_RATIO_TARGET))
+		if ratio < ALLOCATION_RATIO_TARGET:
+			violations.append("lazy construction of {} miners holds only {:.1f}x fewer blocks than eager, target is {:.1f}x".format(num_miners,
+				ratio, ALLOCATION_RATIO_TARGET))
+	return violations
+
+def run(sizes, repeat, latency, num_notifications, operations=None):
+	results = list()
+	for num_miners in sizes:
+		process, port = start_fake_server(num_miners, latency, num_notifications)
+		work_dir = tempfile.mkdtemp()
+		try:
+			client = get_default_client("127.0.0.1", port)
+			calls = max(MIN_REPEAT, min(repeat, MINER_CALLS_BUDGET // max(1, num_miners)))
+			for name, func in get_operations(client, work_dir):
+				if operations is None or name in operations:
+					result = measure(name, num_miners, func, calls)
+					results.append(result)
+					print_result(result)
+			client.close()
+		finally:
+			process.terminate()
+			process.wait()
+			shutil.rmtree(work_dir, ignore_errors=True)
+	return results
+
+def print_header():
+	print("{:<30} {:>7} {:>6} {:>10} {:>12} {:>10} {:>10} {:>10} {:>9} {:>10} {:>9}".format("operation", "miners", "calls", "calls/s", "miners/s", "p50 ms", "p95 ms", "p99 ms",
+		"peak MB", "held blks", "held MB"))
+
+def print_result(result):
+	print(("{operation:<30} {miners:>7} {calls:>6} {calls_per_s:>10.1f} {miners_per_s:>12.0f} {p50_ms:>10.2f} {p95_ms:>10.2f} {p99_ms:>10.2f} {peak_mb:>9.2f}" +
+		" {retained_blocks:>10} {retained_mb:>9.2f}").format(**result),
+		flush=True)
+
+def main():
+	#command-line parameters parsing
+	parser = argparse.ArgumentParser(description="Benchmarks AwesomeMiner tools against a local fake AwesomeMiner serving synthetic fleets.")
+	parser.add_argument("-sizes", "--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Fleet sizes, in miners, to benchmark.")
+	parser.add_argument("-repeat", "--repeat", nargs=1, type=int, default=[DEFAULT_REPEAT], help="Maximum number of measured calls per operation.")
+	parser.add_argument("-latency", "--latency", nargs=1, type=float, default=[0.0], help="Delay injected by the fake server before every response, in seconds.")
+	parser.add_argument("-notifications", "--notifications", nargs=1, type=int, default=[1000], help="Number of notifications served by the fake server.")
+	parser.add_argument("-op", "--operation", nargs="+", type=str, help="Names of operations to run, all by default.")
+	parser.add_argument("-json", "--json", nargs=1, type=str, help="Path to file where results are written as JSON.")
+	args = parser.parse_args()
+	# takes precedence over logging configuration done on import by the benchmarked tools
+	logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', level=logging.WARNING)
+	print_header()
+	results = run(args.sizes, args.repeat[0], args.latency[0], args.notifications[0], args.operation)
+	violations = check_allocations(results)
+	if args.json:
+		with open(args.json[0], "w") as f:
+			json.dump(results, f, indent=2)
+	for violation in violations:
+		print("TARGET MISSED: " + violation)
+	sys.exit(1 if len(violations) > 0 else 0)
+
+if __name__ == "__main__":
+	main()
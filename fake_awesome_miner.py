@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from awesome_miner_structs import Pangolin, Ferm
+
+"""
+Local stand-in for AwesomeMiner web API serving synthetic fleets, used for benchmarking and testing the tools
+
+Serves /api/miners (with ETag revalidation), /api/notifications and the pool switch action.
+Fleets are generated deterministically from a seed, a share of miners is made faulty
+(offline, missing GPUs, GPU on default memory clock) so that reports have something to show.
+"""
+
+ASIC_GROUP = "S9"
+DEFAULT_MIX = (0.4, 0.4, 0.2)
+DEFAULT_POOLS = {1: "pool1", 2: "pool2"}
+"""
+Shares of faulty miners
+"""
+OFFLINE_SHARE = 0.05
+MISSING_GPUS_SHARE = 0.05
+RESET_GPU_SHARE = 0.1
+
+def _speed_info(hashrate):
+	return {"hashrate": "{:.2f} MH/s".format(hashrate / 1e6), "hashrateValue": hashrate, "avgHashrate": "{:.2f} MH/s".format(hashrate / 1e6)}
+
+def _status_info(status):
+	return {"statusDisplay": status, "statusLine3": ""}
+
+def _device(name, memory_clock, rng):
+	hashrate = rng.uniform(25e6, 32e6)
+	return {
+		"name": name,
+		"statusInfo": _status_info("Mining"),
+		"deviceInfo": {"deviceType": "GPU", "gpuClock": 1500, "gpuMemoryClock": memory_clock, "fanPercent": rng.randint(40, 90),
+			"temperature": rng.randint(50, 80)},
+		"speedInfo": _speed_info(hashrate),
+	}
+
+def generate_miner(miner_id, group, position, num_devices, default_memory_clock, rng):
+	""" Generates AwesomeMiner web API miner object, possibly faulty """
+	offline = rng.random() < OFFLINE_SHARE
+	if rng.random() < MISSING_GPUS_SHARE:
+		num_devices = max(0, num_devices - 2)
+	devices = [_device(("GPU " if group != ASIC_GROUP else "ASIC ") + str(device_position), 4400, rng) for device_position in range(num_devices)]
+	if len(devices) > 0 and default_memory_clock is not None and rng.random() < RESET_GPU_SHARE:
+		devices[rng.randrange(len(devices))]["deviceInfo"]["gpuMemoryClock"] = default_memory_clock
+	is_asic = group == ASIC_GROUP
+	return {
+		"id": miner_id,
+		"name": group + str(position // 10) + "_" + str(position % 10),
+		"hostname": "10." + str(miner_id // 65536 % 256) + "." + str(miner_id // 256 % 256) + "." + str(miner_id % 256),
+		"pool": DEFAULT_POOLS[1],
+		"temperature": rng.randint(50, 80),
+		"statusInfo": _status_info("Offline" if offline else "Mining"),
+		"speedInfo": _speed_info(0.0 if offline else sum([device["speedInfo"]["hashrateValue"] for device in devices])),
+		"coinInfo": {"displayName": "ETH", "revenuePerDay": "$5.00", "revenuePerDayValue": 5.0},
+		"hasGpu": not is_asic,
+		"hasAsic": is_asic,
+		"hasPga": False,
+		"gpuList": devices if not is_asic else [],
+		"asicList": devices if is_asic else [],
+	}
+
+def generate_fleet(num_miners, mix=DEFAULT_MIX, pang_gpus=Pangolin.NUM_GPUS, ferm_gpus=Ferm.NUM_GPUS, asic_boards=3, seed=0):
+	""" Generates AwesomeMiner web API 'groupList' object
+
+	Args:
+		num_miners: total number of miners
+		mix: shares of Pangolin, Ferm and ASIC miners
+		pang_gpus, ferm_gpus, asic_boards: number of devices per miner of each group
+		seed: seed of the generator, same arguments produce the same fleet
+
+	"""
+	rng = random.Random(seed)
+	groups = [(Pangolin.GROUP, pang_gpus, Pangolin.DEFAULT_MEMORY_CLOCK), (Ferm.GROUP, ferm_gpus, Ferm.DEFAULT_MEMORY_CLOCK), (ASIC_GROUP, asic_boards, None)]
+	total_share = float(sum(mix))
+	group_list = list()
+	miner_id = 0
+	for group_position, (group, num_devices, default_memory_clock) in enumerate(groups):
+		if group_position < len(groups) - 1:
+			group_size = int(round(num_miners * mix[group_position] / total_share))
+		else:
+			group_size = num_miners - miner_id
+		miners = list()
+		for position in range(group_size):
+			miners.append(generate_miner(miner_id, group, position, num_devices, default_memory_clock, rng))
+			miner_id += 1
+		group_list.append({"id": group_position + 1, "name": group, "minerList": miners})
+	return group_list
+
+def generate_notifications(group_list, num_notifications, seed=0):
+	""" Generates AwesomeMiner web API 'notificationList' object about random miners, with some duplicates """
+	rng = random.Random(seed)
+	miner_names = [miner_json["name"] for group in group_list for miner_json in group["minerList"]]
+	notifications = list()
+	for position in range(num_notifications):
+		notifications.append({
+			"id": position,
+			"minerName": rng.choice(miner_names) if miner_names else "",
+			"source": "Trigger",
+			"message": rng.choice(["Miner offline", "GPU temperature above limit", "Hashrate below limit"]),
+		})
+	return notifications
+
+
+class FakeAwesomeMiner(object):
+
+	""" Synthetic fleet served over HTTP from a background thread
+
+	Attributes:
+		latency: delay, in seconds, injected before every response
+		request_count: number of requests served
+
+	"""
+
+	def __init__(self, group_list, notifications, latency=0.0, pools=DEFAULT_POOLS, host="127.0.0.1", port=0):
+		self.latency = latency
+		self.pools = pools
+		self.request_count = 0
+		self._lock = threading.Lock()
+		self._group_list = group_list
+		self._miners_by_id = {miner_json["id"]: miner_json for group in group_list for miner_json in group["minerList"]}
+		self._miners_body = None
+		self._miners_etag = None
+		self._notifications_body = json.dumps({"notificationList": notifications}).encode('utf-8')
+		self._server = ThreadingHTTPServer((host, port), _FakeRequestHandler)
+		self._server.daemon_threads = True
+		self._server.fake = self
+		self._thread = None
+
+	@property
+	def port(self):
+		return self._server.server_address[1]
+
+	def start(self):
+		self._thread = threading.Thread(target=self._server.serve_forever, name="FakeAwesomeMiner", daemon=True)
+		self._thread.start()
+		return self.port
+
+	def serve_forever(self):
+		""" Serves requests in the calling thread until interrupted """
+		try:
+			self._server.serve_forever()
+		finally:
+			self._server.server_close()
+
+	def stop(self):
+		self._server.shutdown()
+		self._server.server_close()
+
+	def get_miners_body(self):
+		with self._lock:
+			if self._miners_body is None:
+				self._miners_body = json.dumps({"groupList": self._group_list}).encode('utf-8')
+				self._miners_etag = '"' + hashlib.sha1(self._miners_body).hexdigest() + '"'
+			return self._miners_body, self._miners_etag
+
+	def get_notifications_body(self):
+		return self._notifications_body
+
+	def switch_pool(self, miner_id, pool_id):
+		with self._lock:
+			miner_json = self._miners_by_id.get(miner_id)
+			if miner_json is None or pool_id not in self.pools:
+				return False
+			miner_json["pool"] = self.pools[pool_id]
+			self._miners_body = None
+			return True
+
+
+class _FakeRequestHandler(BaseHTTPRequestHandler):
+
+	def do_GET(self):
+		fake = self.server.fake
+		fake.request_count += 1
+		if fake.latency > 0:
+			time.sleep(fake.latency)
+		url = urlparse(self.path)
+		query = parse_qs(url.query)
+		if url.path == "/api/miners":
+			body, etag = fake.get_miners_body()
+			if self.headers.get("If-None-Match") == etag:
+				self.send_response(304)
+				self.send_header("ETag", etag)
+				self.end_headers()
+				return
+			self._reply(200, body, etag)
+		elif url.path == "/api/notifications":
+			self._reply(200, fake.get_notifications_body())
+		elif url.path.startswith("/api/miners/") and query.get("action") == ["switchpool"]:
+			try:
+				switched = fake.switch_pool(int(url.path.rsplit("/", 1)[1]), int(query["poolid"][0]))
+			except (ValueError, KeyError):
+				switched = False
+			self._reply(200 if switched else 404, json.dumps({"success": switched}).encode('utf-8'))
+		else:
+			self._reply(404, b"{}")
+
+	do_POST = do_GET
+
+	def _reply(self, status, body, etag=None):
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		if etag is not None:
+			self.send_header("ETag", etag)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+def main():
+	#command-line parameters parsing
+	parser = argparse.ArgumentParser(description="Serves synthetic AwesomeMiner web API fleet on a local port.")
+	parser.add_argument("-miners", "--miners", nargs=1, type=int, default=[1000], help="Total number of miners.")
+	parser.add_argument("-mix", "--mix", nargs=3, type=float, default=list(DEFAULT_MIX), help="Shares of Pangolin, Ferm and ASIC miners.")
+	parser.add_argument("-pang_gpus", "--pang_gpus", nargs=1, type=int, default=[Pangolin.NUM_GPUS], help="Number of GPUs per Pangolin.")
+	parser.add_argument("-ferm_gpus", "--ferm_gpus", nargs=1, type=int, default=[Ferm.NUM_GPUS], help="Number of GPUs per Ferm.")
+	parser.add_argument("-asic_boards", "--asic_boards", nargs=1, type=int, default=[3], help="Number of boards per ASIC.")
+	parser.add_argument("-notifications", "--notifications", nargs=1, type=int, default=[100], help="Number of notifications.")
+	parser.add_argument("-latency", "--latency", nargs=1, type=float, default=[0.0], help="Delay injected before every response, in seconds.")
+	parser.add_argument("-seed", "--seed", nargs=1, type=int, default=[0], help="Seed of the fleet generator.")
+	parser.add_argument("-port", "--port", nargs=1, type=int, default=[0], help="Port to listen to, a free one is picked by default.")
+	args = parser.parse_args()
+	group_list = generate_fleet(args.miners[0], args.mix, args.pang_gpus[0], args.ferm_gpus[0], args.asic_boards[0], args.seed[0])
+	notifications = generate_notifications(group_list, args.notifications[0], args.seed[0])
+	fake = FakeAwesomeMiner(group_list, notifications, args.latency[0], port=args.port[0])
+	# benchmark reads the port from the first line of the output
+	print(fake.port, flush=True)
+	try:
+		fake.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+if __name__ == "__main__":
+	main()
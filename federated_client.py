@@ -0,0 +1,227 @@
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from awesome_miner_structs import DeviceType, DEFAULT_MINER_REGISTRY
+from awesome_miner_client import get_default_client, DEFAULT_POOL_SIZE
+from awesome_miner_utils import load_awesome_miner_instances
+import shared_snapshot
+
+"""
+Federated view over multiple AwesomeMiner instances
+
+Every request is sent to all instances at once, so a federated call takes as long as the slowest
+instance (bounded by the timeouts of its AwesomeMinerClient) rather than the sum of all of them.
+Results are merged into a single view in which every miner and notification is paired with the name
+of the instance it came from, and control actions are sent to the instance that owns the miner.
+An unreachable instance doesn't fail the whole view, it is reported in FederatedFleet.unreachable.
+"""
+
+logger = logging.getLogger(__name__)
+
+class FederatedFleet(object):
+
+	""" Fleet snapshots and notifications of multiple AwesomeMiner instances taken at the same time
+
+	Attributes:
+		snapshots: ordered dictionary mapping instance names to FleetSnapshot objects
+		notification_lists: ordered dictionary mapping instance names to NotificationList objects
+		unreachable: names of instances whose snapshot or notifications couldn't be collected
+
+	"""
+
+	def __init__(self, snapshots, notification_lists, unreachable):
+		self.snapshots = snapshots
+		self.notification_lists = notification_lists
+		self.unreachable = unreachable
+
+	def get_device_by_ip(self, ip_addr):
+		""" Returns a tuple of instance name and Miner object, or None if no instance knows the IP address """
+		for instance, snapshot in self.snapshots.items():
+			miner = snapshot.index.get_by_host(ip_addr)
+			if miner is not None:
+				return instance, miner
+		return None
+
+	def get_device_by_name(self, device_name):
+		""" Returns a tuple of instance name and Miner object, or None if no instance knows the name """
+		for instance, snapshot in self.snapshots.items():
+			miner = snapshot.index.get_by_name(device_name)
+			if miner is not None:
+				return instance, miner
+		return None
+
+	def get_owner(self, device_name):
+		""" Returns name of the instance owning the miner, or None """
+		owned_miner = self.get_device_by_name(device_name)
+		return owned_miner[0] if owned_miner is not None else None
+
+	def collect_devices_of_type(self, device_type=DeviceType.ALL):
+		""" Returns a list of tuples of instance name and Miner subclass of the given device type """
+		miners = list()
+		miner_class = DEFAULT_MINER_REGISTRY.get_type_class(device_type)
+		if miner_class is None:
+			return miners
+		for instance, snapshot in self.snapshots.items():
+			for miner_json in snapshot.index.get_type(device_type):
+				miners.append((instance, miner_class(miner_json)))
+		return miners
+
+	def collect_devices_from_groups(self, groups):
+		""" Returns a list of tuples of instance name and Miner subclass (based on the group) of the given groups """
+		miners = list()
+		for instance, snapshot in self.snapshots.items():
+			for group, group_miners in snapshot.index.by_group.items():
+				if group in groups:
+					for miner_json in group_miners:
+						miners.append((instance, DEFAULT_MINER_REGISTRY.create_miner(group, miner_json)))
+		return miners
+
+	def iter_notifications(self):
+		""" Yields tuples of instance name and Notification object """
+		for instance, notification_list in self.notification_lists.items():
+			for notification in notification_list.notifications:
+				yield instance, notification
+
+	def get_notifications_with_prefix(self, prefix):
+		""" Returns a list of tuples of instance name and Notification object about miners whose names start with prefix """
+		notifications = list()
+		for instance, notification_list in self.notification_lists.items():
+			for notification in notification_list.get_notifications_with_prefix(prefix):
+				notifications.append((instance, notification))
+		return notifications
+
+
+class FederatedClient(object):
+
+	""" Client of multiple AwesomeMiner instances, each one reached through its shared AwesomeMinerClient
+
+	Args:
+		instances: list of tuples of instance name, PC name and port, see awesome_miner_utils.load_awesome_miner_instances
+
+	"""
+
+	def __init__(self, instances, workers_per_instance=DEFAULT_POOL_SIZE):
+		self.addresses = OrderedDict()
+		self.clients = OrderedDict()
+		for name, pc_name, awesome_miner_port in instances:
+			self.addresses[name] = (pc_name, awesome_miner_port)
+			self.clients[name] = get_default_client(pc_name, awesome_miner_port)
+		self._executor = ThreadPoolExecutor(max_workers=max(1, workers_per_instance * len(self.clients)))
+
+	def close(self):
+		self._executor.shutdown(wait=False)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, traceback):
+		self.close()
+
+	def _call(self, instance, func, *args):
+		""" Calls func of the instance's client in the thread pool, returns a future of its result or None if it raised """
+		def call():
+			try:
+				return func(*args)
+			except Exception as e:
+				logger.error("Request to AwesomeMiner instance %s failed: %s", instance, e)
+				return None
+		return self._executor.submit(call)
+
+	def _call_all(self, method, *args):
+		""" Calls the method of all clients at once, returns an ordered dictionary mapping instance names to futures """
+		return OrderedDict([(instance, self._call(instance, getattr(client, method), *args)) for instance, client in self.clients.items()])
+
+	def get_fleet(self, cursors=None, notifications=True):
+		""" Collects fleet snapshots and notifications of all instances concurrently
+
+		Args:
+			cursors: optional dictionary mapping instance names to NotificationCursor objects,
+				only notifications a cursor hasn't seen yet are collected from its instance
+			notifications: if False, notifications are not collected
+
+		Returns:
+			a FederatedFleet object
+
+		"""
+		snapshot_futures = self._call_all("get_fleet_snapshot")
+		notification_futures = OrderedDict()
+		if notifications:
+			for instance, client in self.clients.items():
+				cursor = cursors.get(instance) if cursors is not None else None
+				if cursor is None:
+					notification_futures[instance] = self._call(instance, client.collect_notifications_data)
+				else:
+					notification_futures[instance] = self._call(instance, client.collect_new_notifications, cursor)
+		snapshots = OrderedDict()
+		notification_lists = OrderedDict()
+		unreachable = list()
+		for instance in self.clients:
+			snapshot = snapshot_futures[instance].result()
+			notification_list = notification_futures[instance].result() if instance in notification_futures else None
+			if snapshot is not None:
+				snapshots[instance] = snapshot
+			if notification_list is not None:
+				notification_lists[instance] = notification_list
+			if snapshot is None or (notifications and notification_list is None):
+				logger.error("AwesomeMiner instance %s is unreachable", instance)
+				unreachable.append(instance)
+		return FederatedFleet(snapshots, notification_lists, unreachable)
+
+	def find_device(self, host=None, name=None):
+		""" Looks up miner by its hostname or, if host is None, by its name in all instances concurrently
+
+		Lookups go through snapshots shared by concurrently running processes, see shared_snapshot.py,
+		so that the client suits short-lived processes started in bulk.
+
+		Returns:
+			a tuple of instance name and Miner object, the first configured instance wins if more of them
+			know the miner, or None if no instance does
+
+		"""
+		futures = OrderedDict()
+		for instance, (pc_name, awesome_miner_port) in self.addresses.items():
+			futures[instance] = self._call(instance, shared_snapshot.lookup_device, pc_name, awesome_miner_port, host, name)
+		for instance, future in futures.items():
+			miner = future.result()
+			if miner is not None:
+				return instance, miner
+		return None
+
+	def switch_pool(self, instance, miner_id, pool_id):
+		""" Switches miner of the given instance to the pool, see AwesomeMinerClient.switch_pool """
+		return self.clients[instance].switch_pool(miner_id, pool_id)
+
+	def switch_pools(self, owned_miner_ids, pool_ids):
+		""" Switches miners of all instances to the pool concurrently, each through the instance owning it
+
+		Args:
+			owned_miner_ids: list of tuples of instance name and AwesomeMiner identifier of the miner
+			pool_ids: AwesomeMiner identifier of the pool, or, as pools are identified by each instance on its own,
+				a dictionary mapping instance names to identifiers of the pool
+
+		Returns:
+			a dictionary mapping tuples of instance name and miner identifier to True if the switch succeeded, otherwise, False
+
+		"""
+		futures = OrderedDict()
+		for instance, miner_id in owned_miner_ids:
+			pool_id = pool_ids.get(instance) if isinstance(pool_ids, dict) else pool_ids
+			if pool_id is None:
+				logger.error("No pool to switch miner %s of AwesomeMiner instance %s to", str(miner_id), instance)
+				futures[(instance, miner_id)] = None
+				continue
+			futures[(instance, miner_id)] = self._call(instance, self.clients[instance].switch_pool, miner_id, pool_id)
+		return {key: (future.result() is True if future is not None else False) for key, future in futures.items()}
+
+
+def load_federated_client(path):
+	""" Creates FederatedClient of all AwesomeMiner instances configured in the file, see awesome_miner_utils.load_awesome_miner_instances
+
+	Returns:
+		a FederatedClient object if executed successfully, otherwise, None
+
+	"""
+	instances = load_awesome_miner_instances(path)
+	if instances is None:
+		return None
+	return FederatedClient(instances)
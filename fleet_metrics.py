@@ -0,0 +1,132 @@
+import numpy as np
+
+"""
+Columnar view of GPU miners' metrics
+
+Metrics of every GPU in the fleet are stored in flat NumPy arrays, GPUs of a miner being
+adjacent, so that fleet-wide checks are single vectorized operations instead of
+per-device attribute lookups. Missing values are stored as NaN.
+"""
+
+class FleetMetrics(object):
+
+	""" Per-miner and per-GPU metrics of a set of miners
+
+	Attributes:
+		miner_names: list of miner names
+		miner_status: list of miners' status display strings
+		miner_pool: list of pools miners are mining on
+		miner_hashrate: hashrate of each miner
+		group_names: list of distinct group names
+		miner_group: index of each miner's group in group_names
+		running: True for each miner that is mining
+		gpu_count: number of GPUs reported by each miner
+		gpu_offsets: GPUs of miner i are at positions gpu_offsets[i]:gpu_offsets[i + 1] of per-GPU arrays
+		gpu_miner: index of the miner each GPU belongs to
+		gpu_names: list of GPU names
+		memory_clock, core_clock: per-GPU clocks, in MHz
+		fan_percent, temperature, hashrate: per-GPU fan speed, temperature and hashrate
+
+	"""
+
+	def __init__(self, group_miner_json):
+		"""
+		Args:
+			group_miner_json: iterable of (group name, miner JSON object) tuples,
+				e.g. output of awesome_miner_stream.iter_miner_json
+
+		"""
+		self.miner_names = list()
+		self.miner_status = list()
+		self.miner_pool = list()
+		miner_hashrate = list()
+		self.group_names = list()
+		group_positions = dict()
+		miner_group = list()
+		gpu_count = list()
+		self.gpu_names = list()
+		memory_clock = list()
+		core_clock = list()
+		fan_percent = list()
+		temperature = list()
+		hashrate = list()
+		for group, miner_json in group_miner_json:
+			group_position = group_positions.get(group)
+			if group_position is None:
+				group_position = len(self.group_names)
+				group_positions[group] = group_position
+				self.group_names.append(group)
+			miner_group.append(group_position)
+			self.miner_names.append(miner_json['name'])
+			self.miner_status.append(miner_json['statusInfo']['statusDisplay'])
+			self.miner_pool.append(miner_json['pool'])
+			miner_hashrate.append(miner_json['speedInfo']['hashrateValue'])
+			# miners without GPUs, e.g. ASICs, have no GPU rows
+			gpu_list = miner_json.get('gpuList') or list()
+			gpu_count.append(len(gpu_list))
+			for gpu_json in gpu_list:
+				device_info = gpu_json['deviceInfo']
+				self.gpu_names.append(gpu_json['name'])
+				memory_clock.append(device_info['gpuMemoryClock'])
+				core_clock.append(device_info['gpuClock'])
+				fan_percent.append(device_info['fanPercent'])
+				temperature.append(device_info['temperature'])
+				hashrate.append(gpu_json['speedInfo']['hashrateValue'])
+		self.miner_group = np.array(miner_group, dtype=np.intp)
+		self.running = np.array([status == "Mining" for status in self.miner_status], dtype=bool)
+		self.miner_hashrate = np.array(miner_hashrate, dtype=float)
+		self.gpu_count = np.array(gpu_count, dtype=np.intp)
+		self.gpu_offsets = np.zeros(len(gpu_count) + 1, dtype=np.intp)
+		np.cumsum(self.gpu_count, out=self.gpu_offsets[1:])
+		self.gpu_miner = np.repeat(np.arange(len(gpu_count), dtype=np.intp), self.gpu_count)
+		# None is converted to NaN for float arrays
+		self.memory_clock = np.array(memory_clock, dtype=float)
+		self.core_clock = np.array(core_clock, dtype=float)
+		self.fan_percent = np.array(fan_percent, dtype=float)
+		self.temperature = np.array(temperature, dtype=float)
+		self.hashrate = np.array(hashrate, dtype=float)
+
+	@property
+	def num_miners(self):
+		return len(self.miner_names)
+
+	@property
+	def num_gpus(self):
+		return len(self.gpu_names)
+
+	def per_group(self, values, default=np.nan):
+		""" Expands a group name to value mapping into a per-miner array
+
+		Args:
+			values: dictionary mapping group names to values, e.g. {Pangolin.GROUP: Pangolin.NUM_GPUS}
+			default: value of miners whose group is not in values
+
+		"""
+		group_values = np.array([values.get(group, default) for group in self.group_names], dtype=float)
+		return group_values[self.miner_group] if len(group_values) else np.zeros(0)
+
+	def per_gpu(self, miner_values):
+		""" Expands a per-miner array or scalar into a per-GPU array """
+		return np.repeat(np.broadcast_to(miner_values, self.gpu_count.shape), self.gpu_count)
+
+	def miners_with_any(self, gpu_mask):
+		""" Reduces per-GPU boolean mask to a per-miner one, True if any GPU of the miner matches """
+		return np.bincount(self.gpu_miner, weights=gpu_mask, minlength=self.num_miners) > 0
+
+	def gpus_on_memory_clock(self, memory_clock):
+		""" Per-GPU mask of GPUs running on the given memory clock, a scalar or a per-miner array """
+		return self.memory_clock == self.per_gpu(memory_clock)
+
+	def gpus_over_temperature(self, threshold):
+		""" Per-GPU mask of GPUs hotter than threshold, a scalar or a per-miner array """
+		return self.temperature > self.per_gpu(threshold)
+
+	def miners_missing_gpus(self, num_gpus):
+		""" Per-miner mask of miners reporting fewer GPUs than num_gpus, a scalar or a per-miner array """
+		return self.gpu_count < num_gpus
+
+	def get_gpu_names(self, miner_position, gpu_mask):
+		""" Returns names of miner's GPUs selected by per-GPU mask """
+		start = self.gpu_offsets[miner_position]
+		end = self.gpu_offsets[miner_position + 1]
+		return [self.gpu_names[start + position] for position in np.flatnonzero(gpu_mask[start:end])]
@@ -0,0 +1,219 @@
+import logging
+import numpy as np
+from awesome_miner_structs import Pangolin, Ferm
+from awesome_miner_utils import load_config_file
+
+"""
+Declarative health rules of miners, evaluated in a single pass over fleet metrics
+
+Rules are defined per AwesomeMiner group in "RULES:<group name>" sections of the .ini configuration
+file, while the "RULES" section holds defaults shared by all those groups, e.g.:
+
+	[RULES]
+	max_temperature = 85
+
+	[RULES:Pang]
+	num_gpus = 8
+	default_memory_clock = 4007
+	allowed_pools = pool1.example.com, pool2.example.com
+
+Supported rules:
+	num_gpus: miner reports fewer GPUs
+	default_memory_clock, default_core_clock: GPU runs on default (i.e. reset) clock, in MHz
+	max_temperature: GPU is hotter
+	min_hashrate, min_gpu_hashrate: miner or GPU hashrate is lower
+	allowed_pools: comma-separated list of pools the miner may mine on
+A miner that is not mining is always reported; the other rules apply only to mining miners.
+"""
+
+logger = logging.getLogger(__name__)
+
+RULES_SECTION = "RULES"
+GROUP_RULES_PREFIX = "RULES:"
+"""
+Rules used if configuration file defines none
+"""
+DEFAULT_RULES = {
+	Pangolin.GROUP: {"num_gpus": Pangolin.NUM_GPUS, "default_memory_clock": Pangolin.DEFAULT_MEMORY_CLOCK},
+	Ferm.GROUP: {"num_gpus": Ferm.NUM_GPUS, "default_memory_clock": Ferm.DEFAULT_MEMORY_CLOCK},
+}
+
+def _parse_pools(value):
+	return [pool.strip() for pool in value.split(",") if len(pool.strip()) > 0]
+
+"""
+Rule name -> parser of its configuration value
+"""
+RULE_PARSERS = {
+	"num_gpus": int,
+	"default_memory_clock": float,
+	"default_core_clock": float,
+	"max_temperature": float,
+	"min_hashrate": float,
+	"min_gpu_hashrate": float,
+	"allowed_pools": _parse_pools,
+}
+
+class Violation(object):
+
+	""" Single rule violated by a miner """
+
+	__slots__ = ('miner_name', 'rule', 'message')
+
+	def __init__(self, miner_name, rule, message):
+		self.miner_name = miner_name
+		self.rule = rule
+		self.message = message
+
+
+def _format_gpu_names(gpu_names):
+	return ",".join(gpu_names) if len(gpu_names) > 1 else gpu_names[0]
+
+def _format_value(value):
+	return str(int(value)) if float(value).is_integer() else str(value)
+
+"""
+Each check takes FleetMetrics and per-miner array of rule values (None for allowed_pools,
+which reads the group mapping instead) and returns a per-miner mask of violating miners
+and a per-GPU mask of violating GPUs (None for miner-level rules).
+"""
+def _check_num_gpus(metrics, values, group_values):
+	return metrics.miners_missing_gpus(values), None
+
+def _check_default_memory_clock(metrics, values, group_values):
+	gpu_mask = metrics.gpus_on_memory_clock(values)
+	return metrics.miners_with_any(gpu_mask), gpu_mask
+
+def _check_default_core_clock(metrics, values, group_values):
+	gpu_mask = metrics.core_clock == metrics.per_gpu(values)
+	return metrics.miners_with_any(gpu_mask), gpu_mask
+
+def _check_max_temperature(metrics, values, group_values):
+	gpu_mask = metrics.gpus_over_temperature(values)
+	return metrics.miners_with_any(gpu_mask), gpu_mask
+
+def _check_min_hashrate(metrics, values, group_values):
+	return metrics.miner_hashrate < values, None
+
+def _check_min_gpu_hashrate(metrics, values, group_values):
+	gpu_mask = metrics.hashrate < metrics.per_gpu(values)
+	return metrics.miners_with_any(gpu_mask), gpu_mask
+
+def _check_allowed_pools(metrics, values, group_values):
+	miner_mask = np.zeros(metrics.num_miners, dtype=bool)
+	pools = np.array(metrics.miner_pool, dtype=object)
+	for group_position, group in enumerate(metrics.group_names):
+		if group in group_values:
+			miner_mask |= (metrics.miner_group == group_position) & ~np.isin(pools, group_values[group])
+	return miner_mask, None
+
+"""
+(rule name, check, message builder) in the order violations of a miner are reported,
+message builder takes FleetMetrics, miner position, names of violating GPUs and the rule value
+"""
+CHECKS = [
+	("num_gpus", _check_num_gpus,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " has only " + str(metrics.gpu_count[position]) + " GPUs running"),
+	("default_memory_clock", _check_default_memory_clock,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " has " + _format_gpu_names(gpu_names) + " running on default memory clock"),
+	("default_core_clock", _check_default_core_clock,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " has " + _format_gpu_names(gpu_names) + " running on default core clock"),
+	("max_temperature", _check_max_temperature,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " has " + _format_gpu_names(gpu_names) + " over " + _format_value(value) + " C"),
+	("min_hashrate", _check_min_hashrate,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " hashrate " + _format_value(metrics.miner_hashrate[position]) + " is below " + _format_value(value)),
+	("min_gpu_hashrate", _check_min_gpu_hashrate,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " has " + _format_gpu_names(gpu_names) + " hashing below " + _format_value(value)),
+	("allowed_pools", _check_allowed_pools,
+		lambda metrics, position, gpu_names, value: metrics.miner_names[position] + " mines on pool " + str(metrics.miner_pool[position]) + " that is not allowed"),
+]
+
+class HealthRules(object):
+
+	""" Health rules of AwesomeMiner groups compiled into a single evaluator
+
+	Only checks used by at least one group are run, each as a vectorized operation over
+	all miners and GPUs at once; groups that don't define a rule never violate it.
+	"""
+
+	def __init__(self, group_rules):
+		"""
+		Args:
+			group_rules: dictionary mapping group names to dictionaries mapping rule names to values
+
+		"""
+		self.groups = list(group_rules)
+		# rule name -> {group name: value}, only for rules defined by some group
+		self.rule_values = dict()
+		for rule in RULE_PARSERS:
+			values = {group: rules[rule] for group, rules in group_rules.items() if rules.get(rule) is not None}
+			if len(values) > 0:
+				self.rule_values[rule] = values
+		self._checks = [(rule, check, describe) for rule, check, describe in CHECKS if rule in self.rule_values]
+
+	def get_group_values(self, rule):
+		""" Returns dictionary mapping group names to value of the given rule, e.g. for SnapshotDiffer default_memory_clocks """
+		return self.rule_values.get(rule, dict())
+
+	def evaluate(self, metrics):
+		""" Evaluates all rules over FleetMetrics
+
+		Returns:
+			list of Violation objects, grouped by miner in the order of miners in metrics
+
+		"""
+		running = metrics.running
+		results = list()
+		faulty = ~running
+		for rule, check, describe in self._checks:
+			group_values = self.rule_values[rule]
+			values = metrics.per_group(group_values) if rule != "allowed_pools" else None
+			miner_mask, gpu_mask = check(metrics, values, group_values)
+			miner_mask = miner_mask & running
+			faulty = faulty | miner_mask
+			results.append((rule, miner_mask, gpu_mask, values, describe))
+		violations = list()
+		for position in np.flatnonzero(faulty):
+			if not running[position]:
+				violations.append(Violation(metrics.miner_names[position], "status", metrics.miner_names[position] + " - " + metrics.miner_status[position]))
+				continue
+			for rule, miner_mask, gpu_mask, values, describe in results:
+				if miner_mask[position]:
+					gpu_names = metrics.get_gpu_names(position, gpu_mask) if gpu_mask is not None else None
+					value = values[position] if values is not None else None
+					violations.append(Violation(metrics.miner_names[position], rule, describe(metrics, position, gpu_names, value)))
+		return violations
+
+
+def load_health_rules(path):
+	""" Loads health rules from RULES sections of .ini configuration file
+
+	Returns:
+		a HealthRules object; if the file defines no group rules, DEFAULT_RULES are used together with shared rules.
+		Rules with invalid values are logged and ignored
+
+	"""
+	config_values = load_config_file(path) or dict()
+	shared_rules = _parse_rules(RULES_SECTION, config_values.get(RULES_SECTION, dict()))
+	group_rules = dict()
+	for section, values in config_values.items():
+		if section.startswith(GROUP_RULES_PREFIX):
+			group_rules[section[len(GROUP_RULES_PREFIX):]] = _parse_rules(section, values)
+	if len(group_rules) == 0:
+		logger.debug("No group health rules defined in %s, using default ones", path)
+		group_rules = DEFAULT_RULES
+	# group rules override shared ones
+	return HealthRules({group: dict(shared_rules, **rules) for group, rules in group_rules.items()})
+
+def _parse_rules(section, values):
+	rules = dict()
+	for rule, value in values.items():
+		parser = RULE_PARSERS.get(rule)
+		if parser is None:
+			logger.error("Unknown health rule %s in section %s! Skipping...", rule, section)
+			continue
+		try:
+			rules[rule] = parser(value)
+		except ValueError:
+			logger.error("Invalid value %s of health rule %s in section %s! Skipping...", value, rule, section)
+	return rules
@@ -0,0 +1,260 @@
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+"""
+Timing hooks of AwesomeMiner client calls collected into in-process histograms
+
+Each instrumented call records time to first byte, download time, response size, json.loads time,
+object construction time and item counts, labelled with the name of the call. Histograms are
+exported in Prometheus text format, either to a file (e.g. for node_exporter textfile collector)
+or over HTTP, and every call can be logged as a single key=value line.
+
+Disabled by default; while disabled, hooks cost a single global lookup. Set AWESOME_MINER_INSTRUMENTATION
+environment variable to 1 to enable structured log lines in any tool without changing it.
+"""
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "awesome_miner_"
+ENVIRONMENT_VARIABLE = "AWESOME_MINER_INSTRUMENTATION"
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+BYTES_BUCKETS = [1024 * 4 ** exponent for exponent in range(11)]
+COUNT_BUCKETS = [1, 10, 100, 1000, 10000, 100000]
+"""
+Metric name -> (buckets, help text); metrics ending with _seconds are logged with 4 decimal places
+"""
+METRICS = {
+	"call_seconds": (SECONDS_BUCKETS, "Total duration of the call"),
+	"ttfb_seconds": (SECONDS_BUCKETS, "Time from sending request to receiving response headers"),
+	"download_seconds": (SECONDS_BUCKETS, "Time spent reading response body"),
+	"response_bytes": (BYTES_BUCKETS, "Size of response body"),
+	"json_loads_seconds": (SECONDS_BUCKETS, "Time spent in json.loads"),
+	"construction_seconds": (SECONDS_BUCKETS, "Time spent constructing objects from JSON"),
+	"items": (COUNT_BUCKETS, "Number of miners or notifications processed"),
+}
+
+class Histogram(object):
+
+	""" Cumulative histogram with fixed upper bounds of buckets """
+
+	__slots__ = ('buckets', 'counts', 'sum', 'count')
+
+	def __init__(self, buckets):
+		self.buckets = buckets
+		# the last count is the +Inf bucket
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+
+class Instrumentation(object):
+
+	""" Histograms of all instrumented calls keyed by metric name and call name """
+
+	def __init__(self, log_lines=True):
+		self.log_lines = log_lines
+		# (metric name, call name) -> Histogram
+		self._histograms = dict()
+		self._lock = threading.Lock()
+
+	def observe(self, metric, operation, value):
+		with self._lock:
+			histogram = self._histograms.get((metric, operation))
+			if histogram is None:
+				histogram = Histogram(METRICS[metric][0])
+				self._histograms[(metric, operation)] = histogram
+			histogram.observe(value)
+
+	def to_prometheus(self):
+		""" Returns all histograms in Prometheus text exposition format """
+		lines = list()
+		with self._lock:
+			histograms = sorted(self._histograms.items())
+			previous_metric = None
+			for (metric, operation), histogram in histograms:
+				name = METRIC_PREFIX + metric
+				if metric != previous_metric:
+					lines.append("# HELP " + name + " " + METRICS[metric][1])
+					lines.append("# TYPE " + name + " histogram")
+					previous_metric = metric
+				label = 'operation="' + operation + '"'
+				cumulative = 0
+				for bound, count in zip(histogram.buckets, histogram.counts):
+					cumulative += count
+					lines.append(name + "_bucket{" + label + ',le="' + repr(float(bound)) + '"} ' + str(cumulative))
+				lines.append(name + "_bucket{" + label + ',le="+Inf"} ' + str(histogram.count))
+				lines.append(name + "_sum{" + label + "} " + repr(histogram.sum))
+				lines.append(name + "_count{" + label + "} " + str(histogram.count))
+		return "\n".join(lines) + "\n"
+
+	def write_prometheus(self, path):
+		""" Atomically writes all histograms to a file in Prometheus text exposition format """
+		tmp_path = path + ".tmp"
+		with open(tmp_path, "w") as f:
+			f.write(self.to_prometheus())
+		os.replace(tmp_path, path)
+
+
+class _CallRecord(object):
+
+	__slots__ = ('operation', 'measurements')
+
+	def __init__(self, operation):
+		self.operation = operation
+		self.measurements = dict()
+
+
+_instrumentation = None
+_local = threading.local()
+
+def enable(log_lines=True):
+	""" Enables instrumentation, returns the Instrumentation object collecting histograms """
+	global _instrumentation
+	if _instrumentation is None:
+		_instrumentation = Instrumentation(log_lines)
+	_instrumentation.log_lines = log_lines
+	return _instrumentation
+
+def disable():
+	global _instrumentation
+	_instrumentation = None
+
+def get_instrumentation():
+	""" Returns the Instrumentation object, or None if instrumentation is disabled """
+	return _instrumentation
+
+def is_enabled():
+	return _instrumentation is not None
+
+def record(metric, value):
+	""" Records measurement of the call in progress, the measurements of the same metric within a call are summed """
+	if _instrumentation is None:
+		return
+	call_record = getattr(_local, 'record', None)
+	if call_record is None:
+		_instrumentation.observe(metric, "other", value)
+	else:
+		call_record.measurements[metric] = call_record.measurements.get(metric, 0) + value
+
+def instrumented(operation):
+	""" Decorator recording duration and measurements of the decorated call under the given name
+
+	Calls made from within an instrumented call are accounted to the outermost one.
+	"""
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if _instrumentation is None or getattr(_local, 'record', None) is not None:
+				return func(*args, **kwargs)
+			call_record = _CallRecord(operation)
+			_local.record = call_record
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				call_record.measurements["call_seconds"] = time.perf_counter() - start
+				_local.record = None
+				_finish(call_record)
+		return wrapper
+	return decorator
+
+def instrumented_generator(operation):
+	""" Decorator recording duration and measurements of the decorated generator under the given name
+
+	Measurements are recorded once the generator is exhausted or closed. Duration is the time spent
+	producing items, time the consumer spends between items is not accounted to the call, nor are calls
+	the consumer makes in the meantime. The number of yielded items is recorded as "items".
+	Generators iterated from within an instrumented call are accounted to the outermost call.
+	"""
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if _instrumentation is None or getattr(_local, 'record', None) is not None:
+				yield from func(*args, **kwargs)
+				return
+			call_record = _CallRecord(operation)
+			generator = func(*args, **kwargs)
+			elapsed = 0.0
+			items = 0
+			try:
+				while True:
+					_local.record = call_record
+					start = time.perf_counter()
+					try:
+						item = next(generator)
+					except StopIteration:
+						return
+					finally:
+						elapsed += time.perf_counter() - start
+						_local.record = None
+					items += 1
+					yield item
+			finally:
+				# measurements recorded by the generator's cleanup belong to the call too
+				_local.record = call_record
+				try:
+					generator.close()
+				finally:
+					_local.record = None
+				call_record.measurements["call_seconds"] = elapsed
+				call_record.measurements["items"] = call_record.measurements.get("items", 0) + items
+				_finish(call_record)
+		return wrapper
+	return decorator
+
+def _finish(call_record):
+	instrumentation = _instrumentation
+	if instrumentation is None:
+		return
+	for metric, value in call_record.measurements.items():
+		instrumentation.observe(metric, call_record.operation, value)
+	if instrumentation.log_lines:
+		fields = ["operation=" + call_record.operation]
+		for metric in METRICS:
+			if metric in call_record.measurements:
+				value = call_record.measurements[metric]
+				fields.append(metric + "=" + ("{:.4f}".format(value) if metric.endswith("_seconds") else str(value)))
+		logger.info(" ".join(fields))
+
+
+def serve_prometheus(port, host="127.0.0.1"):
+	""" Serves histograms in Prometheus text format at any path of the given port from a background thread
+
+	Returns:
+		the HTTP server, shut it down with shutdown()
+
+	"""
+	# only the resident daemon serves metrics, short-lived commands don't import http.server
+	from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+	class PrometheusRequestHandler(BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			instrumentation = _instrumentation
+			body = (instrumentation.to_prometheus() if instrumentation is not None else "").encode('utf-8')
+			self.send_response(200)
+			self.send_header("Content-Type", "text/plain; version=0.0.4")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			pass
+
+	server = ThreadingHTTPServer((host, port), PrometheusRequestHandler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, name="PrometheusExporter", daemon=True).start()
+	logger.info("Serving Prometheus metrics at %s:%d", host, server.server_address[1])
+	return server
+
+if os.environ.get(ENVIRONMENT_VARIABLE) == "1":
+	enable()
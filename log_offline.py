@@ -1,9 +1,8 @@
 import logging
 import argparse
-import csv
-import time
 import os.path
-from awesome_miner_utils import get_device_by_ip, load_config_file
+from awesome_miner_utils import get_shared_device_by_ip, load_awesome_miner_instances, select_awesome_miner_instance
+from offline_event_store import OfflineEventStore
 
 logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', filename='C:/Users/GM/Desktop/Utility_Scripts/logs/log_offline.log',level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,93 +12,133 @@ For example, if user defined delay is 90 seconds for "Wait" action, AwesomeMiner
 '''
 AM_DELAY = 96
 
-def log_offline(path, miner_name, user_delay):
-	""" Logs miner offline in .csv file
+def get_store_paths(path, export_path=None):
+	""" Resolves paths of the event store and of the .csv export
 
-	.csv file structure consists of 2 columns: "miner_name", "num_offline".
-	If miner goes offline, this function looks it up in the log file and, if found,
-	increments value in the "num_offline" column. If no restart attempts were logged
-	for the miner, adds new row in the file indicating that the miner has once went offline.
+	For backward compatibility, if path to a .csv log file is given, the event store is kept
+	next to it with .sqlite extension, counters of the .csv file are imported into it and, unless
+	another export path is given, the .csv file keeps being exported in its original format.
+
+	Returns:
+		a tuple of event store path, .csv export path (None if no export is needed) and
+		legacy .csv log path to import counters from (None if there is none)
+
+	"""
+	base_path, extension = os.path.splitext(path)
+	if extension.lower() != ".csv":
+		return path, export_path, None
+	return base_path + ".sqlite", export_path if export_path is not None else path, path
+
+def log_offline(path, miner_name, user_delay, export_path=None):
+	""" Logs miner offline in the event store
+
+	Event store keeps, for each miner, how many times it went offline ("offline") and when
+	this script was last invoked for it ("last_invoked"), plus the history of all invocations.
+	If the previous invocation for the miner happened within AwesomeMiner re-execution delay,
+	the miner is considered to stay offline and its counter is not incremented.
 
 	Args:
-		filename: path to log file
+		path: path to event store file; if path to .csv log file is given, see get_store_paths
 		miner_name: name of the miner that went offline
 		user_delay: user-defined delay for "Wait" action in AwesomeMiner rule, in seconds
+		export_path: optional path to .csv file with "miner_name", "offline", "last_invoked" columns
+			to be re-exported after the event is committed
 
 	"""
-	if not os.path.isfile(path):
-		logger.debug("Creating log file %s...", path)
-		open(path, "w").close()
-	reader = csv.reader(open(path, "r"), delimiter=",")
-	log_lines = list(reader)
-	logger.debug("Log lines after read: %s", str(log_lines))
-	# add file header if file is opened first time
-	if len(log_lines)==0:
-		log_lines.append(["miner_name", "offline", "last_invoked"])
-	miner_name_present = False
-	for log_line in log_lines:
-		if miner_name == log_line[0]:
-			miner_name_present = True
-			try:
-				num_offline = int(log_line[1])
-				last_invoked = int(log_line[2])
-				now = int(time.time())
-				# if delay between script invocations for this miner is less or equal than AwesomeMiner-defined delay,
-				# it is likely that miner stays offline and AwesomeMiner keeps triggering it at fixed intervals of time (am_delay)  
-				if (now - last_invoked) <= (user_delay + AM_DELAY + 1):
-					log_line[2] = str(now)
-				else:
-					num_offline+=1
-					log_line[1] = str(num_offline)
-					log_line[2] = str(now)
-			except:
-				logger.error("Failed to convert %s to int! Exiting...", row[1])
-				return
-	if not miner_name_present:
-		log_lines.append([miner_name, 1, str(int(time.time()))])
-	logger.debug("Log lines before write: %s", str(log_lines))
-	writer = csv.writer(open(path, "w", newline=''), delimiter=",")
-	writer.writerows(log_lines)
-
-def main():
-	#command-line parameters parsing
+	store_path, export_path, legacy_path = get_store_paths(path, export_path)
+	with OfflineEventStore(store_path) as store:
+		# emptiness is checked again under the write lock, see OfflineEventStore.import_csv
+		if legacy_path is not None and store.is_empty() and os.path.isfile(legacy_path):
+			logger.debug("Importing log file %s into %s...", legacy_path, store_path)
+			store.import_csv(legacy_path, only_if_empty=True)
+		num_offline = store.record_offline(miner_name, user_delay + AM_DELAY + 1)
+		if export_path is not None:
+			store.export_csv(export_path)
+	logger.debug("Miner %s went offline %d times", miner_name, num_offline)
+
+def log_offline_by_ip(ip_addr, pc_name, awesome_miner_port, path, user_delay, export_path=None):
+	""" Looks up miner by its IP address and logs it offline, see log_offline
+
+	Returns:
+		True if miner was found and logged offline, otherwise, False
+
+	"""
+	miner = get_shared_device_by_ip(ip_addr, pc_name, awesome_miner_port)
+	if miner is None:
+		logger.error("No miner with IP address %s is registered", ip_addr)
+		return False
+	logger.debug("Retrieved miner %s using IP %s", miner.name, ip_addr)
+	log_offline(path, miner.name, user_delay, export_path)
+	return True
+
+def log_offline_by_owner(ip_addr, federated_client, path, user_delay, export_path=None):
+	""" Looks up miner by its IP address in all AwesomeMiner instances of FederatedClient and logs it offline, see log_offline
+
+	Args:
+		federated_client: a FederatedClient object, or any object with its find_device method
+
+
+	Returns:
+		True if miner was found and logged offline, otherwise, False
+
+	"""
+	owned_miner = federated_client.find_device(host=ip_addr)
+	if owned_miner is None:
+		logger.error("No miner with IP address %s is registered with any AwesomeMiner instance", ip_addr)
+		return False
+	instance, miner = owned_miner
+	logger.debug("Retrieved miner %s of instance %s using IP %s", miner.name, instance, ip_addr)
+	log_offline(path, miner.name, user_delay, export_path)
+	return True
+
+def log_offline_in_instances(ip_addr, instances, path, user_delay, export_path=None):
+	""" Logs miner offline, resolving it with the only instance or with the instance owning it
+
+	Args:
+		instances: list of tuples of instance name, PC name and port, see awesome_miner_utils.load_awesome_miner_instances
+
+	Returns:
+		True if miner was found and logged offline, otherwise, False
+
+	"""
+	if len(instances) == 1:
+		instance, pc_name, port = instances[0]
+		return log_offline_by_ip(ip_addr, pc_name, port, path, user_delay, export_path)
+	# only multi-instance configurations pay for importing the federated client
+	from federated_client import FederatedClient
+	with FederatedClient(instances) as federated_client:
+		return log_offline_by_owner(ip_addr, federated_client, path, user_delay, export_path)
+
+def build_arg_parser():
 	parser = argparse.ArgumentParser(description="Maintains .csv file with statistics how often devices registered within AwesomeMiner turn off.")
 	parser.add_argument("-conf", "--config", nargs=1, type=str, required=True, help="""Path to AwesomeMiner .ini configuration file that 
 		consists of AwesomeMiner web API port number and PC name where AwesomeMiner control software is running.""")
 	parser.add_argument("-ip", "--ip_address", nargs=1, type=str, required=True, help="IP address of the machine that has turned off.")
-	parser.add_argument("-log", "--log_file", nargs=1, type=str, required=True, help="Path to file where this script will be logging miners' offline events")
+	parser.add_argument("-instance", "--instance", nargs=1, type=str, help="""Name of AwesomeMiner instance that fired the trigger, if configuration file
+		lists multiple instances. By default, the miner is looked up in all instances.""")
+	parser.add_argument("-log", "--log_file", nargs=1, type=str, required=True, help="""Path to event store file where this script will be logging miners' offline events.
+		If path to .csv file is given, the store is kept next to it with .sqlite extension and the .csv file is kept up to date.""")
+	parser.add_argument("-csv", "--export_csv", nargs=1, type=str, help="""Path to .csv file to export offline statistics to after every event,
+		by default, the .csv file given to -log, if any.""")
 	parser.add_argument("-delay", "--user_defined_delay", nargs=1, type=int, required=True, help="""Amount of seconds that AwesomeMiner is set to wait before invoking the script again.
 		Details: AwesomeMiner action associated with the \"Detect Offline\" trigger keeps getting invoked all the time while the miner stays offline.
 		Therefore, this script will keep logging that the same miner is going offline, however, in reality, it went offline once and doesn't come back online. 
 		To solve the issue, the proposed way is to add \"Wait\" action after \"Run Executable\" action. 
 		This parameter is, actually, number of seconds to \"Wait\" so that the script can figure out that miner is just staying offline and won't log another offline attempt.""") 
-	args = parser.parse_args()
+	return parser
+
+def main(argv=None):
+	""" Returns True if the miner was logged offline, otherwise, False """
+	#command-line parameters parsing
+	args = build_arg_parser().parse_args(argv)
 	logger.debug("Configuration file: %s, IP address: %s, Log file: %s, Delay: %d", args.config[0], args.ip_address[0], args.log_file[0], args.user_defined_delay[0])
 	#load configuration file
-	config_values = load_config_file(args.config[0])
-	logger.debug("Config values: %s", str(config_values))
-	if config_values is not None:
-		logger.debug("Configuration file is loaded!")
-	else:
-		logger.error("Configuration file failed to load!")
-		return
-	if config_values["AWESOMEMINER"] is None:
-		logger.error("Configuration file at %s has no \"AWESOMEMINER\" parameter group! Exiting...", args.config[0])
-		return
-	port = config_values["AWESOMEMINER"]["port"]
-	pc_name = config_values["AWESOMEMINER"]["pc_name"]
-	if port is None:
-		logger.error("Configuration file at %s doesn't contain AwesomeMiner port number! Exiting...", args.config[0])
-		return
-	if pc_name is None:
-		logger.error("Configuration file at %s doesn't contain PC name! Exiting...", args.config[0])
-		return
-	miner = get_device_by_ip(args.ip_address[0], pc_name, int(port))
-	if miner is not None:
-		logger.debug("Retrieved miner %s using IP %s", miner.name, args.ip_address[0])
-		log_offline(args.log_file[0], miner.name, args.user_defined_delay[0])
-	else:
-		logger.error("No miner with IP address %s is registered", miner_ip)
+	instances = load_awesome_miner_instances(args.config[0])
+	if instances is not None:
+		instances = select_awesome_miner_instance(instances, args.instance[0] if args.instance else None)
+	if instances is None:
+		return False
+	return log_offline_in_instances(args.ip_address[0], instances, args.log_file[0], args.user_defined_delay[0], args.export_csv[0] if args.export_csv else None)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -5,7 +5,7 @@ setup(
 		windows=["log_offline.py"],
 		options={
 				"py2exe":{
-					"includes":['awesome_miner_utils']
+					"includes":['awesome_miner_utils', 'offline_event_store']
 				}
 		}
 
@@ -0,0 +1,253 @@
+import argparse
+import logging
+import os
+import os.path
+import time
+import numpy as np
+
+"""
+Fixed-width, memory-mapped ring-buffer file recording metrics history of miners and their devices
+
+Every series (a miner, or a device of a miner) owns a preallocated slot holding the last
+samples_per_series samples, so the file never grows once created. Only the slot directory is read
+on open, and a time-range query touches just the pages of the queried series.
+
+File layout:
+	header | slot directory (max_series entries) | data (max_series * samples_per_series samples)
+
+Queries binary-search the samples of a slot by time, so samples of a series must be appended in
+non-decreasing time order. If the system clock steps backwards, append() records samples older
+than the latest sample of the series with the time of the latest sample until the clock catches up.
+"""
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AMTS"
+VERSION = 1
+"""
+Default capacity: 4096 series of 2880 samples, i.e. 24 hours of history at 30 s poll interval
+"""
+DEFAULT_MAX_SERIES = 4096
+DEFAULT_SAMPLES_PER_SERIES = 2880
+"""
+in seconds
+"""
+DEFAULT_POLL_INTERVAL = 30.0
+"""
+Series of a device are named <miner name><SERIES_SEPARATOR><device name>
+"""
+SERIES_SEPARATOR = "/"
+
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('max_series', '<u4'), ('samples_per_series', '<u4'), ('used_series', '<u4')])
+HEADER_SIZE = 64
+SLOT_DTYPE = np.dtype([('name', 'S64'), ('head', '<u4'), ('count', '<u4')])
+"""
+Missing values, as well as clocks and fan of miner series, are stored as NaN
+"""
+SAMPLE_DTYPE = np.dtype([('time', '<f8'), ('hashrate', '<f4'), ('temperature', '<f4'), ('clock', '<f4'), ('memory_clock', '<f4'), ('fan_percent', '<f4')])
+"""
+DeviceIoControl code marking a file sparse on NTFS
+"""
+FSCTL_SET_SPARSE = 0x000900C4
+
+class MetricsRecorder(object):
+
+	""" Ring-buffer metrics file, created on first use with the given capacity
+
+	A single process is expected to record into a file at a time, any number of processes may query it.
+	"""
+
+	def __init__(self, path, max_series=DEFAULT_MAX_SERIES, samples_per_series=DEFAULT_SAMPLES_PER_SERIES):
+		self.path = path
+		if not os.path.isfile(path):
+			self._create(path, max_series, samples_per_series)
+		self._header = np.memmap(path, dtype=HEADER_DTYPE, mode='r+', offset=0, shape=(1,))
+		if self._header['magic'][0] != MAGIC or self._header['version'][0] != VERSION:
+			raise ValueError(path + " is not a metrics recorder file")
+		self.max_series = int(self._header['max_series'][0])
+		self.samples_per_series = int(self._header['samples_per_series'][0])
+		self._slots = np.memmap(path, dtype=SLOT_DTYPE, mode='r+', offset=HEADER_SIZE, shape=(self.max_series,))
+		self._samples = np.memmap(path, dtype=SAMPLE_DTYPE, mode='r+', offset=HEADER_SIZE + SLOT_DTYPE.itemsize * self.max_series,
+			shape=(self.max_series, self.samples_per_series))
+		used_series = int(self._header['used_series'][0])
+		self._positions = {name.decode('utf-8'): position for position, name in enumerate(self._slots['name'][:used_series])}
+
+	@staticmethod
+	def _create(path, max_series, samples_per_series):
+		size = HEADER_SIZE + SLOT_DTYPE.itemsize * max_series + SAMPLE_DTYPE.itemsize * max_series * samples_per_series
+		header = np.zeros(1, dtype=HEADER_DTYPE)
+		header['magic'] = MAGIC
+		header['version'] = VERSION
+		header['max_series'] = max_series
+		header['samples_per_series'] = samples_per_series
+		tmp_path = path + ".tmp"
+		with open(tmp_path, "wb") as f:
+			# extending a sparse file allocates no disk space, pages are allocated as slots fill up;
+			# NTFS files are only sparse if flagged so, elsewhere it depends on the file system
+			if os.name == 'nt' and not _set_sparse(f):
+				logger.warning("Failed to mark %s sparse, all %d bytes are allocated up front", tmp_path, size)
+			f.truncate(size)
+			f.write(header.tobytes())
+		os.replace(tmp_path, path)
+		logger.info("Created metrics file %s of %d bytes for %d series", path, size, max_series)
+
+	def close(self):
+		self.flush()
+		del self._samples, self._slots, self._header
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, traceback):
+		self.close()
+
+	def flush(self):
+		self._samples.flush()
+		self._slots.flush()
+		self._header.flush()
+
+	@property
+	def series_names(self):
+		return list(self._positions)
+
+	def _get_position(self, name):
+		position = self._positions.get(name)
+		if position is not None:
+			return position
+		encoded_name = name.encode('utf-8')
+		if len(encoded_name) > SLOT_DTYPE['name'].itemsize:
+			logger.error("Series name %s is too long, not recording it", name)
+			return None
+		position = len(self._positions)
+		if position >= self.max_series:
+			logger.error("Metrics file %s has no free slot for series %s", self.path, name)
+			return None
+		self._slots[position] = (encoded_name, 0, 0)
+		self._positions[name] = position
+		self._header['used_series'] = len(self._positions)
+		return position
+
+	def append(self, name, timestamp, hashrate=np.nan, temperature=np.nan, clock=np.nan, memory_clock=np.nan, fan_percent=np.nan):
+		""" Appends a sample to the series, overwriting its oldest sample if the slot is full
+
+		Returns:
+			True if the sample was recorded, otherwise, False
+
+		"""
+		position = self._get_position(name)
+		if position is None:
+			return False
+		slot = self._slots[position]
+		head = int(slot['head'])
+		if int(slot['count']) > 0:
+			latest_time = float(self._samples[position, head - 1]['time'])
+			if timestamp < latest_time:
+				# keeps the slot ordered by time when the clock steps backwards
+				logger.warning("Sample of %s is older than its latest sample by %.3f s, recording it at time of the latest sample",
+					name, latest_time - timestamp)
+				timestamp = latest_time
+		self._samples[position, head] = (timestamp, _to_float(hashrate), _to_float(temperature), _to_float(clock),
+			_to_float(memory_clock), _to_float(fan_percent))
+		self._slots[position] = (slot['name'], (head + 1) % self.samples_per_series, min(int(slot['count']) + 1, self.samples_per_series))
+		return True
+
+	def record(self, snapshot, timestamp=None):
+		""" Records metrics of every miner and every device of the given FleetSnapshot
+
+		Returns:
+			number of recorded samples
+
+		"""
+		timestamp = time.time() if timestamp is None else timestamp
+		num_samples = 0
+		for miner_json in snapshot.iter_miner_json():
+			miner_name = miner_json['name']
+			num_samples += self.append(miner_name, timestamp, hashrate=miner_json['speedInfo']['hashrateValue'],
+				temperature=miner_json['temperature'])
+			for device_json in (miner_json.get('gpuList') or list()) + (miner_json.get('asicList') or list()):
+				device_info = device_json['deviceInfo']
+				num_samples += self.append(miner_name + SERIES_SEPARATOR + device_json['name'], timestamp,
+					hashrate=device_json['speedInfo']['hashrateValue'], temperature=device_info['temperature'],
+					clock=device_info['gpuClock'], memory_clock=device_info['gpuMemoryClock'], fan_percent=device_info['fanPercent'])
+		self.flush()
+		return num_samples
+
+	def query(self, name, start=None, end=None):
+		""" Returns samples of the series recorded within [start, end] time range
+
+		Args:
+			name: miner name, or <miner name>/<device name> for a device
+			start: UNIX timestamp of the earliest sample, unbounded if None
+			end: UNIX timestamp of the latest sample, unbounded if None
+
+		Returns:
+			a NumPy structured array of SAMPLE_DTYPE samples ordered by time, empty if the series is unknown
+
+		"""
+		position = self._positions.get(name)
+		if position is None:
+			return np.zeros(0, dtype=SAMPLE_DTYPE)
+		slot = self._slots[position]
+		head = int(slot['head'])
+		count = int(slot['count'])
+		series = self._samples[position]
+		# both segments are ordered by time, only the matching ranges are copied out of the mapping
+		segments = [series[head:], series[:head]] if count == self.samples_per_series else [series[:count]]
+		matching = list()
+		for segment in segments:
+			times = segment['time']
+			first = 0 if start is None else np.searchsorted(times, start, side='left')
+			last = len(segment) if end is None else np.searchsorted(times, end, side='right')
+			matching.append(np.array(segment[first:last]))
+		return np.concatenate(matching)
+
+
+def _to_float(value):
+	return np.nan if value is None else value
+
+
+def _set_sparse(f):
+	""" Marks the open file sparse on Windows, returns True if succeeded """
+	import ctypes
+	import ctypes.wintypes
+	import msvcrt
+	bytes_returned = ctypes.wintypes.DWORD()
+	return bool(ctypes.windll.kernel32.DeviceIoControl(ctypes.wintypes.HANDLE(msvcrt.get_osfhandle(f.fileno())), FSCTL_SET_SPARSE,
+		None, 0, None, 0, ctypes.byref(bytes_returned), None))
+
+
+def main():
+	from awesome_miner_utils import load_awesome_miner_address, get_fleet_snapshot
+	#command-line parameters parsing
+	parser = argparse.ArgumentParser(description="Records metrics history of miners and their devices, or prints recorded history of a miner or a device.")
+	parser.add_argument("-file", "--metrics_file", nargs=1, type=str, required=True, help="Path to metrics file, created on first use.")
+	parser.add_argument("-conf", "--config", nargs=1, type=str, help="""Path to AwesomeMiner .ini configuration file that
+		consists of AwesomeMiner web API port number and PC name where AwesomeMiner control software is running.""")
+	parser.add_argument("-interval", "--poll_interval", nargs=1, type=float, default=[DEFAULT_POLL_INTERVAL], help="Time between samples, in seconds.")
+	parser.add_argument("-series", "--max_series", nargs=1, type=int, default=[DEFAULT_MAX_SERIES], help="Number of miners and devices the new file has room for.")
+	parser.add_argument("-samples", "--samples_per_series", nargs=1, type=int, default=[DEFAULT_SAMPLES_PER_SERIES], help="Number of samples kept per miner or device in the new file.")
+	parser.add_argument("-query", "--query", nargs=1, type=str, help="Name of a miner, or <miner name>/<device name>, to print recorded history of.")
+	parser.add_argument("-since", "--since", nargs=1, type=float, help="Print samples not older than given number of seconds.")
+	args = parser.parse_args()
+	logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', level=logging.INFO)
+	with MetricsRecorder(args.metrics_file[0], args.max_series[0], args.samples_per_series[0]) as recorder:
+		if args.query:
+			start = time.time() - args.since[0] if args.since else None
+			for sample in recorder.query(args.query[0], start):
+				print(time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(sample['time'])) + " " +
+					" ".join([field + "=" + str(sample[field]) for field in SAMPLE_DTYPE.names[1:]]))
+			return
+		if not args.config:
+			parser.error("-conf is required for recording")
+		address = load_awesome_miner_address(args.config[0])
+		if address is None:
+			return
+		while True:
+			start = time.monotonic()
+			snapshot = get_fleet_snapshot(address[0], address[1])
+			if snapshot is not None:
+				logger.info("Recorded %d samples", recorder.record(snapshot))
+			time.sleep(max(0.0, args.poll_interval[0] - (time.monotonic() - start)))
+
+if __name__ == "__main__":
+	main()
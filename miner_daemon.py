@@ -0,0 +1,308 @@
+import argparse
+import json
+import logging
+import os.path
+import socketserver
+import threading
+import time
+import log_offline
+import restart_miner
+import instrumentation
+from awesome_miner_utils import load_awesome_miner_instances, select_awesome_miner_instance, get_fleet_snapshot
+from awesome_miner_snapshot import DEFAULT_SNAPSHOT_TTL
+
+"""
+Resident service handling AwesomeMiner triggers forwarded by miner_trigger.py
+
+Keeps AwesomeMiner connection pool, fleet index, configuration and miner to plug mapping warm
+between events, so that a trigger costs a local socket round trip and a dictionary lookup instead of
+interpreter startup, imports, configuration parsing and a full /api/miners download. Fleet snapshots
+are revalidated by a background thread, triggers never wait for AwesomeMiner unless the miner is unknown.
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 17853
+"""
+in bytes
+"""
+MAX_REQUEST_SIZE = 64 * 1024
+"""
+in seconds, fleet snapshots are revalidated with AwesomeMiner as soon as the client's cached copy expires
+"""
+DEFAULT_REFRESH_INTERVAL = DEFAULT_SNAPSHOT_TTL
+
+class WarmFleet(object):
+
+	""" Fleet snapshots of AwesomeMiner instances held in memory and refreshed by a background thread
+
+	Snapshots are fetched through the shared AwesomeMinerClient of each instance, so a refresh is a
+	conditional request answered with 304 Not Modified while the fleet doesn't change, and the FleetIndex
+	of the snapshot is reused. If a refresh fails, the previous snapshot is kept.
+	"""
+
+	def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+		self.refresh_interval = refresh_interval
+		self._snapshots = dict()
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread = None
+
+	def get_snapshot(self, pc_name, awesome_miner_port):
+		""" Returns in-memory FleetSnapshot of the instance, fetching it on first use, or None if it is unreachable """
+		key = (pc_name, awesome_miner_port)
+		with self._lock:
+			snapshot = self._snapshots.get(key)
+		if snapshot is None:
+			snapshot = self.refresh(pc_name, awesome_miner_port)
+		return snapshot
+
+	def refresh(self, pc_name, awesome_miner_port):
+		""" Revalidates snapshot of the instance and starts refreshing it in the background
+
+		Returns:
+			the latest FleetSnapshot object, or None if the instance has never been reachable
+
+		"""
+		key = (pc_name, awesome_miner_port)
+		snapshot = get_fleet_snapshot(pc_name, awesome_miner_port)
+		with self._lock:
+			if snapshot is not None:
+				self._snapshots[key] = snapshot
+			else:
+				snapshot = self._snapshots.setdefault(key, None)
+			if self._thread is None and not self._stop.is_set():
+				self._thread = threading.Thread(target=self._run, name="fleet-refresh", daemon=True)
+				self._thread.start()
+		return snapshot
+
+	def find_device(self, instances, host=None, name=None):
+		""" Looks up miner by its hostname or name in the given instances, in their order
+
+		An unknown miner triggers a single revalidation of every instance, so that miners added since
+		the last background refresh are found.
+
+		Args:
+			instances: list of tuples of instance name, PC name and port, see awesome_miner_utils.load_awesome_miner_instances
+
+		Returns:
+			a tuple of instance name and Miner object, or None if no instance knows the miner
+
+		"""
+		owned_miner = self._find_device(instances, host, name, self.get_snapshot)
+		if owned_miner is None:
+			owned_miner = self._find_device(instances, host, name, self.refresh)
+		return owned_miner
+
+	def _find_device(self, instances, host, name, get_snapshot):
+		for instance, pc_name, awesome_miner_port in instances:
+			snapshot = get_snapshot(pc_name, awesome_miner_port)
+			if snapshot is None:
+				continue
+			miner = snapshot.index.get_by_host(host) if host is not None else snapshot.index.get_by_name(name)
+			if miner is not None:
+				return instance, miner
+		return None
+
+	def _run(self):
+		while not self._stop.wait(self.refresh_interval):
+			with self._lock:
+				keys = list(self._snapshots.keys())
+			for pc_name, awesome_miner_port in keys:
+				if self._stop.is_set():
+					return
+				try:
+					snapshot = get_fleet_snapshot(pc_name, awesome_miner_port)
+				except Exception:
+					logger.exception("Failed to refresh fleet snapshot of %s:%s", pc_name, awesome_miner_port)
+					continue
+				if snapshot is not None:
+					with self._lock:
+						self._snapshots[(pc_name, awesome_miner_port)] = snapshot
+
+	def close(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+
+
+class InstanceFleet(object):
+
+	""" WarmFleet narrowed down to the given instances, with lookup interface of FederatedClient """
+
+	def __init__(self, warm_fleet, instances):
+		self.warm_fleet = warm_fleet
+		self.instances = instances
+
+	def find_device(self, host=None, name=None):
+		return self.warm_fleet.find_device(self.instances, host, name)
+
+
+class MinerDaemon(object):
+
+	""" Executes forwarded commands, caching configuration per file path
+
+	Miner to plug mapping is cached by plug_map module until the mapping file changes. Miners are resolved
+	in a WarmFleet kept for the lifetime of the service, with the instance owning them if the configuration
+	lists multiple AwesomeMiner instances.
+	"""
+
+	def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+		self._instances = dict()
+		self._lock = threading.Lock()
+		self.fleet = WarmFleet(refresh_interval)
+		self.commands = {
+			"restart_miner": self.restart_miner,
+			"log_offline": self.log_offline,
+		}
+
+	def get_instances(self, config_path, instance_name=None):
+		""" Returns list of configured AwesomeMiner instances narrowed down to instance_name, or None on error """
+		with self._lock:
+			instances = self._instances.get(config_path)
+			if instances is None:
+				instances = load_awesome_miner_instances(config_path)
+				if instances is None:
+					return None
+				self._instances[config_path] = instances
+		return select_awesome_miner_instance(instances, instance_name)
+
+	def close(self):
+		self.fleet.close()
+
+	def get_plug_map(self, map_path):
+		return restart_miner.load_miner_plug_map(map_path)
+
+	def warm_up(self, config_path, map_path=None):
+		""" Loads configuration, plug mapping and fleet snapshot ahead of the first event """
+		instances = self.get_instances(config_path)
+		if instances is not None:
+			for instance, pc_name, port in instances:
+				self.fleet.refresh(pc_name, port)
+		if map_path is not None:
+			self.get_plug_map(map_path)
+
+	def restart_miner(self, argv, cwd):
+		args = restart_miner.build_arg_parser().parse_args(argv)
+		instances = self.get_instances(_resolve_path(args.config[0], cwd), args.instance[0] if args.instance else None)
+		if instances is None:
+			return False
+		miner_plug_map = self.get_plug_map(_resolve_path(args.miner_plug_map[0], cwd))
+		restart_miner.get_power_cycle_orchestrator(args.max_inrush[0], args.inrush_window[0])
+		plugs = restart_miner.resolve_federated_miner_plugs(args.ip_address, args.miner_name, InstanceFleet(self.fleet, instances), miner_plug_map)
+		power_cycles = restart_miner.restart_plugs(plugs)
+		if len(power_cycles) == 0:
+			return False
+		# reply once plugs are powered off, the shared orchestrator powers them back on
+		return all([power_cycle.powered_off.result() for power_cycle in power_cycles.values()])
+
+	def log_offline(self, argv, cwd):
+		args = log_offline.build_arg_parser().parse_args(argv)
+		instances = self.get_instances(_resolve_path(args.config[0], cwd), args.instance[0] if args.instance else None)
+		if instances is None:
+			return False
+		log_path = _resolve_path(args.log_file[0], cwd)
+		export_path = _resolve_path(args.export_csv[0], cwd) if args.export_csv else None
+		return log_offline.log_offline_by_owner(args.ip_address[0], InstanceFleet(self.fleet, instances), log_path,
+			args.user_defined_delay[0], export_path)
+
+	def execute(self, command, argv, cwd):
+		""" Executes command with the given command-line arguments
+
+		Args:
+			command: name of the command, one of self.commands
+			argv: command-line arguments of the command
+			cwd: working directory of the trigger, relative paths in arguments are resolved against it
+
+		Returns:
+			a tuple of success flag and error message (None if there is no error)
+
+		"""
+		handler = self.commands.get(command)
+		if handler is None:
+			return False, "Unknown command " + str(command)
+		try:
+			if handler(argv, cwd):
+				return True, None
+			return False, "Command " + command + " failed, see service log for details"
+		except SystemExit:
+			# raised by argparse on invalid arguments
+			return False, "Invalid arguments for " + command + ": " + " ".join(argv)
+		except Exception as e:
+			logger.exception("Command %s failed", command)
+			return False, str(e)
+
+
+def _resolve_path(path, cwd):
+	if cwd is None or os.path.isabs(path):
+		return path
+	return os.path.normpath(os.path.join(cwd, path))
+
+
+class TriggerRequestHandler(socketserver.StreamRequestHandler):
+
+	""" Reads single JSON line {"command": ..., "argv": [...], "cwd": ...} and replies with JSON line {"ok": ..., "error": ..., "elapsed": ...} """
+
+	def handle(self):
+		start = time.perf_counter()
+		try:
+			request = json.loads(self.rfile.readline(MAX_REQUEST_SIZE).decode('utf-8'))
+			command = request['command']
+			argv = [str(arg) for arg in request['argv']]
+			cwd = request.get('cwd')
+		except (ValueError, KeyError, TypeError, AttributeError):
+			ok, error = False, "Malformed request"
+			command, argv = None, []
+		else:
+			ok, error = self.server.daemon.execute(command, argv, cwd)
+		elapsed = time.perf_counter() - start
+		logger.info("%s %s -> %s in %.3f s", command, " ".join(argv), "OK" if ok else error, elapsed)
+		reply = {"ok": ok, "error": error, "elapsed": elapsed}
+		self.wfile.write((json.dumps(reply) + "\n").encode('utf-8'))
+
+
+class TriggerServer(socketserver.ThreadingTCPServer):
+
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, daemon):
+		super(TriggerServer, self).__init__(address, TriggerRequestHandler)
+		self.daemon = daemon
+
+
+def main():
+	#command-line parameters parsing
+	parser = argparse.ArgumentParser(description="Long-running service executing restart_miner and log_offline commands forwarded by miner_trigger.")
+	parser.add_argument("-port", "--port", nargs=1, type=int, default=[DEFAULT_PORT], help="Local port to listen to for forwarded triggers.")
+	parser.add_argument("-conf", "--config", nargs=1, type=str, help="Path to AwesomeMiner .ini configuration file to warm up the fleet snapshot with.")
+	parser.add_argument("-map", "--miner_plug_map", nargs=1, type=str, help="Path to miner to smart plug mapping file to be loaded on startup.")
+	parser.add_argument("-metrics_port", "--metrics_port", nargs=1, type=int, help="Local port to serve AwesomeMiner request timings at in Prometheus text format.")
+	parser.add_argument("-log", "--log_file", nargs=1, type=str, help="Path to file where the service writes its own log.")
+	args = parser.parse_args()
+	# restart_miner and log_offline configure logging on import, the service logs to its own file or console
+	if args.log_file:
+		logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', filename=args.log_file[0], level=logging.INFO, force=True)
+	else:
+		logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', level=logging.INFO, force=True)
+	if args.metrics_port:
+		instrumentation.enable()
+		instrumentation.serve_prometheus(args.metrics_port[0])
+	daemon = MinerDaemon()
+	if args.config:
+		daemon.warm_up(args.config[0], args.miner_plug_map[0] if args.miner_plug_map else None)
+	server = TriggerServer((DEFAULT_HOST, args.port[0]), daemon)
+	logger.info("Listening for triggers at %s:%d", DEFAULT_HOST, args.port[0])
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		daemon.close()
+		# powers on plugs that are still scheduled to be powered on
+		restart_miner.close_power_cycle_orchestrator()
+
+if __name__ == "__main__":
+	main()
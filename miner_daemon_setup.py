@@ -0,0 +1,13 @@
+from distutils.core import setup
+import py2exe
+
+setup(
+		console=["miner_daemon.py"],
+		options={
+				"py2exe":{
+					"includes":['awesome_miner_structs', 'awesome_miner_utils', 'offline_event_store', 'power_cycle', 'plug_map', 'federated_client', 'restart_miner', 'log_offline'],
+					"packages":['pyHS100']
+				}
+		}
+
+	)
\ No newline at end of file
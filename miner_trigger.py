@@ -0,0 +1,92 @@
+import json
+import os
+import socket
+import sys
+
+"""
+Lightweight shim to be used in AwesomeMiner "Run Executable" action instead of restart_miner or log_offline.
+
+Usage: miner_trigger <restart_miner|log_offline> <arguments of the command>
+
+Forwards the command to the resident miner_daemon service over a local socket. If the service is not
+running, the command is executed in-process, so the trigger is never lost.
+Intentionally imports nothing beyond the standard library modules needed to talk to the service;
+restart_miner or log_offline, with their requests and pyHS100 dependencies, are imported only for the fallback.
+The frozen executable bundles them, see miner_trigger_setup.py. If a build lacks them anyway,
+the fallback reports the missing module and exits with status 1 instead of crashing.
+"""
+
+DAEMON_HOST = "127.0.0.1"
+"""
+Must match miner_daemon.DEFAULT_PORT unless overridden with MINER_DAEMON_PORT environment variable
+"""
+DAEMON_PORT = 17853
+"""
+in seconds
+"""
+CONNECT_TIMEOUT = 1.0
+REPLY_TIMEOUT = 120.0
+COMMANDS = ("restart_miner", "log_offline")
+
+def forward(command, argv, port):
+	""" Sends command to the service
+
+	Returns:
+		reply dictionary of the service, or None if the service is not reachable. Once connected,
+		the command may already be executing in the service, so failures of the exchange are
+		reported as an error reply rather than None, which would execute the command again.
+
+	"""
+	try:
+		sock = socket.create_connection((DAEMON_HOST, port), timeout=CONNECT_TIMEOUT)
+	except OSError:
+		return None
+	try:
+		with sock:
+			sock.settimeout(REPLY_TIMEOUT)
+			sock.sendall((json.dumps({"command": command, "argv": argv, "cwd": os.getcwd()}) + "\n").encode('utf-8'))
+			reply = sock.makefile("rb").readline()
+	except socket.timeout:
+		return {"ok": False, "error": "No reply within " + str(REPLY_TIMEOUT) + " seconds"}
+	except OSError as e:
+		return {"ok": False, "error": "Connection to the service failed: " + str(e)}
+	if not reply:
+		return {"ok": False, "error": "No reply"}
+	try:
+		reply = json.loads(reply.decode('utf-8'))
+	except ValueError:
+		return {"ok": False, "error": "Malformed reply"}
+	if not isinstance(reply, dict):
+		return {"ok": False, "error": "Malformed reply"}
+	return reply
+
+def run_locally(command, argv):
+	""" Executes command in-process, returns True if it succeeded """
+	# dependencies of the commands are imported lazily, so a missing one surfaces while the command runs
+	try:
+		if command == "restart_miner":
+			import restart_miner
+			return restart_miner.main(argv)
+		else:
+			import log_offline
+			return log_offline.main(argv)
+	except ImportError as e:
+		sys.stderr.write("miner_daemon is not reachable and " + command + " can't be executed in-process: " + str(e) + "\n")
+		return False
+
+def main(argv):
+	if len(argv) < 2 or argv[1] not in COMMANDS:
+		sys.stderr.write("Usage: " + os.path.basename(argv[0]) + " <" + "|".join(COMMANDS) + "> <arguments of the command>\n")
+		return 2
+	command = argv[1]
+	port = int(os.environ.get("MINER_DAEMON_PORT", DAEMON_PORT))
+	reply = forward(command, argv[2:], port)
+	if reply is None:
+		return 0 if run_locally(command, argv[2:]) else 1
+	if not reply.get("ok"):
+		sys.stderr.write(command + " failed: " + str(reply.get("error")) + "\n")
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,16 @@
+from distutils.core import setup
+import py2exe
+
+setup(
+		windows=["miner_trigger.py"],
+		options={
+				"py2exe":{
+					# the in-process fallback needs everything restart_miner and log_offline need,
+					# it is imported only if the service can't be reached
+					"includes":['restart_miner', 'log_offline', 'awesome_miner_structs', 'awesome_miner_utils', 'offline_event_store',
+						'power_cycle', 'plug_map', 'federated_client', 'shared_snapshot'],
+					"packages":['pyHS100', 'requests']
+				}
+		}
+
+	)
\ No newline at end of file
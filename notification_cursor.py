@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import os
+import os.path
+from collections import OrderedDict
+
+"""
+Persistent record of AwesomeMiner notifications that have already been processed
+"""
+
+logger = logging.getLogger(__name__)
+
+"""
+in bytes
+"""
+FINGERPRINT_SIZE = 8
+"""
+Maximum number of fingerprints kept, least recently seen ones are evicted first
+"""
+DEFAULT_MAX_FINGERPRINTS = 100000
+
+def get_fingerprint(notification_json):
+	""" Computes compact fingerprint of AwesomeMiner web API element of 'notificationList' """
+	canonical = json.dumps(notification_json, sort_keys=True, separators=(',', ':'))
+	return hashlib.blake2b(canonical.encode('utf-8'), digest_size=FINGERPRINT_SIZE).digest()
+
+class NotificationCursor(object):
+
+	""" Bounded set of fingerprints of already seen notifications, optionally persisted to a file
+
+	File consists of FINGERPRINT_SIZE-byte fingerprints ordered from the least to the most recently seen.
+	Fingerprints of notifications that are still reported by AwesomeMiner are refreshed on every poll,
+	so only notifications that left the backlog are evicted once the set is full.
+	"""
+
+	def __init__(self, path=None, max_size=DEFAULT_MAX_FINGERPRINTS):
+		self.path = path
+		self.max_size = max_size
+		self._fingerprints = OrderedDict()
+		if path is not None and os.path.isfile(path):
+			self._load()
+
+	def __len__(self):
+		return len(self._fingerprints)
+
+	def _load(self):
+		with open(self.path, "rb") as f:
+			data = f.read()
+		if len(data) % FINGERPRINT_SIZE != 0:
+			logger.error("Notification cursor file %s is corrupted, starting from scratch", self.path)
+			return
+		for offset in range(0, len(data), FINGERPRINT_SIZE):
+			self._fingerprints[data[offset:offset + FINGERPRINT_SIZE]] = None
+		self._evict()
+
+	def _evict(self):
+		while len(self._fingerprints) > self.max_size:
+			self._fingerprints.popitem(last=False)
+
+	def filter_new(self, notification_list_json):
+		""" Returns notifications that were not seen before and marks all given notifications as seen
+
+		Args:
+			notification_list_json: AwesomeMiner web API 'notificationList' object
+
+		Returns:
+			a list of elements of 'notificationList' that were not seen by this cursor
+
+		"""
+		new_notifications = list()
+		for notification_json in notification_list_json:
+			fingerprint = get_fingerprint(notification_json)
+			if fingerprint in self._fingerprints:
+				self._fingerprints.move_to_end(fingerprint)
+			else:
+				self._fingerprints[fingerprint] = None
+				new_notifications.append(notification_json)
+		self._evict()
+		return new_notifications
+
+	def save(self):
+		""" Atomically writes fingerprints to the cursor file, if cursor has one """
+		if self.path is None:
+			return
+		tmp_path = self.path + ".tmp"
+		with open(tmp_path, "wb") as f:
+			f.write(b''.join(self._fingerprints))
+		os.replace(tmp_path, self.path)
@@ -0,0 +1,167 @@
+import csv
+import logging
+import os
+import os.path
+import sqlite3
+import threading
+import time
+from shared_snapshot import FileLock
+
+"""
+SQLite-backed storage of miners' offline events
+
+Keeps per-miner offline counters, updated in O(log n) per event, together with append-only
+history of every invocation. Writers take the database write lock before reading the counter,
+so concurrently running log_offline processes never lose each other's updates.
+"""
+
+logger = logging.getLogger(__name__)
+
+"""
+Time, in seconds, a writer waits for other writers to release the database lock
+"""
+DEFAULT_LOCK_TIMEOUT = 30.0
+CSV_HEADER = ["miner_name", "offline", "last_invoked"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS miner_offline (
+	miner_name TEXT PRIMARY KEY,
+	offline INTEGER NOT NULL,
+	last_invoked INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS offline_events (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	miner_name TEXT NOT NULL,
+	invoked_at INTEGER NOT NULL,
+	counted INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offline_events_miner ON offline_events (miner_name, invoked_at);
+"""
+
+class OfflineEventStore(object):
+
+	""" Store of miners' offline events kept in a SQLite database file """
+
+	def __init__(self, path, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+		self.path = path
+		# autocommit mode, transactions are managed explicitly
+		self.connection = sqlite3.connect(path, timeout=lock_timeout, isolation_level=None)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("PRAGMA synchronous=NORMAL")
+		self.connection.executescript(SCHEMA)
+
+	def close(self):
+		self.connection.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, traceback):
+		self.close()
+
+	def is_empty(self):
+		return self.connection.execute("SELECT 1 FROM miner_offline LIMIT 1").fetchone() is None
+
+	def record_offline(self, miner_name, repeat_window, now=None):
+		""" Records that miner was reported offline
+
+		If the previous report for the miner happened within repeat_window seconds, the miner
+		is considered to be still offline and only its last invocation time is updated,
+		otherwise, its offline counter is incremented.
+
+		Args:
+			miner_name: name of the miner that went offline
+			repeat_window: maximum time between reports of the same offline period, in seconds
+			now: time of the report as UNIX timestamp, defaults to current time
+
+		Returns:
+			number of times the miner went offline
+
+		"""
+		now = int(time.time()) if now is None else int(now)
+		cursor = self.connection.cursor()
+		cursor.execute("BEGIN IMMEDIATE")
+		try:
+			row = cursor.execute("SELECT offline, last_invoked FROM miner_offline WHERE miner_name = ?", (miner_name,)).fetchone()
+			if row is None:
+				num_offline = 1
+				counted = True
+				cursor.execute("INSERT INTO miner_offline (miner_name, offline, last_invoked) VALUES (?, ?, ?)", (miner_name, num_offline, now))
+			else:
+				num_offline, last_invoked = row
+				# if delay between invocations is within the window, miner likely stays offline
+				# and AwesomeMiner keeps re-triggering the action at fixed intervals of time
+				counted = (now - last_invoked) > repeat_window
+				if counted:
+					num_offline += 1
+				cursor.execute("UPDATE miner_offline SET offline = ?, last_invoked = ? WHERE miner_name = ?", (num_offline, now, miner_name))
+			cursor.execute("INSERT INTO offline_events (miner_name, invoked_at, counted) VALUES (?, ?, ?)", (miner_name, now, int(counted)))
+			cursor.execute("COMMIT")
+		except:
+			cursor.execute("ROLLBACK")
+			raise
+		return num_offline
+
+	def get_offline_count(self, miner_name):
+		row = self.connection.execute("SELECT offline FROM miner_offline WHERE miner_name = ?", (miner_name,)).fetchone()
+		return row[0] if row is not None else 0
+
+	def get_events(self, miner_name, since=0):
+		""" Returns (invoked_at, counted) tuples of the miner's offline reports, oldest first """
+		rows = self.connection.execute("SELECT invoked_at, counted FROM offline_events WHERE miner_name = ? AND invoked_at >= ? ORDER BY id",
+			(miner_name, int(since)))
+		return [(invoked_at, bool(counted)) for invoked_at, counted in rows]
+
+	def import_csv(self, path, only_if_empty=False):
+		""" Imports counters from .csv file in miner_name/offline/last_invoked format written by older versions of log_offline
+
+		Args:
+			path: path to .csv file
+			only_if_empty: if True, counters are imported only if the store has none, checked under the write lock
+				so that exactly one of concurrently started processes imports the file
+
+		Returns:
+			True if counters were imported, otherwise, False
+
+		"""
+		cursor = self.connection.cursor()
+		cursor.execute("BEGIN IMMEDIATE")
+		try:
+			if only_if_empty and cursor.execute("SELECT 1 FROM miner_offline LIMIT 1").fetchone() is not None:
+				cursor.execute("ROLLBACK")
+				return False
+			with open(path, "r", newline='') as f:
+				rows = [row for row in csv.reader(f, delimiter=",") if len(row) >= 3 and row[0] != CSV_HEADER[0]]
+			for row in rows:
+				try:
+					cursor.execute("INSERT OR IGNORE INTO miner_offline (miner_name, offline, last_invoked) VALUES (?, ?, ?)",
+						(row[0], int(row[1]), int(row[2])))
+				except ValueError:
+					logger.error("Failed to convert %s to int! Skipping...", str(row))
+			cursor.execute("COMMIT")
+		except:
+			cursor.execute("ROLLBACK")
+			raise
+		logger.info("Imported %d miners from %s", len(rows), path)
+		return True
+
+	def export_csv(self, path):
+		""" Atomically writes counters to .csv file in miner_name/offline/last_invoked format
+
+		Exports are serialized by an exclusive lock on a companion .lock file rather than by the database
+		write lock, so they don't hold up concurrent writers. The database is read once the lock is held,
+		so every export sees at least the events committed before the previous one, and an older
+		snapshot never replaces a newer one.
+		"""
+		tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+		with FileLock(path + ".lock"):
+			try:
+				with open(tmp_path, "w", newline='') as f:
+					writer = csv.writer(f, delimiter=",")
+					writer.writerow(CSV_HEADER)
+					writer.writerows(self.connection.execute("SELECT miner_name, offline, last_invoked FROM miner_offline ORDER BY rowid"))
+				os.replace(tmp_path, path)
+			except:
+				if os.path.isfile(tmp_path):
+					os.remove(tmp_path)
+				raise
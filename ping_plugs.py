@@ -1,60 +1,202 @@
 import logging
-import socket
 import argparse
+import json
+import os
 import os.path
-from pyHS100 import SmartPlug, Discover
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pyHS100 import SmartPlug, TPLinkSmartHomeProtocol
 from pyHS100.smartdevice import SmartDeviceException
-from pprint import pformat as pf
+from plug_map import load_plug_map
 
 """
-
+Keeps smart plugs connected by periodically querying them, all plugs are queried concurrently
 """
 
 logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', filename='C:/Users/GM/Desktop/Utility_Scripts/logs/ping_plugs.log',level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def ping_plug(ip_addr):
+"""
+Maximum number of plugs queried at the same time
+"""
+DEFAULT_WORKERS = 32
+"""
+Time, in seconds, after which a plug that hasn't responded is reported as timed out
+"""
+DEFAULT_DEADLINE = 5.0
+"""
+How often, in seconds, the sweep checks running queries for expired deadlines
+"""
+POLL_INTERVAL = 0.1
+
+class PlugStatus(object):
+
+	""" Result of querying single plug during a sweep """
+
+	UP = "UP"
+	DOWN = "DOWN"
+	TIMEOUT = "TIMEOUT"
+
+	__slots__ = ('ip_addr', 'status', 'latency', 'consecutive_failures')
+
+	def __init__(self, ip_addr, status, latency, consecutive_failures):
+		self.ip_addr = ip_addr
+		self.status = status
+		# in seconds
+		self.latency = latency
+		self.consecutive_failures = consecutive_failures
+
+	def to_dict(self):
+		return {"ip_addr": self.ip_addr, "status": self.status, "latency": round(self.latency, 3), "consecutive_failures": self.consecutive_failures}
+
+class DeadlineProtocol(TPLinkSmartHomeProtocol):
+
+	""" pyHS100 protocol bounding the whole query by a deadline
+
+	TPLinkSmartHomeProtocol applies the class-wide DEFAULT_TIMEOUT to every socket operation, so a plug
+	trickling its response can hold a query much longer; this protocol gives each operation only
+	the time left until the deadline, without touching the shared class attribute.
+	"""
+
+	def __init__(self, timeout):
+		self.timeout = timeout
+
+	def query(self, host, request, port=TPLinkSmartHomeProtocol.DEFAULT_PORT):
+		if isinstance(request, dict):
+			request = json.dumps(request)
+		deadline = time.monotonic() + self.timeout
+		def remaining():
+			left = deadline - time.monotonic()
+			if left <= 0:
+				raise socket.timeout("No response from " + host + " within " + str(self.timeout) + " seconds")
+			return left
+		with socket.create_connection((host, port), remaining()) as sock:
+			sock.settimeout(remaining())
+			sock.sendall(self.encrypt(request))
+			buffer = bytes()
+			# as in pyHS100, responses either announce their length or end with an empty chunk
+			length = -1
+			while True:
+				sock.settimeout(remaining())
+				chunk = sock.recv(4096)
+				buffer += chunk
+				if length == -1 and len(buffer) >= 4:
+					length = struct.unpack(">I", buffer[0:4])[0]
+				if (length > 0 and len(buffer) >= length + 4) or not chunk:
+					break
+		return json.loads(self.decrypt(buffer[4:]))
+
+
+def ping_plug(ip_addr, timeout=None):
+	""" Queries system information of the plug
+
+	Args:
+		ip_addr: IP address of the plug
+		timeout: maximum duration of the query, in seconds, pyHS100 default per socket operation if None
+
+	Returns:
+		True if plug responded, otherwise, False
+	"""
 	try:
-		plug = SmartPlug(ip_addr)
+		plug = SmartPlug(ip_addr) if timeout is None else SmartPlug(ip_addr, protocol=DeadlineProtocol(timeout))
 		plug.get_sysinfo()
 		logger.info("Plug %s is up and running!", ip_addr)
+		return True
 	except SmartDeviceException:
 		logger.error("Failed to connect to the plug with IP %s", ip_addr)
+		return False
+
+def sweep_plugs(plug_addresses, workers=DEFAULT_WORKERS, deadline=DEFAULT_DEADLINE, failure_counts=None):
+	""" Queries all plugs concurrently, giving each plug at most deadline seconds to respond
+
+	Plugs that miss the deadline are reported as timed out without waiting for them any longer,
+	so the sweep takes about as long as the slowest plug rather than the sum of all plugs.
+
+	Args:
+		plug_addresses: IP addresses of smart plugs
+		workers: maximum number of plugs queried at the same time
+		deadline: maximum time, in seconds, given to each plug
+		failure_counts: optional dictionary mapping plug IP addresses to numbers of consecutive failed sweeps,
+			updated in place
+
+	Returns:
+		a list of PlugStatus objects, in the order of plug_addresses
+
+	"""
+	if failure_counts is None:
+		failure_counts = dict()
+	plug_addresses = list(dict.fromkeys(plug_addresses))
+	if len(plug_addresses) == 0:
+		return list()
+	results = _sweep(plug_addresses, workers, deadline)
+	report = list()
+	for ip_addr in plug_addresses:
+		status, latency = results[ip_addr]
+		if status == PlugStatus.UP:
+			failure_counts[ip_addr] = 0
+		else:
+			failure_counts[ip_addr] = failure_counts.get(ip_addr, 0) + 1
+		report.append(PlugStatus(ip_addr, status, latency, failure_counts[ip_addr]))
+	return report
+
+def _sweep(plug_addresses, workers, deadline):
+	""" Queries plugs concurrently, returns dictionary mapping plug IP addresses to tuples of PlugStatus status and latency """
+	started = dict()
+	def timed_ping(ip_addr):
+		started[ip_addr] = time.monotonic()
+		# queries don't outlive the deadline, so abandoned workers don't hold up interpreter exit either
+		return ping_plug(ip_addr, deadline), time.monotonic() - started[ip_addr]
+	results = dict()
+	executor = ThreadPoolExecutor(max_workers=min(workers, len(plug_addresses)))
+	futures = {executor.submit(timed_ping, ip_addr): ip_addr for ip_addr in plug_addresses}
+	pending = set(futures)
+	while pending:
+		done, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+		for future in done:
+			responded, latency = future.result()
+			results[futures[future]] = (PlugStatus.UP if responded else PlugStatus.DOWN, latency)
+		now = time.monotonic()
+		for future in list(pending):
+			start = started.get(futures[future])
+			if start is not None and now - start >= deadline:
+				results[futures[future]] = (PlugStatus.TIMEOUT, now - start)
+				pending.discard(future)
+	executor.shutdown(wait=False)
+	return results
+
+def load_failure_counts(path):
+	""" Loads numbers of consecutive failed sweeps per plug saved by save_failure_counts """
+	if not os.path.isfile(path):
+		return dict()
+	try:
+		with open(path) as f:
+			return {ip_addr: int(count) for ip_addr, count in json.load(f).items()}
+	except (ValueError, AttributeError):
+		logger.error("Failed to parse sweep state file %s, starting from scratch", path)
+		return dict()
+
+def save_failure_counts(path, failure_counts):
+	tmp_path = path + ".tmp"
+	with open(tmp_path, "w") as f:
+		json.dump(failure_counts, f)
+	os.replace(tmp_path, path)
 
 def load_plug_addr(path):
 	""" Loads a list of smart plug IP addresses from file
 
+	The file is parsed once and cached until it changes, see plug_map.load_plug_map
+
 	Args:
 		path: path to file storing the mapping from miner IP addresses to plug IP addresses
 
 	Returns:
-		a list of smart plug IP address.
+		a list of smart plug IP address, each listed once.
 		If functions fails to find or parse given file, returns empty list.
 
 	"""
-	ip_addresses = []
-	if not os.path.isfile(path):
-		logger.error("File storing map to plug IP mapping at %s doesn't exist", path)
-		return ip_addresses
-	logger.debug("Loading miner to smart plug mapping from %s...", path)
-	try:
-		with open(path) as f:
-			lines = f.readlines()
-			for line in lines:
-				split_line = line.strip().split(":") 
-				if len(split_line) != 2:
-					logger.error("Failed to parse line %s", line)
-				else:
-					plug_ip_addr = split_line[1].strip()
-					try:
-						socket.inet_aton(plug_ip_addr)
-						ip_addresses.append(plug_ip_addr)
-					except socket.error:
-						logger.error("Incorrect IP address format: %s", plug_ip_addr)
-	except:
-		logger.error("Miner_Plug_Map.txt not found at %s! Exiting...", os.path.dirname(os.path.realpath(__file__)))
-	logger.debug("Loaded miner to smart plug mapping has %d elements", len(ip_addresses))
-	return ip_addresses
+	return load_plug_map(path).plugs
 
 def main():
 	#command-line parameters parsing
@@ -62,12 +204,22 @@ def main():
 	parser.add_argument("-map", "--miner_plug_map", nargs=1, type=str, required=True, help="""Path to file storing mapping of IP addresses from miners to smart plugs.
 		 File format is: <Miner IP> : <Plug IP>. Even though the information about miners IP addresses is useless for this script,
 		 the file format is chosen to be like that because the same file is used for restart_miner.py script. \\n""")
+	parser.add_argument("-workers", "--workers", nargs=1, type=int, default=[DEFAULT_WORKERS], help="Maximum number of plugs queried at the same time.")
+	parser.add_argument("-deadline", "--deadline", nargs=1, type=float, default=[DEFAULT_DEADLINE], help="Time, in seconds, given to each plug to respond.")
+	parser.add_argument("-state", "--state_file", nargs=1, type=str, help="Path to file keeping numbers of consecutive failed sweeps per plug between runs.")
 	args = parser.parse_args()
 	logger.debug("Configuration file: %s", args.miner_plug_map[0])
 	#load miner plug map
 	plug_addresses = load_plug_addr(args.miner_plug_map[0])
-	for plug_addr in plug_addresses:
-		ping_plug(plug_addr)
+	failure_counts = load_failure_counts(args.state_file[0]) if args.state_file else dict()
+	start = time.monotonic()
+	report = sweep_plugs(plug_addresses, args.workers[0], args.deadline[0], failure_counts)
+	for plug_status in report:
+		logger.info("Plug report: %s", json.dumps(plug_status.to_dict()))
+	num_up = len([plug_status for plug_status in report if plug_status.status == PlugStatus.UP])
+	logger.info("Swept %d plugs in %.3f s: %d up, %d down or timed out", len(report), time.monotonic() - start, num_up, len(report) - num_up)
+	if args.state_file:
+		save_failure_counts(args.state_file[0], failure_counts)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -0,0 +1,127 @@
+import logging
+import os
+import socket
+import threading
+
+"""
+Shared loader of the miner to smart plug mapping file
+
+File format is one "<Miner name> : <Plug IP>" entry per line. Parsed mappings are cached per path
+until the file's modification time or size changes, so repeated loads only cost a stat call.
+"""
+
+logger = logging.getLogger(__name__)
+
+class PlugMap(object):
+
+	""" Parsed miner to smart plug mapping with forward and reverse indexes
+
+	Attributes:
+		miner_to_plug: dictionary mapping miner names to plug IP addresses
+		plug_to_miners: dictionary mapping plug IP addresses to lists of miner names, in file order
+		duplicates: list of (line number, miner name, plug IP) tuples repeating an earlier entry
+		conflicts: list of (line number, miner name, plug IP, previous plug IP) tuples remapping a miner
+			to another plug; the later entry wins
+		invalid_lines: list of (line number, line) tuples that failed to parse
+
+	"""
+
+	def __init__(self):
+		self.miner_to_plug = dict()
+		self.plug_to_miners = dict()
+		self.duplicates = list()
+		self.conflicts = list()
+		self.invalid_lines = list()
+
+	def __len__(self):
+		return len(self.miner_to_plug)
+
+	@property
+	def plugs(self):
+		""" IP addresses of all plugs, each listed once """
+		return list(self.plug_to_miners)
+
+	def get_plug(self, miner_name):
+		return self.miner_to_plug.get(miner_name)
+
+	def get_miners(self, plug_ip):
+		# a copy, the PlugMap is cached and shared by all callers of load_plug_map
+		return list(self.plug_to_miners.get(plug_ip, list()))
+
+	def add(self, line_number, miner_name, plug_ip):
+		previous_plug = self.miner_to_plug.get(miner_name)
+		if previous_plug == plug_ip:
+			self.duplicates.append((line_number, miner_name, plug_ip))
+			return
+		if previous_plug is not None:
+			self.conflicts.append((line_number, miner_name, plug_ip, previous_plug))
+			self.plug_to_miners[previous_plug].remove(miner_name)
+			if len(self.plug_to_miners[previous_plug]) == 0:
+				del self.plug_to_miners[previous_plug]
+		self.miner_to_plug[miner_name] = plug_ip
+		self.plug_to_miners.setdefault(plug_ip, list()).append(miner_name)
+
+
+def parse_plug_map(path):
+	""" Parses miner to smart plug mapping file, bypassing the cache
+
+	Returns:
+		a PlugMap object; empty if the file doesn't exist or can't be read
+
+	"""
+	plug_map = PlugMap()
+	try:
+		with open(path) as f:
+			lines = f.readlines()
+	except (IOError, OSError):
+		logger.error("File storing map to plug IP mapping at %s can't be read", path)
+		return plug_map
+	for line_number, line in enumerate(lines, 1):
+		if len(line.strip()) == 0:
+			continue
+		split_line = line.strip().split(":")
+		if len(split_line) != 2:
+			logger.error("Failed to parse line %s", line)
+			plug_map.invalid_lines.append((line_number, line))
+			continue
+		miner_name = split_line[0].strip()
+		plug_ip_addr = split_line[1].strip()
+		try:
+			socket.inet_aton(plug_ip_addr)
+		except socket.error:
+			logger.error("Incorrect IP address format: %s", plug_ip_addr)
+			plug_map.invalid_lines.append((line_number, line))
+			continue
+		plug_map.add(line_number, miner_name, plug_ip_addr)
+	for line_number, miner_name, plug_ip in plug_map.duplicates:
+		logger.warning("Line %d of %s duplicates mapping of %s to plug %s", line_number, path, miner_name, plug_ip)
+	for line_number, miner_name, plug_ip, previous_plug in plug_map.conflicts:
+		logger.warning("Line %d of %s maps %s to plug %s, overriding plug %s", line_number, path, miner_name, plug_ip, previous_plug)
+	logger.debug("Loaded miner to smart plug mapping has %d elements", len(plug_map))
+	return plug_map
+
+
+_cache = dict()
+_cache_lock = threading.Lock()
+
+def load_plug_map(path):
+	""" Returns PlugMap of the given file, re-parsing it only if its modification time or size changed
+
+	Returns:
+		a PlugMap object; empty if the file doesn't exist or can't be read
+
+	"""
+	try:
+		stat = os.stat(path)
+	except OSError:
+		logger.error("File storing map to plug IP mapping at %s doesn't exist", path)
+		return PlugMap()
+	signature = (stat.st_mtime_ns, stat.st_size)
+	with _cache_lock:
+		cached = _cache.get(path)
+		if cached is not None and cached[0] == signature:
+			return cached[1]
+		logger.debug("Loading miner to smart plug mapping from %s...", path)
+		plug_map = parse_plug_map(path)
+		_cache[path] = (signature, plug_map)
+		return plug_map
@@ -0,0 +1,237 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+"""
+Power-cycling of many smart plugs at once
+
+Plugs are powered OFF concurrently, while powering them back ON goes through a single scheduler
+thread that limits how many plugs are switched ON within a time window, so that a site-wide restart
+doesn't trip breakers with inrush current.
+"""
+
+logger = logging.getLogger(__name__)
+
+"""
+in seconds
+"""
+DEFAULT_DELAY = 10.0
+"""
+At most DEFAULT_MAX_INRUSH plugs are powered ON within any DEFAULT_INRUSH_WINDOW seconds
+"""
+DEFAULT_MAX_INRUSH = 5
+DEFAULT_INRUSH_WINDOW = 2.0
+"""
+Maximum number of plugs powered OFF at the same time
+"""
+DEFAULT_WORKERS = 16
+
+def turn_off_plug(ip_addr):
+	""" Powers plug OFF if it's ON. Returns True if plug is OFF afterwards, otherwise, False """
+	# pyHS100 is imported only once a plug is actually switched, commands that end earlier don't pay for it
+	from pyHS100 import SmartPlug
+	from pyHS100.smartdevice import SmartDeviceException
+	try:
+		plug = SmartPlug(ip_addr)
+		if plug.state == "ON":
+			plug.turn_off()
+		return True
+	except SmartDeviceException:
+		logger.error("Failed to communicate with plug at IP address %s!", ip_addr)
+		return False
+
+def turn_on_plug(ip_addr):
+	""" Powers plug ON. Returns True if executed successfully, otherwise, False """
+	from pyHS100 import SmartPlug
+	from pyHS100.smartdevice import SmartDeviceException
+	try:
+		SmartPlug(ip_addr).turn_on()
+		return True
+	except SmartDeviceException:
+		logger.error("Failed to power on plug at IP address %s!", ip_addr)
+		return False
+
+
+class PowerOnScheduler(object):
+
+	""" Single thread powering plugs ON at their due time, at most max_inrush plugs per window seconds
+
+	Pending power-ons are kept in a heap ordered by due time. The thread is a daemon one, so that
+	it never keeps the interpreter alive on its own; close() drains scheduled power-ons before
+	stopping it, so owners must call it before exiting (see restart_miner.get_power_cycle_orchestrator).
+	"""
+
+	def __init__(self, max_inrush=DEFAULT_MAX_INRUSH, window=DEFAULT_INRUSH_WINDOW, turn_on=turn_on_plug):
+		if max_inrush < 1:
+			raise ValueError("max_inrush must be at least 1, got " + str(max_inrush))
+		if not window > 0:
+			raise ValueError("window must be positive, got " + str(window))
+		self.max_inrush = max_inrush
+		self.window = window
+		self._turn_on = turn_on
+		self._heap = list()
+		# times of power-ons within the last window
+		self._recent = deque()
+		self._sequence = itertools.count()
+		self._condition = threading.Condition()
+		self._closed = False
+		self._thread = threading.Thread(target=self._run, name="PowerOnScheduler", daemon=True)
+		self._thread.start()
+
+	def schedule(self, ip_addr, due):
+		""" Schedules powering plug ON
+
+		Args:
+			ip_addr: IP address of the plug
+			due: earliest time, as time.monotonic() value, to power the plug ON
+
+		Returns:
+			a Future resolved with True once the plug is powered ON, or with False if it failed
+
+		"""
+		future = Future()
+		with self._condition:
+			if self._closed:
+				raise RuntimeError("PowerOnScheduler is closed")
+			heapq.heappush(self._heap, (due, next(self._sequence), ip_addr, future))
+			self._condition.notify()
+		return future
+
+	def close(self, wait=True):
+		""" Stops the scheduler once all scheduled power-ons are done """
+		with self._condition:
+			self._closed = True
+			self._condition.notify()
+		if wait:
+			self._thread.join()
+
+	def _next_due(self):
+		""" Blocks until next power-on is allowed to happen, returns None once closed and drained """
+		with self._condition:
+			while True:
+				if len(self._heap) == 0:
+					if self._closed:
+						return None
+					self._condition.wait()
+					continue
+				now = time.monotonic()
+				while len(self._recent) > 0 and self._recent[0] <= now - self.window:
+					self._recent.popleft()
+				ready_at = self._heap[0][0]
+				if len(self._recent) >= self.max_inrush:
+					ready_at = max(ready_at, self._recent[0] + self.window)
+				if ready_at > now:
+					self._condition.wait(ready_at - now)
+					continue
+				self._recent.append(now)
+				return heapq.heappop(self._heap)
+
+	def _run(self):
+		try:
+			while True:
+				entry = self._next_due()
+				if entry is None:
+					return
+				due, sequence, ip_addr, future = entry
+				try:
+					result = self._turn_on(ip_addr)
+				except Exception:
+					logger.exception("Failed to power on plug at IP address %s!", ip_addr)
+					result = False
+				logger.info("Plug %s powered on %.3f s after due time", ip_addr, time.monotonic() - due)
+				future.set_result(result)
+		except Exception:
+			logger.exception("Power-on scheduler failed, failing all scheduled power-ons")
+			# nobody would ever resolve the futures otherwise, and their owners would wait forever
+			with self._condition:
+				self._closed = True
+				pending = self._heap
+				self._heap = list()
+			for due, sequence, ip_addr, future in pending:
+				if not future.done():
+					future.set_result(False)
+
+
+class PowerCycle(object):
+
+	""" Progress of single plug restart """
+
+	__slots__ = ('ip_addr', 'powered_off', 'completed')
+
+	def __init__(self, ip_addr):
+		self.ip_addr = ip_addr
+		# resolved with True once the plug is OFF, or with False if it couldn't be reached
+		self.powered_off = Future()
+		# resolved with True once the plug is back ON, or with False if restart failed
+		self.completed = Future()
+
+
+class PowerCycleOrchestrator(object):
+
+	""" Restarts plugs concurrently, coalescing requests for plugs whose restart is already in flight """
+
+	def __init__(self, delay=DEFAULT_DELAY, max_inrush=DEFAULT_MAX_INRUSH, window=DEFAULT_INRUSH_WINDOW, workers=DEFAULT_WORKERS,
+			turn_off=turn_off_plug, turn_on=turn_on_plug):
+		self.delay = delay
+		self._turn_off = turn_off
+		self.scheduler = PowerOnScheduler(max_inrush, window, turn_on)
+		self._executor = ThreadPoolExecutor(max_workers=workers)
+		self._in_flight = dict()
+		self._lock = threading.Lock()
+
+	def restart(self, ip_addr, delay=None):
+		""" Powers plug OFF and schedules it to be powered ON after the delay
+
+		Args:
+			ip_addr: IP address of the plug
+			delay: the time to wait before powering plug ON after it was powered OFF, defaults to self.delay
+
+		Returns:
+			a PowerCycle object; if the plug is already being restarted, PowerCycle of that restart
+
+		"""
+		with self._lock:
+			power_cycle = self._in_flight.get(ip_addr)
+			if power_cycle is not None:
+				logger.info("Restart of plug %s is already in progress", ip_addr)
+				return power_cycle
+			power_cycle = PowerCycle(ip_addr)
+			self._in_flight[ip_addr] = power_cycle
+		self._executor.submit(self._power_off, power_cycle, self.delay if delay is None else delay)
+		return power_cycle
+
+	def restart_all(self, ip_addresses, delay=None):
+		""" Restarts all given plugs, returns a dictionary mapping plug IP addresses to PowerCycle objects """
+		return {ip_addr: self.restart(ip_addr, delay) for ip_addr in ip_addresses}
+
+	def close(self, wait=True):
+		""" Stops accepting restarts and, if wait is True, waits until all restarts in progress are completed """
+		self._executor.shutdown(wait=wait)
+		self.scheduler.close(wait=wait)
+
+	def _power_off(self, power_cycle, delay):
+		try:
+			powered_off = self._turn_off(power_cycle.ip_addr)
+		except Exception:
+			logger.exception("Failed to power off plug at IP address %s!", power_cycle.ip_addr)
+			powered_off = False
+		power_cycle.powered_off.set_result(powered_off)
+		if not powered_off:
+			self._finish(power_cycle, False)
+			return
+		try:
+			power_on = self.scheduler.schedule(power_cycle.ip_addr, time.monotonic() + delay)
+		except RuntimeError:
+			logger.error("Plug %s is left OFF, power-on scheduler is closed!", power_cycle.ip_addr)
+			self._finish(power_cycle, False)
+			return
+		power_on.add_done_callback(lambda future: self._finish(power_cycle, future.result()))
+
+	def _finish(self, power_cycle, result):
+		with self._lock:
+			self._in_flight.pop(power_cycle.ip_addr, None)
+		power_cycle.completed.set_result(result)
@@ -1,11 +1,10 @@
-from pyHS100 import SmartPlug, Discover
-from pyHS100.smartdevice import SmartDeviceException
-from awesome_miner_structs import Miner
-from awesome_miner_utils import get_device_by_ip, load_config_file
+from awesome_miner_utils import get_shared_device_by_ip, get_shared_device_by_name, load_awesome_miner_instances, select_awesome_miner_instance
+from power_cycle import PowerCycleOrchestrator, DEFAULT_MAX_INRUSH, DEFAULT_INRUSH_WINDOW
+from plug_map import load_plug_map
+import atexit
 import threading
-import socket
+import types
 import logging
-import os
 import argparse
 
 logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', filename='C:/Users/User/Desktop/Utility_Scripts/logs/restart_miner.log',level=logging.INFO)
@@ -16,103 +15,244 @@ in seconds
 """
 DELAY = 10.0
 
+_orchestrator = None
+_orchestrator_lock = threading.Lock()
+
 def load_miner_plug_map(path):
 	""" Loads a mapping from miner IP addresses to smart plug IP addresses file
 
+	The file is parsed once and cached until it changes, see plug_map.load_plug_map
+
 	Args:
 		path: path to file storing the mapping
 
 	Returns:
-		dictionary where key is a miner IP address and corresponding value is a smart plug IP address.
-		If functions fails to find or parse given file, returns empty dictionary. 
+		read-only mapping where key is a miner IP address and corresponding value is a smart plug IP address,
+		backed by the cached mapping shared by all callers. If functions fails to find or parse given file, returns empty mapping.
 
 	"""
-	ip_addresses = {}
-	if not os.path.isfile(path):
-		logger.error("File storing map to plug IP mapping at %s doesn't exist", path)
-		return ip_addresses
-	logger.debug("Loading miner to smart plug mapping from %s...", path)
-	try:
-		with open(path) as f:
-			lines = f.readlines()
-			for line in lines:
-				split_line = line.strip().split(":") 
-				if len(split_line) != 2:
-					logger.error("Failed to parse line %s", line)
-				else:
-					miner_name = split_line[0].strip()
-					plug_ip_addr = split_line[1].strip()
-					try:
-						socket.inet_aton(plug_ip_addr)
-						ip_addresses[miner_name] = plug_ip_addr
-					except socket.error:
-						logger.error("Incorrect IP address format: %s", plug_ip_addr)
-	except:
-		logger.error("Miner_Plug_Map.txt not found at %s! Exiting...", os.path.dirname(os.path.realpath(__file__)))
-	logger.debug("Loaded miner to smart plug mapping has %d elements", len(ip_addresses))
-	return ip_addresses
+	return types.MappingProxyType(load_plug_map(path).miner_to_plug)
+
+def get_power_cycle_orchestrator(max_inrush=None, window=None):
+	""" Returns PowerCycleOrchestrator shared by all restarts of this process, creating it on first call
+
+	The orchestrator is closed at interpreter exit, so that scheduled power-ons are never lost.
+	Inrush limits apply on creation only (defaults if None), a different limit requested afterwards is logged and ignored.
+	"""
+	global _orchestrator
+	with _orchestrator_lock:
+		if _orchestrator is None:
+			_orchestrator = PowerCycleOrchestrator(DELAY, max_inrush if max_inrush is not None else DEFAULT_MAX_INRUSH,
+				window if window is not None else DEFAULT_INRUSH_WINDOW)
+			atexit.register(close_power_cycle_orchestrator)
+		else:
+			scheduler = _orchestrator.scheduler
+			if (max_inrush is not None and max_inrush != scheduler.max_inrush) or (window is not None and window != scheduler.window):
+				logger.warning("Ignoring inrush limit of %s plugs per %s s, orchestrator already limits %d plugs per %.1f s",
+					str(max_inrush), str(window), scheduler.max_inrush, scheduler.window)
+		return _orchestrator
+
+def close_power_cycle_orchestrator():
+	""" Waits until all restarts in progress are completed and stops the shared orchestrator """
+	global _orchestrator
+	with _orchestrator_lock:
+		orchestrator = _orchestrator
+		_orchestrator = None
+	if orchestrator is not None:
+		orchestrator.close()
 
 def restart_plug(ip_addr, delay):
 	""" Restarts a smart plug: powers it OFF and, then, ON
 
+	Powering ON is scheduled through the shared orchestrator, which limits how many plugs
+	are powered ON at once and ignores restart requests for plugs that are already restarting.
+
 	Args:
 		ip_addr: IP address of the smart plug 
 		delay: the time to wait before powering plug ON after it was powered OFF  
+
+	Returns:
+		True if restart was initiated successfully, otherwise, False
 	"""
-	try:
-		plug = SmartPlug(ip_addr)
-		if plug.state == "ON":
-			plug.turn_off()
-			threading.Timer(delay, plug.turn_on).start()
-		else:
-			threading.Timer(delay, plug.turn_on).start()
+	power_cycle = get_power_cycle_orchestrator().restart(ip_addr, delay)
+	if power_cycle.powered_off.result():
 		logger.info("Restart successful!")
-	except SmartDeviceException:
-		#TODO: add retrying to communicate again after timeout, if after multiple retry attempts it still failes, send email or Telegram
-		logger.error("Failed to communicate with plug at IP address %s!", ip_addr)
+		return True
+	#TODO: add retrying to communicate again after timeout, if after multiple retry attempts it still failes, send email or Telegram
+	return False
 
-def main():
-	#command-line parameters parsing
+def get_miner_plugs(miners, miner_plug_map):
+	""" Maps miners to their smart plugs
+
+	Returns:
+		a dictionary mapping smart plug IP addresses to lists of names of the miners they power
+
+	"""
+	if len(miner_plug_map) == 0:
+		logger.debug("Empty miner to smart plug mapping loaded!")
+	plugs = dict()
+	for miner in miners:
+		if miner.name in miner_plug_map:
+			plug_miners = plugs.setdefault(miner_plug_map[miner.name], list())
+			if miner.name not in plug_miners:
+				plug_miners.append(miner.name)
+		else:
+			logger.error("Plug for %s seems not be installed! Exiting...", miner.name)
+			#TODO: further handling, maybe Telegram or email
+	return plugs
+
+def resolve_miner_plugs(ip_addresses, names, pc_name, awesome_miner_port, miner_plug_map):
+	""" Looks up smart plugs of the given miners
+
+	Args:
+		ip_addresses: IP addresses of the miners
+		names: names of the miners
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		miner_plug_map: dictionary mapping miner names to smart plug IP addresses, see load_miner_plug_map
+
+	Returns:
+		a dictionary mapping smart plug IP addresses to lists of names of the miners they power
+
+	"""
+	miners = list()
+	for ip_addr in ip_addresses:
+		miner = get_shared_device_by_ip(ip_addr, pc_name, awesome_miner_port)
+		if miner is None:
+			logger.error("No miner with IP address %s is registered", ip_addr)
+		else:
+			logger.debug("Retrieved miner %s using IP %s", miner.name, ip_addr)
+			miners.append(miner)
+	for name in names:
+		miner = get_shared_device_by_name(name, pc_name, awesome_miner_port)
+		if miner is None:
+			logger.error("No miner with name %s is registered", name)
+		else:
+			miners.append(miner)
+	return get_miner_plugs(miners, miner_plug_map)
+
+def resolve_federated_miner_plugs(ip_addresses, names, federated_client, miner_plug_map):
+	""" Looks up smart plugs of the given miners registered with any of AwesomeMiner instances
+
+	Args:
+		ip_addresses: IP addresses of the miners
+		names: names of the miners
+		federated_client: a FederatedClient object of all AwesomeMiner instances, or any object with its find_device method
+		miner_plug_map: dictionary mapping miner names to smart plug IP addresses, see load_miner_plug_map
+
+	Returns:
+		a dictionary mapping smart plug IP addresses to lists of names of the miners they power
+
+	"""
+	miners = list()
+	for ip_addr in ip_addresses:
+		owned_miner = federated_client.find_device(host=ip_addr)
+		if owned_miner is None:
+			logger.error("No miner with IP address %s is registered with any AwesomeMiner instance", ip_addr)
+		else:
+			logger.debug("Retrieved miner %s of instance %s using IP %s", owned_miner[1].name, owned_miner[0], ip_addr)
+			miners.append(owned_miner[1])
+	for name in names:
+		owned_miner = federated_client.find_device(name=name)
+		if owned_miner is None:
+			logger.error("No miner with name %s is registered with any AwesomeMiner instance", name)
+		else:
+			logger.debug("Retrieved miner %s of instance %s", name, owned_miner[0])
+			miners.append(owned_miner[1])
+	return get_miner_plugs(miners, miner_plug_map)
+
+def restart_plugs(plugs):
+	""" Restarts the given smart plugs concurrently
+
+	Args:
+		plugs: dictionary mapping smart plug IP addresses to lists of names of the miners they power
+
+	Returns:
+		a dictionary mapping smart plug IP addresses to PowerCycle objects tracking their restarts
+
+	"""
+	for plug_ip, plug_miners in plugs.items():
+		logger.info("Restarting plug with IP %s (%s)...", plug_ip, ", ".join(plug_miners))
+	return get_power_cycle_orchestrator().restart_all(plugs.keys(), DELAY)
+
+def restart_miners(ip_addresses, names, pc_name, awesome_miner_port, miner_plug_map):
+	""" Restarts smart plugs of all given miners concurrently
+
+	Args:
+		ip_addresses: IP addresses of the miners to be restarted
+		names: names of the miners to be restarted
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		miner_plug_map: dictionary mapping miner names to smart plug IP addresses, see load_miner_plug_map
+
+	Returns:
+		a dictionary mapping smart plug IP addresses to PowerCycle objects tracking their restarts,
+		plugs of miners that couldn't be resolved are omitted
+
+	"""
+	return restart_plugs(resolve_miner_plugs(ip_addresses, names, pc_name, awesome_miner_port, miner_plug_map))
+
+def _positive_int(value):
+	number = int(value)
+	if number < 1:
+		raise argparse.ArgumentTypeError("must be at least 1, got " + value)
+	return number
+
+def _positive_float(value):
+	number = float(value)
+	if not number > 0:
+		raise argparse.ArgumentTypeError("must be positive, got " + value)
+	return number
+
+def build_arg_parser():
 	parser = argparse.ArgumentParser(description="If a miner goes offline, checks whether the miner is equipped with a smart plug and restarts the plug, thus, rebooting the miner.")
 	parser.add_argument("-conf", "--config", nargs=1, type=str, required=True, help="""Path to AwesomeMiner .ini configuration file that 
 		consists of AwesomeMiner web API port number and PC name where AwesomeMiner control software is running.""")
-	parser.add_argument("-ip", "--ip_address", nargs=1, type=str, required=True, help="IP address of the machine that has turned off.")
+	parser.add_argument("-ip", "--ip_address", nargs="+", type=str, default=[], help="IP addresses of the machines that have turned off.")
+	parser.add_argument("-instance", "--instance", nargs=1, type=str, help="""Name of AwesomeMiner instance that fired the trigger, if configuration file
+		lists multiple instances. By default, miners are looked up in all instances.""")
+	parser.add_argument("-name", "--miner_name", nargs="+", type=str, default=[], help="Names of the machines that have turned off, can be combined with -ip.")
 	parser.add_argument("-map", "--miner_plug_map", nargs=1, type=str, required=True, help="""Path to file storing mapping of IP addresses from miners to smart plugs.
 		 File format is: <Miner IP> : <Plug IP> \\n""")
-	args = parser.parse_args()
-	logger.debug("Configuration file: %s, IP address: %s", args.config[0], args.ip_address[0])
-	logger.info("Attempting to restart miner at " + args.ip_address[0] + "...")
+	parser.add_argument("-inrush", "--max_inrush", nargs=1, type=_positive_int, default=[None], help="Maximum number of plugs powered ON within -window seconds, "
+		+ str(DEFAULT_MAX_INRUSH) + " by default.")
+	parser.add_argument("-window", "--inrush_window", nargs=1, type=_positive_float, default=[None], help="Time window, in seconds, for -inrush limit, "
+		+ str(DEFAULT_INRUSH_WINDOW) + " by default.")
+	return parser
+
+def main(argv=None):
+	""" Returns True if all plugs of the miners were power cycled, otherwise, False """
+	#command-line parameters parsing
+	parser = build_arg_parser()
+	args = parser.parse_args(argv)
+	if len(args.ip_address) == 0 and len(args.miner_name) == 0:
+		parser.error("at least one of -ip/--ip_address or -name/--miner_name is required")
+	logger.debug("Configuration file: %s, IP addresses: %s, names: %s", args.config[0], str(args.ip_address), str(args.miner_name))
+	logger.info("Attempting to restart miners at " + ", ".join(args.ip_address + args.miner_name) + "...")
 	#load configuration file
-	config_values = load_config_file(args.config[0])
-	if config_values is None:
-		logger.error("Configuration file at %s doesn't exist or has invalid structure! Exiting...", args.config[0])
-		return
-	if config_values["AWESOMEMINER"] is None:
-		logger.error("Configuration file at %s has no \"AWESOMEMINER\" parameter group! Exiting...", args.config[0])
-		return
-	port = config_values["AWESOMEMINER"]["port"]
-	pc_name = config_values["AWESOMEMINER"]["pc_name"]
-	if port is None:
-		logger.error("Configuration file at %s doesn't contain AwesomeMiner port number! Exiting...", args.config[0])
-		return
-	if pc_name is None:
-		logger.error("Configuration file at %s doesn't contain PC name! Exiting...", args.config[0])
-		return
-	miner = get_device_by_ip(args.ip_address[0], pc_name, int(port))
-	logger.debug("Retrieved miner %s using IP %s", miner.name, args.ip_address[0])
-	if miner is not None:
-		miner_plug_map = load_miner_plug_map(args.miner_plug_map[0])
-		if len(miner_plug_map) == 0:
-			logger.debug("Empty miner to smart plug mapping loaded!")
-		if miner.name in miner_plug_map:
-			plug_ip = miner_plug_map[miner.name]
-			logger.info("Restarting plug with IP %s...", plug_ip)
-			restart_plug(plug_ip, DELAY)
+	instances = load_awesome_miner_instances(args.config[0])
+	if instances is not None:
+		instances = select_awesome_miner_instance(instances, args.instance[0] if args.instance else None)
+	if instances is None:
+		return False
+	miner_plug_map = load_miner_plug_map(args.miner_plug_map[0])
+	get_power_cycle_orchestrator(args.max_inrush[0], args.inrush_window[0])
+	try:
+		if len(instances) == 1:
+			instance, pc_name, port = instances[0]
+			power_cycles = restart_miners(args.ip_address, args.miner_name, pc_name, port, miner_plug_map)
 		else:
-			logger.error("Plug for %s seems not be installed! Exiting...", miner.name)
-			#TODO: further handling, maybe Telegram or email
-	else:
-		logger.error("No miner with IP address %s is registered", args[0].ip_address)
+			from federated_client import FederatedClient
+			# miners are resolved with the instance owning them
+			with FederatedClient(instances) as federated_client:
+				plugs = resolve_federated_miner_plugs(args.ip_address, args.miner_name, federated_client, miner_plug_map)
+			power_cycles = restart_plugs(plugs)
+	finally:
+		# scheduled power-ons must happen before the process exits
+		close_power_cycle_orchestrator()
+	num_restarted = len([power_cycle for power_cycle in power_cycles.values() if power_cycle.completed.result()])
+	logger.info("Restarted %d of %d plugs", num_restarted, len(power_cycles))
+	return len(power_cycles) > 0 and num_restarted == len(power_cycles)
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
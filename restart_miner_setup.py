@@ -5,7 +5,7 @@ setup(
 		windows=["restart_miner.py"],
 		options={
 				"py2exe":{
-					"includes":['awesome_miner_structs', 'awesome_miner_utils'],
+					"includes":['awesome_miner_structs', 'awesome_miner_utils', 'power_cycle', 'plug_map', 'federated_client'],
 					"packages":['pyHS100']
 				}
 		}
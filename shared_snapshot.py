@@ -0,0 +1,270 @@
+import json
+import logging
+import mmap
+import os
+import os.path
+import struct
+import tempfile
+import time
+from awesome_miner_structs import Miner
+
+"""
+Fleet snapshot shared on disk by concurrently started processes
+
+When a rack drops, AwesomeMiner starts restart_miner and log_offline once per miner within the same second.
+The first of them downloads /api/miners and writes a pre-indexed snapshot file; the others map the file
+and resolve their miner with a binary search, parsing only that miner's JSON object.
+
+File layout:
+	header | host index | name index | miner JSON records
+Each index is sorted by key and consists of fixed-width entries: NUL-padded key, record offset and length.
+The file is replaced atomically; refreshes are serialized by an exclusive lock on a companion .lock file,
+and whoever waited for the lock re-checks freshness before fetching, so a window sees a single fetch.
+"""
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AMSS"
+VERSION = 1
+"""
+Time, in seconds, during which the shared snapshot is used without contacting AwesomeMiner
+"""
+DEFAULT_SHARED_SNAPSHOT_TTL = 5.0
+"""
+Longer hostnames and miner names are not indexed and always resolved through AwesomeMiner
+"""
+MAX_KEY_SIZE = 64
+# magic, version, fetched_at (UNIX time), number of host index entries, number of name index entries
+HEADER = struct.Struct("<4sIdII")
+# key, record offset, record length
+ENTRY = struct.Struct("<" + str(MAX_KEY_SIZE) + "sQI")
+"""
+Number of attempts to replace the snapshot file, which fails on Windows while a reader has it open
+"""
+REPLACE_ATTEMPTS = 5
+REPLACE_RETRY_DELAY = 0.05
+
+def get_default_path(pc_name, awesome_miner_port):
+	return os.path.join(tempfile.gettempdir(), "awesome_miner_" + str(pc_name) + "_" + str(awesome_miner_port) + ".snapshot")
+
+
+class FileLock(object):
+
+	""" Exclusive lock of a file held across processes
+
+	The lock file also remembers when the holder last failed to refresh the snapshot, so that
+	processes queued behind it don't retry an unreachable AwesomeMiner one after another.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self._file = None
+
+	def __enter__(self):
+		self._file = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), "r+b")
+		if os.name == 'nt':
+			import msvcrt
+			while True:
+				try:
+					# retries for 10 seconds before raising
+					msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+					break
+				except OSError:
+					logger.debug("Still waiting for lock %s", self.path)
+		else:
+			import fcntl
+			fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+		return self
+
+	def __exit__(self, exc_type, exc, traceback):
+		self._file.seek(0)
+		if os.name == 'nt':
+			import msvcrt
+			msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+		else:
+			import fcntl
+			fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+		self._file.close()
+		self._file = None
+
+	def record_failure(self):
+		self._file.seek(0)
+		self._file.truncate()
+		self._file.write(repr(time.time()).encode('ascii'))
+		self._file.flush()
+
+	def failed_recently(self, window):
+		self._file.seek(0)
+		try:
+			failed_at = float(self._file.read() or 0)
+		except ValueError:
+			return False
+		return 0 <= time.time() - failed_at < window
+
+
+def write_shared_snapshot(path, snapshot):
+	""" Atomically writes FleetSnapshot to the file in pre-indexed format """
+	records = list()
+	# id of miner JSON object -> (offset relative to records start, length)
+	positions = dict()
+	records_size = 0
+	for miner_json in snapshot.iter_miner_json():
+		record = json.dumps(miner_json, separators=(',', ':')).encode('utf-8')
+		positions[id(miner_json)] = (records_size, len(record))
+		records.append(record)
+		records_size += len(record)
+	index = snapshot.index
+	host_entries = _get_entries(index.by_host)
+	name_entries = _get_entries(index.by_name)
+	records_start = HEADER.size + ENTRY.size * (len(host_entries) + len(name_entries))
+	tmp_path = path + "." + str(os.getpid()) + ".tmp"
+	with open(tmp_path, "wb") as f:
+		# the snapshot may have been cached in-process for a while before being shared
+		fetched_at = time.time() - (time.monotonic() - snapshot.fetched_at)
+		f.write(HEADER.pack(MAGIC, VERSION, fetched_at, len(host_entries), len(name_entries)))
+		for key, miner_json in host_entries + name_entries:
+			offset, length = positions[id(miner_json)]
+			f.write(ENTRY.pack(key, records_start + offset, length))
+		for record in records:
+			f.write(record)
+	for attempt in range(REPLACE_ATTEMPTS):
+		try:
+			os.replace(tmp_path, path)
+			return True
+		except PermissionError:
+			time.sleep(REPLACE_RETRY_DELAY)
+	logger.error("Failed to replace shared snapshot %s", path)
+	os.remove(tmp_path)
+	return False
+
+def _get_entries(miners_by_key):
+	entries = list()
+	for key, miner_json in miners_by_key.items():
+		encoded_key = str(key).encode('utf-8')
+		if len(encoded_key) <= MAX_KEY_SIZE:
+			# struct pads keys with NUL bytes, which keeps the order of padded keys same as of raw ones
+			entries.append((encoded_key.ljust(MAX_KEY_SIZE, b"\0"), miner_json))
+	entries.sort(key=lambda entry: entry[0])
+	return entries
+
+
+class SharedSnapshot(object):
+
+	""" Read-only memory-mapped view of the shared snapshot file, keep it open only for the lookups """
+
+	def __init__(self, path):
+		with open(path, "rb") as f:
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, self.fetched_at, self._num_hosts, self._num_names = HEADER.unpack_from(self._map, 0)
+		if magic != MAGIC or version != VERSION:
+			self._map.close()
+			raise ValueError(path + " is not a shared snapshot file")
+
+	def close(self):
+		self._map.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, traceback):
+		self.close()
+
+	def is_fresh(self, ttl):
+		return 0 <= time.time() - self.fetched_at < ttl
+
+	def get_by_host(self, host):
+		""" Returns JSON object of the miner with the given hostname, or None """
+		return self._find(HEADER.size, self._num_hosts, host)
+
+	def get_by_name(self, name):
+		""" Returns JSON object of the miner with the given name, or None """
+		return self._find(HEADER.size + ENTRY.size * self._num_hosts, self._num_names, name)
+
+	def _find(self, index_start, num_entries, key):
+		padded_key = str(key).encode('utf-8').ljust(MAX_KEY_SIZE, b"\0")
+		low = 0
+		high = num_entries
+		while low < high:
+			middle = (low + high) // 2
+			entry_key, offset, length = ENTRY.unpack_from(self._map, index_start + ENTRY.size * middle)
+			if entry_key < padded_key:
+				low = middle + 1
+			elif entry_key > padded_key:
+				high = middle
+			else:
+				return json.loads(self._map[offset:offset + length])
+		return None
+
+
+_MISSING = object()
+
+def _get_client(pc_name, awesome_miner_port):
+	# a lookup served from a fresh snapshot file never imports awesome_miner_client and requests
+	from awesome_miner_client import get_default_client
+	return get_default_client(pc_name, awesome_miner_port)
+
+def _lookup_file(path, ttl, host, name):
+	""" Returns miner JSON (or None if not found) from the shared snapshot, or _MISSING if there is no fresh one """
+	try:
+		with SharedSnapshot(path) as shared_snapshot:
+			if not shared_snapshot.is_fresh(ttl):
+				return _MISSING
+			return shared_snapshot.get_by_host(host) if host is not None else shared_snapshot.get_by_name(name)
+	except (OSError, ValueError, struct.error):
+		# missing, being replaced or truncated file
+		return _MISSING
+
+def lookup_device(pc_name, awesome_miner_port, host=None, name=None, path=None, ttl=DEFAULT_SHARED_SNAPSHOT_TTL):
+	""" Looks up miner by its hostname or, if host is None, by its name without logging a miss
+
+	Returns:
+		a Miner object if found, otherwise, None
+
+	"""
+	path = path if path is not None else get_default_path(pc_name, awesome_miner_port)
+	key = host if host is not None else name
+	if len(str(key).encode('utf-8')) <= MAX_KEY_SIZE:
+		miner_json = _lookup_file(path, ttl, host, name)
+		if miner_json is _MISSING:
+			with FileLock(path + ".lock") as lock:
+				# another process may have refreshed the snapshot while this one was waiting for the lock
+				miner_json = _lookup_file(path, ttl, host, name)
+				if miner_json is _MISSING:
+					if lock.failed_recently(ttl):
+						logger.error("AwesomeMiner was unreachable for another process moments ago, not retrying")
+						return None
+					snapshot = _get_client(pc_name, awesome_miner_port).get_fleet_snapshot()
+					if snapshot is None:
+						lock.record_failure()
+						return None
+					write_shared_snapshot(path, snapshot)
+		if miner_json is not _MISSING:
+			return Miner(miner_json) if miner_json is not None else None
+	snapshot = _get_client(pc_name, awesome_miner_port).get_fleet_snapshot()
+	if snapshot is None:
+		return None
+	return snapshot.index.get_by_host(host) if host is not None else snapshot.index.get_by_name(name)
+
+def get_device_by_ip(ip_addr, pc_name, awesome_miner_port, path=None, ttl=DEFAULT_SHARED_SNAPSHOT_TTL):
+	""" Looks up miner by its IP address in the shared snapshot, refreshing it if it's older than ttl
+
+	Returns:
+		a Miner object if executed successfully, otherwise, None
+
+	"""
+	miner = lookup_device(pc_name, awesome_miner_port, ip_addr, None, path, ttl)
+	if miner is None:
+		logger.warning("Failed to find miner with IP address %s", ip_addr)
+	return miner
+
+def get_device_by_name(device_name, pc_name, awesome_miner_port, path=None, ttl=DEFAULT_SHARED_SNAPSHOT_TTL):
+	""" Looks up miner by its name in the shared snapshot, refreshing it if it's older than ttl
+
+	Returns:
+		a Miner object if executed successfully, otherwise, None
+
+	"""
+	miner = lookup_device(pc_name, awesome_miner_port, None, device_name, path, ttl)
+	if miner is None:
+		logger.warning("Failed to find miner with name %s", device_name)
+	return miner
@@ -3,59 +3,194 @@ import json
 import argparse
 import sys
 import logging
-from awesome_miner_utils import collect_devices_from_groups, collect_notifications_data, load_config_file
+import os
+import shutil
+import time
+from awesome_miner_utils import load_awesome_miner_instances, get_fleet_snapshot
+from awesome_miner_async import collect_snapshot_and_notifications
 from awesome_miner_structs import Pangolin, Ferm
+from federated_client import FederatedClient
+from fleet_metrics import FleetMetrics
+from health_rules import load_health_rules
+from notification_cursor import NotificationCursor
+from snapshot_diff import SnapshotDiffer
 
 logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', filename='C:/Users/User/Desktop/Utility_Scripts/logs/show_defective_miners.log',level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 """
 Prints list of malfunctioning GPU minersand corresponding AwesomeMiner notifications in console.
-A miner is consider malfunctioning if one of the following holds:
+A miner is consider malfunctioning if it's offline or it violates one of health rules of its group,
+by default:
 - not all GPUs are running
 - at least one GPU is running on default memory clock
-- miner is offline
+Health rules are read from configuration file, see health_rules.py.
+
+In watch mode, the list is kept on screen and refreshed at a fixed interval.
+"""
+
 """
+in seconds
+"""
+DEFAULT_WATCH_INTERVAL = 10.0
+HEADER = "********** FAULTY GPU MINERS **********"
+
+def get_faults(rules, metrics):
+	""" Evaluates health rules over all miners of FleetMetrics at once
+
+	Returns:
+		dictionary mapping names of malfunctioning miners to lists of lines describing their faults,
+		in the order of miners in metrics
+
+	"""
+	faults = dict()
+	for violation in rules.evaluate(metrics):
+		faults.setdefault(violation.miner_name, list()).append(violation.message)
+	return faults
+
+
+class ConsoleScreen(object):
+
+	""" Keeps lines on console screen, rewriting only the lines that differ from the ones already shown
+
+	Lines are clipped to the console size, so that the screen never scrolls. If there are more lines
+	than rows, the last line, e.g. a status line, stays visible below a line counting the hidden ones.
+	"""
+
+	def __init__(self, stream=sys.stdout):
+		self.stream = stream
+		self.lines = None
+		if os.name == 'nt':
+			# enables ANSI escape sequences in Windows console
+			os.system("")
+
+	def draw(self, lines):
+		columns, rows = shutil.get_terminal_size()
+		# the row below the lines keeps the cursor
+		max_lines = max(2, rows - 1)
+		if len(lines) > max_lines:
+			lines = lines[:max_lines - 2] + ["... " + str(len(lines) - max_lines + 1) + " more lines"] + lines[-1:]
+		lines = [line[:columns - 1] for line in lines]
+		if self.lines is None:
+			self.stream.write("\x1b[2J")
+			self.lines = list()
+		for row, line in enumerate(lines):
+			if row >= len(self.lines) or self.lines[row] != line:
+				self.stream.write("\x1b[" + str(row + 1) + ";1H" + line + "\x1b[K")
+		for row in range(len(lines), len(self.lines)):
+			self.stream.write("\x1b[" + str(row + 1) + ";1H\x1b[K")
+		self.stream.write("\x1b[" + str(len(lines) + 1) + ";1H")
+		self.stream.flush()
+		self.lines = list(lines)
+
+
+def watch(pc_name, port, rules, interval):
+	""" Keeps list of malfunctioning miners on screen, re-evaluating only miners whose data changed since the previous poll """
+	screen = ConsoleScreen()
+	differ = SnapshotDiffer(default_memory_clocks=rules.get_group_values("default_memory_clock"))
+	# miner name -> lines describing its faults
+	faults = dict()
+	while True:
+		poll_start = time.monotonic()
+		snapshot = get_fleet_snapshot(pc_name, port)
+		poll_time = time.monotonic() - poll_start
+		if snapshot is None:
+			status = "Failed to connect to AwesomeMiner, retrying in " + str(interval) + " s"
+		else:
+			evaluation_start = time.monotonic()
+			differ.diff(snapshot)
+			for miner_name in differ.disappeared_miners:
+				faults.pop(miner_name, None)
+			changed = [(group, miner_json) for group, miner_json in differ.changed_miners if group in rules.groups]
+			if len(changed) > 0:
+				changed_faults = get_faults(rules, FleetMetrics(changed))
+				for group, miner_json in changed:
+					faults[miner_json['name']] = changed_faults.get(miner_json['name'], list())
+			evaluation_time = time.monotonic() - evaluation_start
+			status = ("Poll " + "{:.3f}".format(poll_time) + " s, evaluated " + str(len(changed)) + " of " + str(len(faults)) +
+				" miners in " + "{:.3f}".format(evaluation_time) + " s at " + time.strftime('%H:%M:%S'))
+		lines = [HEADER]
+		for group in rules.groups:
+			for miner_json in (snapshot.index.get_group(group) if snapshot is not None else list()):
+				lines.extend(faults.get(miner_json['name'], list()))
+		lines.append(status)
+		screen.draw(lines)
+		time.sleep(max(0.0, interval - (time.monotonic() - poll_start)))
+
+def show_federated(instances, rules, cursor_path=None):
+	""" Prints malfunctioning miners and notifications of all AwesomeMiner instances, each line prefixed with the instance name
+
+	Snapshots and notifications of all instances are collected concurrently. With cursor_path, every instance
+	remembers its notifications in its own file, cursor_path suffixed with the instance name.
+	"""
+	cursors = None
+	if cursor_path is not None:
+		cursors = {instance: NotificationCursor(cursor_path + "." + instance) for instance, pc_name, port in instances}
+	with FederatedClient(instances) as federated_client:
+		fleet = federated_client.get_fleet(cursors)
+	for instance in fleet.unreachable:
+		print("[" + instance + "] Failed to connect to AwesomeMiner")
+	faults = list()
+	for instance, snapshot in fleet.snapshots.items():
+		for lines in get_faults(rules, snapshot.get_metrics(rules.groups)).values():
+			faults.extend(["[" + instance + "] " + line for line in lines])
+	if len(faults) > 0:
+		print(HEADER)
+	for line in faults:
+		print(line)
+	notifications = fleet.get_notifications_with_prefix(Pangolin.GROUP) + fleet.get_notifications_with_prefix(Ferm.GROUP)
+	if len(notifications) > 0:
+		print("********** NOTIFICATIONS **********")
+	for instance, notification in notifications:
+		print("[" + instance + "] " + notification.miner_name + ": " + notification.message)
+	print("**********               **********")
 
 def main():
 	#command-line parameters parsing
 	parser = argparse.ArgumentParser(description="Displays information about failed/malfunctioning GPU miners and shows respective notifications")
 	parser.add_argument("-conf", "--config", nargs=1, type=str, required=True, help="""Path to AwesomeMiner .ini configuration file that 
-		consists of AwesomeMiner web API port number and PC name where AwesomeMiner control software is running.""")
+		consists of AwesomeMiner web API port number and PC name where AwesomeMiner control software is running,
+		and optionally health rules of miner groups (see health_rules.py).""")
+	parser.add_argument("-cursor", "--notification_cursor", nargs=1, type=str, help="""Path to file remembering notifications shown by previous runs.
+		If given, only notifications that appeared since the previous run are shown.""")
+	parser.add_argument("-watch", "--watch", action="store_true", help="Keep the list on screen and refresh it periodically until interrupted.")
+	parser.add_argument("-interval", "--interval", nargs=1, type=float, default=[DEFAULT_WATCH_INTERVAL], help="Time between refreshes in watch mode, in seconds.")
 	args = parser.parse_args()
 	logger.debug("Configuration file: %s", args.config[0])
 	# load configuration file
-	config_values = load_config_file(args.config[0])
-	if config_values is None:
-		logger.error("Configuration file at %s doesn't exist or has invalid structure! Exiting...", args.config[0])
+	instances = load_awesome_miner_instances(args.config[0])
+	if instances is None:
 		return
-	if config_values["AWESOMEMINER"] is None:
-		logger.error("Configuration file at %s has no \"AWESOMEMINER\" parameter group! Exiting...", args.config[0])
+	rules = load_health_rules(args.config[0])
+	if len(instances) > 1:
+		if args.watch:
+			logger.error("Watch mode supports a single AwesomeMiner instance! Exiting...")
+			return
+		show_federated(instances, rules, args.notification_cursor[0] if args.notification_cursor else None)
 		return
-	port = config_values["AWESOMEMINER"]["port"]
-	pc_name = config_values["AWESOMEMINER"]["pc_name"]
-	if port is None:
-		logger.error("Configuration file at %s doesn't contain AwesomeMiner port number! Exiting...", args.config[0])
+	instance, pc_name, port = instances[0]
+	if args.watch:
+		try:
+			watch(pc_name, port, rules, args.interval[0])
+		except KeyboardInterrupt:
+			pass
 		return
-	if pc_name is None:
-		logger.error("Configuration file at %s doesn't contain PC name! Exiting...", args.config[0])
+	# collect fleet snapshot and notifications concurrently
+	cursor = NotificationCursor(args.notification_cursor[0]) if args.notification_cursor else None
+	snapshot, notification_list = collect_snapshot_and_notifications(pc_name, port, cursor)
+	if snapshot is None:
 		return
-	# collect information about Pangolins
-	gpu_miners = collect_devices_from_groups(pc_name, int(port), [Pangolin.GROUP, Ferm.GROUP])
-	if len(gpu_miners):
-		print("********** FAULTY GPU MINERS **********")
-	for gpu_miner in gpu_miners:
-		if gpu_miner.is_running():
-			if not gpu_miner.all_devices_running():
-				print(gpu_miner.name + " has only " + str(gpu_miner.device_list.get_num_devices()) + " GPUs running")
-			reset_gpus = gpu_miner.get_reset_gpus()
-			if len(reset_gpus) > 0:
-				gpu_names = list(map(lambda x: x.name, reset_gpus))
-				print(gpu_miner.name + " has " + (",".join(gpu_names) if len(gpu_names) > 1 else gpu_names[0]) + " running on default memory clock")
-		else:
-			print(gpu_miner.name + " - " + gpu_miner.status_info.status_display)
-	# collect notifications information
-	notification_list = collect_notifications_data(pc_name, int(port))
+	# all rules are evaluated at once, vectorized over every GPU of configured groups
+	metrics = snapshot.get_metrics(rules.groups)
+	faults = get_faults(rules, metrics)
+	if metrics.num_miners:
+		print(HEADER)
+	for lines in faults.values():
+		for line in lines:
+			print(line)
+	if notification_list is None:
+		return
+	# notifications information
 	pang_notifications = notification_list.get_notifications_with_prefix(Pangolin.GROUP)
 	ferm_notifications = notification_list.get_notifications_with_prefix(Ferm.GROUP)
 	if len(pang_notifications) > 0 or len(ferm_notifications) > 0:
@@ -0,0 +1,181 @@
+import hashlib
+import json
+from enum import Enum
+from awesome_miner_structs import Pangolin, Ferm
+
+"""
+Differ of consecutive fleet snapshots emitting only state transitions
+
+Keeps a compact digest of the previous snapshot: a fingerprint of each miner's and each device's
+raw JSON object together with the few fields the change rules look at. Miners and devices whose
+fingerprint didn't change are skipped without looking at their fields, and an unchanged response
+body is detected from the snapshot's body hash without looking at miners at all.
+"""
+
+"""
+in bytes
+"""
+FINGERPRINT_SIZE = 8
+"""
+Hashrate drop, as a fraction of the previous hashrate, reported as HASHRATE_DROPPED
+"""
+DEFAULT_HASHRATE_DROP = 0.2
+"""
+Memory clock, in MHz, a GPU falls back to after a reset, per AwesomeMiner group
+"""
+DEFAULT_MEMORY_CLOCKS = {
+	Pangolin.GROUP: Pangolin.DEFAULT_MEMORY_CLOCK,
+	Ferm.GROUP: Ferm.DEFAULT_MEMORY_CLOCK,
+}
+
+class ChangeType(Enum):
+	MINER_APPEARED = 0
+	MINER_DISAPPEARED = 1
+	STATUS_CHANGED = 2
+	POOL_CHANGED = 3
+	HASHRATE_DROPPED = 4
+	DEVICE_APPEARED = 5
+	DEVICE_DISAPPEARED = 6
+	MEMORY_CLOCK_RESET = 7
+
+class ChangeEvent(object):
+
+	""" Single state transition of a miner, or of a device if device_name is set """
+
+	__slots__ = ('change_type', 'group', 'miner_name', 'device_name', 'old_value', 'new_value')
+
+	def __init__(self, change_type, group, miner_name, device_name=None, old_value=None, new_value=None):
+		self.change_type = change_type
+		self.group = group
+		self.miner_name = miner_name
+		self.device_name = device_name
+		self.old_value = old_value
+		self.new_value = new_value
+
+	def __repr__(self):
+		subject = self.miner_name if self.device_name is None else self.miner_name + " " + self.device_name
+		return self.change_type.name + " " + subject + ": " + str(self.old_value) + " -> " + str(self.new_value)
+
+
+def get_fingerprint(fragment_json):
+	""" Computes compact fingerprint of a raw JSON fragment of AwesomeMiner web API response
+
+	Keys are hashed in the order AwesomeMiner serializes them, which is stable between responses.
+	"""
+	return hashlib.blake2b(json.dumps(fragment_json, separators=(',', ':')).encode('utf-8'), digest_size=FINGERPRINT_SIZE).digest()
+
+
+class MinerDigest(object):
+
+	""" Fields of a miner compared between snapshots """
+
+	__slots__ = ('fingerprint', 'group', 'status', 'pool', 'hashrate', 'devices')
+
+	def __init__(self, group, miner_json, fingerprint):
+		self.fingerprint = fingerprint
+		self.group = group
+		self.status = miner_json['statusInfo']['statusDisplay']
+		self.pool = miner_json['pool']
+		self.hashrate = miner_json['speedInfo']['hashrateValue']
+		# device name -> DeviceDigest
+		self.devices = dict()
+		for device_json in (miner_json.get('gpuList') or list()) + (miner_json.get('asicList') or list()):
+			self.devices[device_json['name']] = DeviceDigest(device_json)
+
+
+class DeviceDigest(object):
+
+	""" Fields of a device compared between snapshots """
+
+	__slots__ = ('fingerprint', 'memory_clock', 'hashrate')
+
+	def __init__(self, device_json):
+		self.fingerprint = get_fingerprint(device_json)
+		self.memory_clock = device_json['deviceInfo']['gpuMemoryClock']
+		self.hashrate = device_json['speedInfo']['hashrateValue']
+
+
+class SnapshotDiffer(object):
+
+	""" Compares each given fleet snapshot with the previous one
+
+	Miners are matched by name and devices by name within their miner. The first snapshot only
+	establishes the baseline and produces no events.
+
+	Attributes:
+		changed_miners: list of (group, miner JSON) tuples of miners whose raw JSON changed in the last
+			diffed snapshot, including appeared miners and, for the first snapshot, all miners
+		disappeared_miners: names of miners missing from the last diffed snapshot
+	"""
+
+	def __init__(self, hashrate_drop=DEFAULT_HASHRATE_DROP, default_memory_clocks=DEFAULT_MEMORY_CLOCKS):
+		self.hashrate_drop = hashrate_drop
+		self.default_memory_clocks = default_memory_clocks
+		# miner name -> MinerDigest of the previous snapshot
+		self._miners = None
+		self._body_hash = None
+		self.changed_miners = list()
+		self.disappeared_miners = list()
+
+	def diff(self, snapshot):
+		""" Returns list of ChangeEvent objects describing transitions since the previous snapshot """
+		self.changed_miners = list()
+		self.disappeared_miners = list()
+		if self._miners is not None and snapshot.body_hash is not None and snapshot.body_hash == self._body_hash:
+			return list()
+		events = list()
+		miners = dict()
+		for group, group_miners in snapshot.index.by_group.items():
+			for miner_json in group_miners:
+				miner_name = miner_json['name']
+				fingerprint = get_fingerprint(miner_json)
+				previous = self._miners.get(miner_name) if self._miners is not None else None
+				if previous is not None and previous.fingerprint == fingerprint:
+					miners[miner_name] = previous
+					continue
+				current = MinerDigest(group, miner_json, fingerprint)
+				miners[miner_name] = current
+				self.changed_miners.append((group, miner_json))
+				if self._miners is None:
+					continue
+				if previous is None:
+					events.append(ChangeEvent(ChangeType.MINER_APPEARED, group, miner_name, new_value=current.status))
+				else:
+					self._diff_miner(miner_name, previous, current, events)
+		if self._miners is not None:
+			for miner_name, previous in self._miners.items():
+				if miner_name not in miners:
+					self.disappeared_miners.append(miner_name)
+					events.append(ChangeEvent(ChangeType.MINER_DISAPPEARED, previous.group, miner_name, old_value=previous.status))
+		self._miners = miners
+		self._body_hash = snapshot.body_hash
+		return events
+
+	def _diff_miner(self, miner_name, previous, current, events):
+		group = current.group
+		if previous.status != current.status:
+			events.append(ChangeEvent(ChangeType.STATUS_CHANGED, group, miner_name, old_value=previous.status, new_value=current.status))
+		if previous.pool != current.pool:
+			events.append(ChangeEvent(ChangeType.POOL_CHANGED, group, miner_name, old_value=previous.pool, new_value=current.pool))
+		if self._is_hashrate_drop(previous.hashrate, current.hashrate):
+			events.append(ChangeEvent(ChangeType.HASHRATE_DROPPED, group, miner_name, old_value=previous.hashrate, new_value=current.hashrate))
+		default_memory_clock = self.default_memory_clocks.get(group)
+		for device_name, device in current.devices.items():
+			previous_device = previous.devices.get(device_name)
+			if previous_device is None:
+				events.append(ChangeEvent(ChangeType.DEVICE_APPEARED, group, miner_name, device_name))
+				continue
+			if previous_device.fingerprint == device.fingerprint:
+				continue
+			if default_memory_clock is not None and device.memory_clock == default_memory_clock and previous_device.memory_clock != default_memory_clock:
+				events.append(ChangeEvent(ChangeType.MEMORY_CLOCK_RESET, group, miner_name, device_name, previous_device.memory_clock, device.memory_clock))
+			if self._is_hashrate_drop(previous_device.hashrate, device.hashrate):
+				events.append(ChangeEvent(ChangeType.HASHRATE_DROPPED, group, miner_name, device_name, previous_device.hashrate, device.hashrate))
+		for device_name in previous.devices:
+			if device_name not in current.devices:
+				events.append(ChangeEvent(ChangeType.DEVICE_DISAPPEARED, group, miner_name, device_name))
+
+	def _is_hashrate_drop(self, previous_hashrate, hashrate):
+		if not previous_hashrate or hashrate is None:
+			return False
+		return hashrate < previous_hashrate * (1.0 - self.hashrate_drop)
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os.path
+import subprocess
+import sys
+import time
+
+"""
+Stand-alone benchmark of cold-start time of the command-line entry points started by AwesomeMiner triggers
+
+Every entry point is imported in a fresh interpreter under -X importtime, several times, after a warm-up
+run that compiles bytecode. Reports median wall time of the process, median time spent importing
+the entry point and the slowest modules it imports, then checks the results against regression budgets:
+- import time of the entry point must stay within its budget, scaled with -scale on slower machines
+- modules that the entry point's code path doesn't need must not be imported at all
+
+Exits with status 1 if any budget is exceeded, so it can gate any build.
+"""
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+"""
+Entry points configure logging to a Windows path on import, configuring it beforehand turns that into a no-op
+"""
+PRELUDE = "import logging; logging.basicConfig(level=logging.WARNING); "
+DEFAULT_REPEAT = 10
+DEFAULT_TOP = 5
+"""
+Entry point -> (import time budget in milliseconds, modules that must not be imported)
+"""
+BUDGETS = {
+	"log_offline": (40.0, ["requests", "urllib3", "pyHS100", "numpy", "multiprocessing", "http.server"]),
+	"restart_miner": (40.0, ["requests", "urllib3", "pyHS100", "numpy", "multiprocessing", "http.server"]),
+	"ping_plugs": (60.0, ["requests", "urllib3", "numpy", "multiprocessing", "http.server"]),
+	"miner_trigger": (20.0, ["requests", "urllib3", "pyHS100", "numpy", "logging.handlers", "awesome_miner_utils"]),
+}
+
+def parse_importtime(output):
+	""" Parses -X importtime output
+
+	Returns:
+		a list of tuples of module name, nesting level, self time and cumulative time in microseconds,
+		in the order reported, i.e. every module follows the modules it imports
+
+	"""
+	imports = list()
+	for line in output.splitlines():
+		if not line.startswith("import time:") or "|" not in line:
+			continue
+		fields = line[len("import time:"):].split("|")
+		try:
+			self_time = int(fields[0])
+			cumulative_time = int(fields[1])
+		except ValueError:
+			# header line
+			continue
+		name = fields[2].rstrip()
+		stripped_name = name.lstrip()
+		imports.append((stripped_name, (len(name) - len(stripped_name) - 1) // 2, self_time, cumulative_time))
+	return imports
+
+def run_once(module):
+	""" Imports the module in a fresh interpreter, returns wall time in seconds and parsed -X importtime output """
+	start = time.perf_counter()
+	process = subprocess.run([sys.executable, "-X", "importtime", "-c", PRELUDE + "import " + module], cwd=REPO_DIR,
+		stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	wall_time = time.perf_counter() - start
+	if process.returncode != 0:
+		raise RuntimeError("Failed to import " + module + ":\n" + process.stderr)
+	return wall_time, parse_importtime(process.stderr)
+
+def median(values):
+	values = sorted(values)
+	middle = len(values) // 2
+	return values[middle] if len(values) % 2 == 1 else (values[middle - 1] + values[middle]) / 2.0
+
+def measure(module, repeat, top):
+	""" Measures cold start of the entry point, see module docstring """
+	run_once(module)
+	wall_times = list()
+	import_times = list()
+	imports = None
+	for _ in range(repeat):
+		wall_time, imports = run_once(module)
+		wall_times.append(wall_time)
+		import_times.append(sum([cumulative for name, level, self_time, cumulative in imports if name == module and level == 0]))
+	# direct imports of the entry point are the modules nested one level below it, listed after the previous top-level import
+	position = [name for name, level, self_time, cumulative in imports].index(module)
+	start = position
+	while start > 0 and imports[start - 1][1] > 0:
+		start -= 1
+	direct_imports = [(name, cumulative) for name, level, self_time, cumulative in imports[start:position] if level == 1]
+	direct_imports.sort(key=lambda direct_import: direct_import[1], reverse=True)
+	return {
+		"entry_point": module,
+		"runs": repeat,
+		"wall_ms": median(wall_times) * 1000,
+		"import_ms": median(import_times) / 1000.0,
+		"modules": sorted(set([name for name, level, self_time, cumulative in imports])),
+		"slowest_imports": [{"module": name, "ms": cumulative / 1000.0} for name, cumulative in direct_imports[:top]],
+	}
+
+def measure_baseline(repeat):
+	""" Returns median wall time, in milliseconds, of an interpreter running the prelude only """
+	wall_times = list()
+	for _ in range(repeat):
+		start = time.perf_counter()
+		subprocess.run([sys.executable, "-c", PRELUDE], cwd=REPO_DIR, check=True)
+		wall_times.append(time.perf_counter() - start)
+	return median(wall_times) * 1000
+
+def check_budget(result, scale):
+	""" Returns a list of messages describing budget violations of the result """
+	budget, forbidden_modules = BUDGETS[result["entry_point"]]
+	violations = list()
+	if result["import_ms"] > budget * scale:
+		violations.append("{entry_point} imports in {import_ms:.1f} ms, budget is ".format(**result) + "{:.1f} ms".format(budget * scale))
+	for module in forbidden_modules:
+		if module in result["modules"]:
+			violations.append(result["entry_point"] + " imports " + module)
+	return violations
+
+def print_result(result, baseline_ms):
+	print("{entry_point:<16} {wall_ms:>8.1f} {import_ms:>10.1f}".format(**result) + " {:>10.1f}".format(result["wall_ms"] - baseline_ms) + "   " +
+		", ".join(["{module} {ms:.1f}".format(**slowest_import) for slowest_import in result["slowest_imports"]]), flush=True)
+
+def main():
+	#command-line parameters parsing
+	parser = argparse.ArgumentParser(description="Measures cold-start time of command-line entry points and checks it against regression budgets.")
+	parser.add_argument("-entry", "--entry_point", nargs="+", type=str, default=sorted(BUDGETS), choices=sorted(BUDGETS), help="Entry points to measure, all by default.")
+	parser.add_argument("-repeat", "--repeat", nargs=1, type=int, default=[DEFAULT_REPEAT], help="Number of measured runs per entry point.")
+	parser.add_argument("-top", "--top", nargs=1, type=int, default=[DEFAULT_TOP], help="Number of slowest direct imports reported per entry point.")
+	parser.add_argument("-scale", "--scale", nargs=1, type=float, default=[1.0], help="Factor applied to import time budgets, e.g. 2 on a machine twice as slow.")
+	parser.add_argument("-json", "--json", nargs=1, type=str, help="Path to file where results are written as JSON.")
+	args = parser.parse_args()
+	baseline_ms = measure_baseline(args.repeat[0])
+	print("interpreter with logging configured: {:.1f} ms".format(baseline_ms))
+	print("{:<16} {:>8} {:>10} {:>10}   {}".format("entry point", "wall ms", "import ms", "over base", "slowest imports, ms"))
+	results = list()
+	violations = list()
+	for module in args.entry_point:
+		result = measure(module, args.repeat[0], args.top[0])
+		print_result(result, baseline_ms)
+		violations.extend(check_budget(result, args.scale[0]))
+		results.append(result)
+	if args.json:
+		with open(args.json[0], "w") as f:
+			json.dump({"baseline_ms": baseline_ms, "results": results, "violations": violations}, f, indent=2)
+	for violation in violations:
+		print("BUDGET EXCEEDED: " + violation)
+	sys.exit(1 if len(violations) > 0 else 0)
+
+if __name__ == "__main__":
+	main()
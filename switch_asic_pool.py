@@ -1,11 +1,193 @@
+import argparse
 import logging
-import requests
-from awesome_miner_utils import collect_all_devices
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from awesome_miner_structs import DeviceType
+from awesome_miner_client import get_default_client, DEFAULT_POOL_SIZE
+from awesome_miner_utils import load_awesome_miner_address, collect_devices_of_type, get_fleet_snapshot, invalidate_fleet_snapshot
 
-def switch_pool(miner_ids, pool_id):
+logging.basicConfig(format='%(asctime)s %(message)s', datefmt='%d/%m/%Y %I:%M:%S %p', filename='C:/Users/User/Desktop/Utility_Scripts/logs/switch_asic_pool.log',level=logging.INFO)
+logger = logging.getLogger(__name__)
 
+"""
+Switches ASIC miners to another pool in bulk
 
+Switch commands are sent concurrently, at most rate commands per second, then the result is verified
+against a single fresh fleet snapshot and reported per miner.
+"""
 
-def collect_asics(pc_name, awesome_miner_port):
-	devices = collect_all_devices(pc_name, awesome_miner_port)
-	
\ No newline at end of file
+"""
+Maximum number of switch commands sent per second
+"""
+DEFAULT_RATE = 20.0
+"""
+Number of switch commands in flight at the same time, matches connection pool of AwesomeMinerClient
+"""
+DEFAULT_WORKERS = DEFAULT_POOL_SIZE
+"""
+Time, in seconds, given to AwesomeMiner to apply switch commands before the result is verified
+"""
+DEFAULT_VERIFY_DELAY = 5.0
+
+class RateLimiter(object):
+
+	""" Spaces calls of acquire() from any number of threads at least 1 / rate seconds apart """
+
+	def __init__(self, rate):
+		self.interval = 1.0 / rate if rate > 0 else 0.0
+		self._next = time.monotonic()
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		with self._lock:
+			now = time.monotonic()
+			due = max(now, self._next)
+			self._next = due + self.interval
+		if due > now:
+			time.sleep(due - now)
+
+
+class SwitchResult(object):
+
+	""" Outcome of switching single miner
+
+	Attributes:
+		dispatched: True if AwesomeMiner accepted the switch command
+		verified: True if the miner mines on the new pool according to the snapshot taken after the switch,
+			None if the miner wasn't found in the snapshot
+		pool: pool of the miner before the switch and, once verified, according to the snapshot taken after the switch
+
+	"""
+
+	__slots__ = ('miner_id', 'miner_name', 'previous_pool', 'pool', 'dispatched', 'verified')
+
+	def __init__(self, miner):
+		self.miner_id = miner.id
+		self.miner_name = miner.name
+		self.previous_pool = miner.pool
+		self.pool = miner.pool
+		self.dispatched = False
+		self.verified = False
+
+
+def collect_asics(pc_name, awesome_miner_port, names=None, from_pool=None):
+	""" Collects ASIC miners, optionally only the ones with given names or mining on the given pool
+
+	Returns:
+		a list of ASICMiner objects
+
+	"""
+	asics = collect_devices_of_type(pc_name, awesome_miner_port, DeviceType.ASIC)
+	if names is not None:
+		names = set(names)
+		asics = [asic for asic in asics if asic.name in names]
+	if from_pool is not None:
+		asics = [asic for asic in asics if asic.pool == from_pool]
+	return asics
+
+def switch_pool(pc_name, awesome_miner_port, miner_ids, pool_id, rate=DEFAULT_RATE, workers=DEFAULT_WORKERS):
+	""" Sends switch commands for all given miners concurrently, at most rate commands per second
+
+	Returns:
+		a dictionary mapping miner identifiers to True if AwesomeMiner accepted the command, otherwise, False
+
+	"""
+	client = get_default_client(pc_name, awesome_miner_port)
+	rate_limiter = RateLimiter(rate)
+
+	def dispatch(miner_id):
+		rate_limiter.acquire()
+		return client.switch_pool(miner_id, pool_id)
+
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		results = list(executor.map(dispatch, miner_ids))
+	return dict(zip(miner_ids, results))
+
+def switch_asic_pool(pc_name, awesome_miner_port, asics, pool_id, pool_name=None, rate=DEFAULT_RATE, workers=DEFAULT_WORKERS,
+		verify_delay=DEFAULT_VERIFY_DELAY):
+	""" Switches ASIC miners to the pool and verifies the result
+
+	Args:
+		pc_name: name of PC where AwesomeMiner is running on
+		awesome_miner_port: port to which AwesomeMiner API listens
+		asics: list of ASICMiner objects, see collect_asics
+		pool_id: AwesomeMiner identifier of the pool
+		pool_name: pool as reported in Miner.pool once switched; if None, a switch is verified
+			by the pool being different from the one before the switch
+		rate: maximum number of switch commands sent per second
+		workers: number of switch commands in flight at the same time
+		verify_delay: time, in seconds, to wait before verifying the result
+
+	Returns:
+		a list of SwitchResult objects in the order of asics
+
+	"""
+	results = [SwitchResult(asic) for asic in asics]
+	start = time.monotonic()
+	dispatched = switch_pool(pc_name, awesome_miner_port, [result.miner_id for result in results], pool_id, rate, workers)
+	logger.info("Sent %d switch commands in %.3f s", len(results), time.monotonic() - start)
+	for result in results:
+		result.dispatched = dispatched[result.miner_id]
+	if not any([result.dispatched for result in results]):
+		return results
+	time.sleep(verify_delay)
+	# a single fresh snapshot verifies all miners
+	invalidate_fleet_snapshot(pc_name, awesome_miner_port)
+	snapshot = get_fleet_snapshot(pc_name, awesome_miner_port)
+	if snapshot is None:
+		logger.error("Failed to verify pool switch, AwesomeMiner is not reachable")
+		for result in results:
+			result.verified = None
+		return results
+	for result in results:
+		miner = snapshot.index.get_by_name(result.miner_name)
+		if miner is None:
+			result.verified = None
+			continue
+		result.pool = miner.pool
+		result.verified = (miner.pool == pool_name) if pool_name is not None else (miner.pool != result.previous_pool)
+	return results
+
+def print_report(results):
+	for result in results:
+		if not result.dispatched:
+			outcome = "FAILED - command rejected"
+		elif result.verified is None:
+			outcome = "UNVERIFIED - miner not found in snapshot"
+		elif result.verified:
+			outcome = "OK"
+		else:
+			outcome = "FAILED - still on " + str(result.pool)
+		print(result.miner_name + " (" + str(result.miner_id) + "): " + str(result.previous_pool) + " -> " + str(result.pool) + " " + outcome)
+	num_switched = len([result for result in results if result.dispatched and result.verified])
+	print(str(num_switched) + " of " + str(len(results)) + " ASICs switched")
+
+def main():
+	#command-line parameters parsing
+	parser = argparse.ArgumentParser(description="Switches ASIC miners to another pool and reports the result per miner.")
+	parser.add_argument("-conf", "--config", nargs=1, type=str, required=True, help="""Path to AwesomeMiner .ini configuration file that
+		consists of AwesomeMiner web API port number and PC name where AwesomeMiner control software is running.""")
+	parser.add_argument("-pool", "--pool_id", nargs=1, type=int, required=True, help="AwesomeMiner identifier of the pool to switch to.")
+	parser.add_argument("-pool_name", "--pool_name", nargs=1, type=str, help="Pool as reported by AwesomeMiner for miners switched to it, used to verify the switch.")
+	parser.add_argument("-from_pool", "--from_pool", nargs=1, type=str, help="Switch only ASICs currently mining on this pool.")
+	parser.add_argument("-name", "--miner_name", nargs="+", type=str, help="Switch only ASICs with these names.")
+	parser.add_argument("-rate", "--rate", nargs=1, type=float, default=[DEFAULT_RATE], help="Maximum number of switch commands sent per second.")
+	parser.add_argument("-workers", "--workers", nargs=1, type=int, default=[DEFAULT_WORKERS], help="Number of switch commands in flight at the same time.")
+	parser.add_argument("-verify_delay", "--verify_delay", nargs=1, type=float, default=[DEFAULT_VERIFY_DELAY], help="Time to wait before verifying the switch, in seconds.")
+	args = parser.parse_args()
+	address = load_awesome_miner_address(args.config[0])
+	if address is None:
+		return
+	pc_name, port = address
+	asics = collect_asics(pc_name, port, args.miner_name, args.from_pool[0] if args.from_pool else None)
+	if len(asics) == 0:
+		logger.warning("No ASICs to switch")
+		print("No ASICs to switch")
+		return
+	results = switch_asic_pool(pc_name, port, asics, args.pool_id[0], args.pool_name[0] if args.pool_name else None,
+		args.rate[0], args.workers[0], args.verify_delay[0])
+	print_report(results)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,41 @@
+import json
+import pytest
+from awesome_miner_stream import iter_miner_json, JSONStreamError
+from fake_awesome_miner import generate_fleet, generate_notifications
+
+def _body(num_miners=20):
+	group_list = generate_fleet(num_miners, seed=1)
+	return group_list, json.dumps({"notificationList": generate_notifications(group_list, 5), "groupList": group_list}).encode('utf-8')
+
+def _chunks(body, size):
+	return [body[i:i + size] for i in range(0, len(body), size)]
+
+def _expected(group_list, groups=None):
+	return [(group["name"], miner_json) for group in group_list if groups is None or group["name"] in groups for miner_json in group["minerList"]]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1000, 1 << 20])
+def test_chunk_boundaries(chunk_size):
+	group_list, body = _body()
+	assert list(iter_miner_json(_chunks(body, chunk_size))) == _expected(group_list)
+
+def test_escaped_strings_across_chunks():
+	group_list = [{"name": "G", "minerList": [{"name": "a \"quoted\" \\ name ]}", "hostname": "h"}]}]
+	body = json.dumps({"groupList": group_list}).encode('utf-8')
+	assert list(iter_miner_json(_chunks(body, 1))) == _expected(group_list)
+
+def test_groups_filter():
+	group_list, body = _body()
+	groups = [group_list[0]["name"]]
+	assert list(iter_miner_json(_chunks(body, 5), groups)) == _expected(group_list, groups)
+
+def test_group_name_after_miner_list():
+	group_list = [{"minerList": [{"name": "m1"}, {"name": "m2"}], "name": "Late"}, {"minerList": [{"name": "m3"}], "name": "Skipped"}]
+	body = json.dumps({"groupList": group_list}).encode('utf-8')
+	assert list(iter_miner_json(_chunks(body, 4), ["Late"])) == [("Late", {"name": "m1"}), ("Late", {"name": "m2"})]
+
+@pytest.mark.parametrize("cut", [0.001, 0.25, 0.5, 0.9, -1])
+def test_truncated_body(cut):
+	group_list, body = _body()
+	end = int(len(body) * cut) if isinstance(cut, float) else len(body) + cut
+	with pytest.raises(JSONStreamError):
+		list(iter_miner_json(_chunks(body[:end], 100)))
@@ -0,0 +1,54 @@
+import csv
+from offline_event_store import OfflineEventStore, CSV_HEADER
+
+def _write_csv(path, rows):
+	with open(str(path), "w", newline='') as f:
+		writer = csv.writer(f, delimiter=",")
+		writer.writerow(CSV_HEADER)
+		writer.writerows(rows)
+
+def _read_csv(path):
+	with open(str(path), "r", newline='') as f:
+		return list(csv.reader(f, delimiter=","))
+
+def test_repeat_window(tmp_path):
+	with OfflineEventStore(str(tmp_path / "offline.sqlite")) as store:
+		assert store.record_offline("miner1", 60, now=1000) == 1
+		# re-triggered while still offline
+		assert store.record_offline("miner1", 60, now=1030) == 1
+		assert store.record_offline("miner1", 60, now=1100) == 2
+		assert store.get_offline_count("miner1") == 2
+		assert store.get_offline_count("miner2") == 0
+		assert store.get_events("miner1") == [(1000, True), (1030, False), (1100, True)]
+		assert store.get_events("miner1", since=1030) == [(1030, False), (1100, True)]
+
+def test_import_only_if_empty_is_idempotent(tmp_path):
+	csv_path = tmp_path / "offline.csv"
+	_write_csv(csv_path, [["miner1", "3", "1000"], ["miner2", "1", "2000"], ["broken", "x", "1"]])
+	with OfflineEventStore(str(tmp_path / "offline.sqlite")) as store:
+		assert store.is_empty()
+		assert store.import_csv(str(csv_path), only_if_empty=True)
+		assert not store.import_csv(str(csv_path), only_if_empty=True)
+		# unconditional import never overwrites existing counters
+		assert store.import_csv(str(csv_path))
+		assert store.get_offline_count("miner1") == 3
+		assert store.get_offline_count("miner2") == 1
+		assert store.get_offline_count("broken") == 0
+
+def test_export_round_trip(tmp_path):
+	csv_path = tmp_path / "offline.csv"
+	with OfflineEventStore(str(tmp_path / "first.sqlite")) as store:
+		store.record_offline("miner1", 60, now=1000)
+		store.record_offline("miner1", 60, now=2000)
+		store.record_offline("miner2", 60, now=1500)
+		store.export_csv(str(csv_path))
+		# repeated export of the same counters writes the same file
+		exported = _read_csv(csv_path)
+		store.export_csv(str(csv_path))
+		assert _read_csv(csv_path) == exported
+	assert exported == [CSV_HEADER, ["miner1", "2", "2000"], ["miner2", "1", "1500"]]
+	assert list(tmp_path.glob("*.tmp")) == []
+	with OfflineEventStore(str(tmp_path / "second.sqlite")) as store:
+		assert store.import_csv(str(csv_path), only_if_empty=True)
+		store.export_csv(str(tmp_path / "again.csv"))
+	assert _read_csv(tmp_path / "again.csv") == exported
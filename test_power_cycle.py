@@ -0,0 +1,87 @@
+import threading
+import time
+import pytest
+from power_cycle import PowerOnScheduler, PowerCycleOrchestrator
+
+class RecordingPlugs(object):
+
+	""" Plug switches recording the time of every power-on """
+
+	def __init__(self, result=True):
+		self.result = result
+		self.powered_on = list()
+		self.powered_off = list()
+		self._lock = threading.Lock()
+
+	def turn_off(self, ip_addr):
+		with self._lock:
+			self.powered_off.append(ip_addr)
+		return True
+
+	def turn_on(self, ip_addr):
+		with self._lock:
+			self.powered_on.append((ip_addr, time.monotonic()))
+		return self.result
+
+@pytest.mark.parametrize("max_inrush", [0, -1])
+def test_invalid_max_inrush(max_inrush):
+	with pytest.raises(ValueError):
+		PowerOnScheduler(max_inrush=max_inrush, window=1.0)
+
+@pytest.mark.parametrize("window", [0, -1.0])
+def test_invalid_window(window):
+	with pytest.raises(ValueError):
+		PowerOnScheduler(max_inrush=1, window=window)
+
+def test_inrush_limit():
+	plugs = RecordingPlugs()
+	scheduler = PowerOnScheduler(max_inrush=2, window=0.2, turn_on=plugs.turn_on)
+	now = time.monotonic()
+	futures = [scheduler.schedule("10.0.0." + str(i), now) for i in range(6)]
+	assert all(future.result(timeout=5) for future in futures)
+	scheduler.close()
+	times = [powered_at for ip_addr, powered_at in plugs.powered_on]
+	assert len(times) == 6
+	# no more than max_inrush power-ons within any window
+	for i in range(2, len(times)):
+		assert times[i] - times[i - 2] >= 0.2 - 0.01
+
+def test_due_time_order():
+	plugs = RecordingPlugs()
+	scheduler = PowerOnScheduler(max_inrush=10, window=1.0, turn_on=plugs.turn_on)
+	now = time.monotonic()
+	later = scheduler.schedule("later", now + 0.2)
+	sooner = scheduler.schedule("sooner", now + 0.1)
+	assert later.result(timeout=5) and sooner.result(timeout=5)
+	scheduler.close()
+	assert [ip_addr for ip_addr, powered_at in plugs.powered_on] == ["sooner", "later"]
+	assert plugs.powered_on[0][1] >= now + 0.1
+
+def test_close_drains_and_rejects_new_power_ons():
+	plugs = RecordingPlugs()
+	scheduler = PowerOnScheduler(max_inrush=1, window=0.05, turn_on=plugs.turn_on)
+	futures = [scheduler.schedule(str(i), time.monotonic()) for i in range(3)]
+	scheduler.close()
+	assert all(future.done() for future in futures)
+	with pytest.raises(RuntimeError):
+		scheduler.schedule("late", time.monotonic())
+
+def test_failing_turn_on_resolves_with_false():
+	def turn_on(ip_addr):
+		raise OSError("unreachable")
+	scheduler = PowerOnScheduler(max_inrush=1, window=1.0, turn_on=turn_on)
+	future = scheduler.schedule("10.0.0.1", time.monotonic())
+	assert future.result(timeout=5) is False
+	scheduler.close()
+
+def test_orchestrator_power_cycle():
+	plugs = RecordingPlugs()
+	orchestrator = PowerCycleOrchestrator(delay=0.05, max_inrush=2, window=0.1, workers=4, turn_off=plugs.turn_off, turn_on=plugs.turn_on)
+	power_cycles = orchestrator.restart_all(["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+	assert all(power_cycle.powered_off.result(timeout=5) for power_cycle in power_cycles.values())
+	# restart of a plug already being restarted joins the one in flight
+	assert orchestrator.restart("10.0.0.1") is power_cycles["10.0.0.1"]
+	assert all(power_cycle.completed.result(timeout=5) for power_cycle in power_cycles.values())
+	orchestrator.close()
+	assert sorted(plugs.powered_off) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+	assert sorted(ip_addr for ip_addr, powered_at in plugs.powered_on) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
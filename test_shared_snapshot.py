@@ -0,0 +1,47 @@
+import time
+import pytest
+from awesome_miner_snapshot import FleetSnapshot
+from fake_awesome_miner import generate_fleet
+from shared_snapshot import SharedSnapshot, write_shared_snapshot, get_device_by_ip, get_device_by_name, MAX_KEY_SIZE
+
+@pytest.fixture
+def snapshot():
+	return FleetSnapshot(generate_fleet(50, seed=3))
+
+@pytest.fixture
+def snapshot_path(tmp_path, snapshot):
+	path = str(tmp_path / "snapshot.bin")
+	assert write_shared_snapshot(path, snapshot)
+	return path
+
+def test_round_trip(snapshot, snapshot_path):
+	with SharedSnapshot(snapshot_path) as shared_snapshot:
+		assert shared_snapshot.is_fresh(5.0)
+		for miner_json in snapshot.iter_miner_json():
+			assert shared_snapshot.get_by_host(miner_json["hostname"]) == miner_json
+			assert shared_snapshot.get_by_name(miner_json["name"]) == miner_json
+		assert shared_snapshot.get_by_host("192.0.2.1") is None
+		assert shared_snapshot.get_by_name("x" * (MAX_KEY_SIZE + 1)) is None
+
+def test_snapshot_age(tmp_path):
+	snapshot = FleetSnapshot(generate_fleet(5, seed=3))
+	snapshot.fetched_at -= 10
+	path = str(tmp_path / "snapshot.bin")
+	write_shared_snapshot(path, snapshot)
+	with SharedSnapshot(path) as shared_snapshot:
+		assert not shared_snapshot.is_fresh(5.0)
+		assert abs(time.time() - shared_snapshot.fetched_at - 10) < 1
+
+def test_lookup_from_fresh_file(snapshot, snapshot_path):
+	# a fresh file is used without contacting AwesomeMiner, which isn't running at the port
+	miner_json = next(snapshot.iter_miner_json())
+	miner = get_device_by_ip(miner_json["hostname"], "127.0.0.1", 9, path=snapshot_path)
+	assert miner.name == miner_json["name"]
+	assert get_device_by_name(miner_json["name"], "127.0.0.1", 9, path=snapshot_path).host == miner_json["hostname"]
+	assert get_device_by_name("unknown", "127.0.0.1", 9, path=snapshot_path) is None
+
+def test_not_a_snapshot(tmp_path):
+	path = tmp_path / "garbage.bin"
+	path.write_bytes(b"\0" * 64)
+	with pytest.raises(ValueError):
+		SharedSnapshot(str(path))
@@ -1,5 +0,0 @@
-def contains(list, filter):
-	for x in list:
-		if filter(x):
-			return True
-	return False
\ No newline at end of file